@@ -0,0 +1,261 @@
+import logging
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum, Max
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from dashboard.models import DailyStreamStats
+from dashboard.summary import invalidate_summary
+from streaming.models import StreamingSession
+from streaming.timeseries import read_many, relay_series, session_series
+
+logger = logging.getLogger(__name__)
+
+# Sessions are rolled up this long after they end, once their relays have
+# reported their final status.
+ANALYTICS_ROLLUP_DELAY = getattr(settings, "ANALYTICS_ROLLUP_DELAY", 60)
+ANALYTICS_ROLLUP_BATCH = getattr(settings, "ANALYTICS_ROLLUP_BATCH", 200)
+# Days of rollups shown on the analytics page and in the dashboard metrics.
+ANALYTICS_WINDOW_DAYS = getattr(settings, "ANALYTICS_WINDOW_DAYS", 30)
+
+
+def _session_figures(session, relays):
+    """
+    Stream seconds, peak and integrated viewers of an ended session, and the
+    seconds each relay platform was sending, from the session's metric
+    history. SRS counts the publisher and every relay among its clients; they
+    are not viewers, so each bucket's clients less the relays sending in that
+    bucket are.
+    """
+    start = session.session_start.timestamp()
+    end = session.session_end.timestamp()
+    platforms = sorted({relay.platform for relay in relays})
+    series = [session_series(session.session_uuid)] + [
+        relay_series(session.session_uuid, platform) for platform in platforms
+    ]
+    # The finest resolution whose ring still holds the session's start now,
+    # not at the time it ended.
+    step, _ = series[0].resolution_for(start)
+    results = read_many(series, start, end, step=step)
+    clients = results[0]["clients"]
+    # A relay was up (and pulling from SRS) in every bucket it reported
+    # progress in.
+    sending = [[not math.isnan(v) for v in r["bitrate"]] for r in results[1:]]
+    viewers = [
+        max(0, round(v) - 1 - sum(up[i] for up in sending))
+        for i, v in enumerate(clients)
+        if not math.isnan(v)
+    ]
+    relay_seconds = {
+        platform: step * sum(up) for platform, up in zip(platforms, sending)
+    }
+    duration = session.duration or (session.session_end - session.session_start)
+    return {
+        "stream_seconds": int(duration.total_seconds()),
+        "peak_viewers": max(viewers, default=session.viewers_count),
+        "viewer_seconds": int(sum(viewers) * step),
+        "relay_seconds": relay_seconds,
+    }
+
+
+def _add(user_id, day, platform, figures):
+    row, _ = DailyStreamStats.objects.get_or_create(
+        user_id=user_id, day=day, platform=platform
+    )
+    peak = figures.pop("peak_viewers", 0)
+    DailyStreamStats.objects.filter(pk=row.pk).update(
+        peak_viewers=Greatest(F("peak_viewers"), peak),
+        **{field: F(field) + value for field, value in figures.items()},
+    )
+
+
+def rollup_ended_sessions():
+    """
+    Add every session that ended since the last run to its owner's daily
+    rollups and mark it counted. Returns how many sessions were rolled up.
+    """
+    cutoff = timezone.now() - timedelta(seconds=ANALYTICS_ROLLUP_DELAY)
+    users = set()
+    with transaction.atomic():
+        sessions = list(
+            StreamingSession.objects.select_for_update(skip_locked=True, of=("self",))
+            .filter(analytics_rolled_up=False, session_end__lte=cutoff)
+            .select_related("configuration")
+            .prefetch_related("relay_statuses")
+            .order_by("session_end")[:ANALYTICS_ROLLUP_BATCH]
+        )
+        for session in sessions:
+            # A rejected relay was never started: not a relay, not a failure.
+            relays = [
+                relay
+                for relay in session.relay_statuses.all()
+                if relay.status != "rejected"
+            ]
+            try:
+                figures = _session_figures(session, relays)
+            except Exception as e:
+                # Metric history is best effort; still count the session.
+                logger.warning(
+                    "No metric history for session %s: %s", session.session_uuid, e
+                )
+                figures = {
+                    "stream_seconds": int(
+                        (session.session_end - session.session_start).total_seconds()
+                    ),
+                    "peak_viewers": session.viewers_count,
+                    "viewer_seconds": 0,
+                    "relay_seconds": {},
+                }
+            user_id = session.configuration.user_id
+            day = timezone.localdate(session.session_start)
+            relay_seconds = figures.pop("relay_seconds")
+            failures = defaultdict(int)
+            for relay in relays:
+                failures[relay.platform] += relay.status == "error"
+
+            _add(
+                user_id,
+                day,
+                DailyStreamStats.ALL_PLATFORMS,
+                {
+                    **figures,
+                    "sessions": 1,
+                    "relays": len(relays),
+                    "relay_seconds": sum(relay_seconds.values()),
+                    "relay_failures": sum(failures.values()),
+                },
+            )
+            for platform in failures:
+                _add(
+                    user_id,
+                    day,
+                    platform,
+                    {
+                        "sessions": 1,
+                        "stream_seconds": figures["stream_seconds"],
+                        "relays": 1,
+                        "relay_seconds": relay_seconds.get(platform, 0),
+                        "relay_failures": failures[platform],
+                    },
+                )
+            users.add(user_id)
+
+        StreamingSession.objects.filter(pk__in=[s.pk for s in sessions]).update(
+            analytics_rolled_up=True
+        )
+        for user_id in users:
+            invalidate_summary(user_id)
+    return len(sessions)
+
+
+def _totals(rows):
+    totals = rows.aggregate(
+        sessions=Sum("sessions"),
+        stream_seconds=Sum("stream_seconds"),
+        peak_viewers=Max("peak_viewers"),
+        viewer_seconds=Sum("viewer_seconds"),
+        relays=Sum("relays"),
+        relay_seconds=Sum("relay_seconds"),
+        relay_failures=Sum("relay_failures"),
+    )
+    totals = {field: value or 0 for field, value in totals.items()}
+    return _derive(totals)
+
+
+def _derive(figures):
+    """Add the averages and ratios shown on the dashboard to a rollup row."""
+    stream_seconds = figures["stream_seconds"]
+    figures["stream_minutes"] = stream_seconds // 60
+    figures["average_viewers"] = (
+        round(figures["viewer_seconds"] / stream_seconds, 1) if stream_seconds else 0
+    )
+    # Uptime relative to how long the relays' sessions were live.
+    relay_span = stream_seconds * figures["relays"] / max(figures["sessions"], 1)
+    figures["relay_uptime"] = (
+        round(100 * min(figures["relay_seconds"] / relay_span, 1), 1)
+        if relay_span
+        else None
+    )
+    return figures
+
+
+def _window(user):
+    since = timezone.localdate() - timedelta(days=ANALYTICS_WINDOW_DAYS - 1)
+    return DailyStreamStats.objects.filter(user=user, day__gte=since)
+
+
+def dashboard_metrics(user):
+    """Totals of the user's rollups over the last ANALYTICS_WINDOW_DAYS."""
+    return _totals(_window(user).filter(platform=DailyStreamStats.ALL_PLATFORMS))
+
+
+def analytics_report(user):
+    """
+    Daily session totals and per-platform relay figures over the last
+    ANALYTICS_WINDOW_DAYS, read from the rollups only.
+    """
+    rows = list(
+        _window(user)
+        .order_by("-day", "platform")
+        .values(
+            "day",
+            "platform",
+            "sessions",
+            "stream_seconds",
+            "peak_viewers",
+            "viewer_seconds",
+            "relays",
+            "relay_seconds",
+            "relay_failures",
+        )
+    )
+    days, platforms = [], {}
+    for row in rows:
+        if row["platform"] == DailyStreamStats.ALL_PLATFORMS:
+            days.append(_derive(row))
+            continue
+        total = platforms.setdefault(
+            row["platform"],
+            {
+                "platform": row["platform"],
+                "sessions": 0,
+                "stream_seconds": 0,
+                "peak_viewers": 0,
+                "viewer_seconds": 0,
+                "relays": 0,
+                "relay_seconds": 0,
+                "relay_failures": 0,
+            },
+        )
+        for field in (
+            "sessions",
+            "stream_seconds",
+            "relays",
+            "relay_seconds",
+            "relay_failures",
+        ):
+            total[field] += row[field]
+    return {
+        "days": ANALYTICS_WINDOW_DAYS,
+        "daily": days,
+        "platforms": [_derive(total) for _, total in sorted(platforms.items())],
+        "totals": _derive(
+            {
+                field: sum(day[field] for day in days)
+                for field in (
+                    "sessions",
+                    "stream_seconds",
+                    "viewer_seconds",
+                    "relays",
+                    "relay_seconds",
+                    "relay_failures",
+                )
+            }
+            | {"peak_viewers": max((day["peak_viewers"] for day in days), default=0)}
+        ),
+    }
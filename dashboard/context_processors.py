@@ -0,0 +1,28 @@
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.utils.functional import SimpleLazyObject
+
+from dashboard import fragments
+
+
+def _static_release():
+    # Hashed static URLs change with every collectstatic; so must the keys of
+    # fragments that contain them.
+    return getattr(staticfiles_storage, "manifest_hash", "")
+
+
+def fragment_cache(request):
+    """
+    `fragment_timeout`, the static `fragment_release` and the user's
+    `fragment_versions` stamps for keying {% cache %} blocks. The stamps are
+    only fetched by pages that use them.
+    """
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        versions = {}
+    else:
+        versions = SimpleLazyObject(lambda: fragments.versions_for(user.pk))
+    return {
+        "fragment_timeout": fragments.FRAGMENT_CACHE_TIMEOUT,
+        "fragment_release": SimpleLazyObject(_static_release),
+        "fragment_versions": versions,
+    }
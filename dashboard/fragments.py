@@ -0,0 +1,56 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# How long a rendered fragment is kept; its key changes as soon as anything it
+# shows is saved, so this only bounds memory use.
+FRAGMENT_CACHE_TIMEOUT = getattr(settings, "FRAGMENT_CACHE_TIMEOUT", 3600)
+
+# Model -> fragment namespace whose per-user version stamp its saves bump.
+_registry = {}
+
+
+def register(model, namespace):
+    """
+    Version the `namespace` fragments of a user by `model`'s rows: saving or
+    deleting one bumps the owner's stamp, so every fragment keyed on it (see
+    fragment_versions) renders afresh. The model needs a `user` foreign key
+    and an `updated_at` field.
+    """
+    _registry[model] = namespace
+
+
+def registered():
+    return dict(_registry)
+
+
+def _version_key(namespace, user_id):
+    return f"fragments:{namespace}:{user_id}"
+
+
+def bump_version(model, instance, deleted=False):
+    namespace = _registry.get(model)
+    if namespace is None:
+        return
+    # A save stamps the row's own updated_at; a delete has none left to use.
+    stamp = time.time() if deleted else instance.updated_at.timestamp()
+    key = _version_key(namespace, instance.user_id)
+    # Never step back: two saves within a clock tick must still differ.
+    version = max(stamp, (cache.get(key) or 0) + 1e-6)
+    transaction.on_commit(lambda: cache.set(key, version, None))
+
+
+def versions_for(user_id):
+    """
+    The current stamp of every namespace for one user, in one cache round
+    trip. A stamp evicted from the cache restarts at the current time, so a
+    fragment rendered before the eviction is never served again.
+    """
+    keys = {_version_key(ns, user_id): ns for ns in set(_registry.values())}
+    found = cache.get_many(keys)
+    missing = {key: time.time() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+    return {ns: f"{found.get(key, missing.get(key)):.6f}" for key, ns in keys.items()}
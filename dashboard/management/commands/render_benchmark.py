@@ -0,0 +1,86 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+from dashboard import fragments
+
+PAGES = (
+    "dashboard:index",
+    "dashboard:drafts",
+    "dashboard:past_streams",
+    "dashboard:analytics",
+    "streaming:manage_channels",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure server-side render times of the dashboard pages for one "
+        "account, with template fragment caching off and then warm. Run it "
+        "against a populated account for representative numbers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument(
+            "--page",
+            action="append",
+            help=f"URL name to render (default: {', '.join(PAGES)}).",
+        )
+
+    def _render(self, user, name):
+        path = reverse(name)
+        request = RequestFactory().get(path)
+        request.user = user
+        response = resolve(path).func(request)
+        if response.status_code != 200:
+            raise CommandError(f"{name} answered {response.status_code}")
+        return response
+
+    def _time(self, user, name, iterations):
+        self._render(user, name)
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            self._render(user, name)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return statistics.median(timings), timings[int(len(timings) * 0.9)]
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.filter(username=options["username"]).first()
+        if user is None:
+            raise CommandError("No such user")
+        iterations = max(1, options["iterations"])
+
+        timeout = fragments.FRAGMENT_CACHE_TIMEOUT
+        results = {}
+        try:
+            for label, value in (("uncached", 0), ("cached", timeout)):
+                fragments.FRAGMENT_CACHE_TIMEOUT = value
+                for name in options["page"] or PAGES:
+                    results.setdefault(name, {})[label] = self._time(
+                        user, name, iterations
+                    )
+        finally:
+            fragments.FRAGMENT_CACHE_TIMEOUT = timeout
+
+        self.stdout.write(
+            f"{'page':<28} {'uncached p50':>12} {'p90':>8} "
+            f"{'cached p50':>12} {'p90':>8} {'speedup':>8}"
+        )
+        for name, timing in results.items():
+            (before, before_p90), (after, after_p90) = (
+                timing["uncached"],
+                timing["cached"],
+            )
+            self.stdout.write(
+                f"{name:<28} {before:>12.2f} {before_p90:>8.2f} "
+                f"{after:>12.2f} {after_p90:>8.2f} {before / after:>7.1f}x"
+            )
+        self.stdout.write(f"Milliseconds over {iterations} renders per page.")
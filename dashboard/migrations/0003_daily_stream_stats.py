@@ -0,0 +1,55 @@
+# Generated by Django 5.1.2 on 2026-10-19 18:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dashboard", "0002_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyStreamStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("platform", models.CharField(default="all", max_length=100)),
+                ("sessions", models.PositiveIntegerField(default=0)),
+                ("stream_seconds", models.PositiveBigIntegerField(default=0)),
+                ("peak_viewers", models.PositiveIntegerField(default=0)),
+                ("viewer_seconds", models.PositiveBigIntegerField(default=0)),
+                ("relays", models.PositiveIntegerField(default=0)),
+                ("relay_seconds", models.PositiveBigIntegerField(default=0)),
+                ("relay_failures", models.PositiveIntegerField(default=0)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_stream_stats",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "day", "platform"),
+                        name="unique_daily_stream_stats",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -28,3 +28,41 @@ class DashboardSettings(models.Model):
 
     def __str__(self):
         return f"{self.user.username}'s Dashboard Settings"
+
+
+class DailyStreamStats(models.Model):
+    """
+    Per-user, per-day rollup of ended sessions, filled incrementally by
+    dashboard.analytics.rollup_ended_sessions. The row with platform "all"
+    holds session totals; one row per destination platform holds that
+    platform's relay figures. Sessions count towards the day they started.
+    """
+
+    ALL_PLATFORMS = "all"
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="daily_stream_stats",
+    )
+    day = models.DateField()
+    platform = models.CharField(max_length=100, default=ALL_PLATFORMS)
+    sessions = models.PositiveIntegerField(default=0)
+    stream_seconds = models.PositiveBigIntegerField(default=0)
+    peak_viewers = models.PositiveIntegerField(default=0)
+    # Viewers integrated over time; divided by stream_seconds for the average.
+    viewer_seconds = models.PositiveBigIntegerField(default=0)
+    relays = models.PositiveIntegerField(default=0)
+    relay_seconds = models.PositiveBigIntegerField(default=0)
+    relay_failures = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "day", "platform"],
+                name="unique_daily_stream_stats",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} {self.day} {self.platform}"
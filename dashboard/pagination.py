@@ -0,0 +1,27 @@
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def keyset_page(queryset, field, cursor=None, size=50):
+    """
+    One page of `queryset`, newest `field` first, starting after `cursor` (as
+    returned for the previous page). Ties on `field` are broken by id, so an
+    index on (..., -field, -id) serves every page without an OFFSET scan.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    Raises ValueError for a cursor this function did not produce.
+    """
+    queryset = queryset.order_by(f"-{field}", "-id")
+    if cursor:
+        value, _, last_id = cursor.rpartition("_")
+        value = parse_datetime(value)
+        if value is None or not last_id.isdigit():
+            raise ValueError(f"Invalid cursor: {cursor!r}")
+        queryset = queryset.filter(
+            Q(**{f"{field}__lt": value}) | Q(**{field: value, "id__lt": int(last_id)})
+        )
+    rows = list(queryset[: size + 1])
+    if len(rows) <= size:
+        return rows, None
+    rows = rows[:size]
+    last = rows[-1]
+    return rows, f"{getattr(last, field).isoformat()}_{last.id}"
@@ -0,0 +1,32 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from dashboard import fragments
+from dashboard.models import DashboardSettings
+from dashboard.summary import invalidate_summary
+from streaming.models import (
+    StreamingConfiguration,
+    StreamingPlatformAccount,
+    StreamingSession,
+)
+
+fragments.register(DashboardSettings, "settings")
+fragments.register(StreamingConfiguration, "configs")
+fragments.register(StreamingPlatformAccount, "destinations")
+
+
+@receiver(post_save, sender=DashboardSettings)
+@receiver(post_delete, sender=DashboardSettings)
+@receiver(post_save, sender=StreamingConfiguration)
+@receiver(post_delete, sender=StreamingConfiguration)
+@receiver(post_save, sender=StreamingPlatformAccount)
+@receiver(post_delete, sender=StreamingPlatformAccount)
+def invalidate_owner_caches(sender, instance, signal, **kwargs):
+    invalidate_summary(instance.user_id)
+    fragments.bump_version(sender, instance, deleted=signal is post_delete)
+
+
+@receiver(post_save, sender=StreamingSession)
+@receiver(post_delete, sender=StreamingSession)
+def invalidate_session_owner_summary(sender, instance, **kwargs):
+    invalidate_summary(instance.user_id)
@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from dashboard.models import DashboardSettings
+from streaming.models import (
+    StreamingConfiguration,
+    StreamingPlatformAccount,
+    StreamingSession,
+)
+
+# Sessions kept in the summary for the dashboard's recent activity.
+DASHBOARD_RECENT_SESSIONS = getattr(settings, "DASHBOARD_RECENT_SESSIONS", 10)
+# The signal receivers invalidate the summary; this only bounds how long a
+# write that bypasses them (QuerySet.update) can leave it stale.
+DASHBOARD_SUMMARY_TTL = getattr(settings, "DASHBOARD_SUMMARY_TTL", 300)
+
+
+def summary_key(user_id):
+    return f"dashboard:summary:{user_id}"
+
+
+def _build_summary(user):
+    from dashboard.analytics import dashboard_metrics
+
+    dashboard_settings, _ = DashboardSettings.objects.get_or_create(user=user)
+    configs = StreamingConfiguration.objects.filter(user=user)
+    active_config = configs.filter(is_active=True).first()
+    return {
+        "dashboard_settings": dashboard_settings,
+        "config_count": configs.count(),
+        "draft_count": configs.filter(is_active=False).count(),
+        "active_config": active_config,
+        "active_destinations": StreamingPlatformAccount.objects.filter(
+            user=user, is_active=True
+        ).count(),
+        "recent_sessions": list(
+            StreamingSession.objects.filter(user=user)
+            .select_related("configuration")
+            .order_by("-session_start")[:DASHBOARD_RECENT_SESSIONS]
+        ),
+        "metrics": dashboard_metrics(user),
+    }
+
+
+def get_summary(user):
+    """
+    The user's dashboard settings, configuration counts, active configuration,
+    active destination count, most recent sessions and analytics totals, from
+    the cache when there.
+    """
+    key = summary_key(user.pk)
+    summary = cache.get(key)
+    if summary is None:
+        summary = _build_summary(user)
+        cache.set(key, summary, DASHBOARD_SUMMARY_TTL)
+    return summary
+
+
+def invalidate_summary(user_id):
+    """
+    Drop the user's summary once the current transaction commits, so a render
+    racing the write cannot cache what it is replacing.
+    """
+    transaction.on_commit(lambda: cache.delete(summary_key(user_id)))
@@ -0,0 +1,22 @@
+import logging
+
+from celery import shared_task
+
+from .analytics import ANALYTICS_ROLLUP_BATCH, rollup_ended_sessions
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(ignore_result=True)
+def rollup_stream_analytics():
+    """
+    Periodic task (Celery beat) that folds newly ended sessions into the
+    daily analytics rollups, a batch at a time until none are left.
+    """
+    rolled_up = batch = rollup_ended_sessions()
+    while batch == ANALYTICS_ROLLUP_BATCH:
+        batch = rollup_ended_sessions()
+        rolled_up += batch
+    if rolled_up:
+        logger.info("Rolled up %d ended sessions", rolled_up)
+    return rolled_up
@@ -1,3 +1,127 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from dashboard.pagination import keyset_page
+from dashboard.summary import summary_key
+from streaming.models import StreamingConfiguration, StreamingSession
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class SummaryInvalidationTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch("streaming.signals.bump_version")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = get_user_model().objects.create_user(
+            username="streamer", email="streamer@example.com", password="pw"
+        )
+        self.configuration = StreamingConfiguration.objects.create(
+            user=self.user, stream_title="Test stream", rtmp_url="rtmp://localhost/live"
+        )
+        self.session = StreamingSession.objects.create(configuration=self.configuration)
+
+    def test_session_save_drops_the_owner_summary_without_a_lookup(self):
+        cache.set(summary_key(self.user.pk), {"cached": True})
+        with self.captureOnCommitCallbacks(execute=True):
+            # Only the UPDATE: the owner is read off the session itself.
+            with self.assertNumQueries(1):
+                self.session.save()
+        self.assertIsNone(cache.get(summary_key(self.user.pk)))
+
+    def test_session_delete_drops_the_owner_summary(self):
+        cache.set(summary_key(self.user.pk), {"cached": True})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.session.delete()
+        self.assertIsNone(cache.get(summary_key(self.user.pk)))
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class KeysetPageTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch("streaming.signals.bump_version")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = get_user_model().objects.create_user(
+            username="streamer", email="streamer@example.com", password="pw"
+        )
+        configuration = StreamingConfiguration.objects.create(
+            user=self.user, stream_title="Test stream", rtmp_url="rtmp://localhost/live"
+        )
+        now = timezone.now()
+        # Two pairs share an end time, so pages must break ties by id.
+        ends = [now, now, now - timedelta(hours=1), now - timedelta(hours=2)] * 2
+        self.sessions = []
+        for end in ends:
+            session = StreamingSession.objects.create(configuration=configuration)
+            # update() rather than end_session(): no end-of-session signals.
+            StreamingSession.objects.filter(pk=session.pk).update(
+                status="ended", session_end=end
+            )
+            self.sessions.append(session.pk)
+        self.expected = list(
+            StreamingSession.objects.order_by("-session_end", "-id").values_list(
+                "pk", flat=True
+            )
+        )
+
+    def _walk(self, size):
+        pages, cursor = [], None
+        while True:
+            rows, cursor = keyset_page(
+                StreamingSession.objects.all(), "session_end", cursor, size
+            )
+            pages.append([row.pk for row in rows])
+            if cursor is None:
+                return pages
+
+    def test_pages_cover_every_row_once_in_order(self):
+        for size in (1, 3, 8):
+            pages = self._walk(size)
+            self.assertEqual([pk for page in pages for pk in page], self.expected)
+            self.assertTrue(all(len(page) == size for page in pages[:-1]))
+
+    def test_last_full_page_has_no_cursor(self):
+        self.assertEqual(self._walk(8), [self.expected])
+
+    def test_foreign_cursors_are_rejected(self):
+        for cursor in ("garbage", "2024-01-01T00:00:00_x", "yesterday_12"):
+            with self.assertRaises(ValueError):
+                keyset_page(StreamingSession.objects.all(), "session_end", cursor)
+
+    def test_past_streams_pages_with_the_cursor(self):
+        other = get_user_model().objects.create_user(
+            username="other", email="other@example.com", password="pw"
+        )
+        other_configuration = StreamingConfiguration.objects.create(
+            user=other, stream_title="Other stream", rtmp_url="rtmp://localhost/live"
+        )
+        foreign = StreamingSession.objects.create(configuration=other_configuration)
+        StreamingSession.objects.filter(pk=foreign.pk).update(
+            status="ended", session_end=timezone.now()
+        )
+
+        self.client.force_login(self.user)
+        url = reverse("dashboard:past_streams")
+        seen, params = [], {}
+        with mock.patch("dashboard.views.DASHBOARD_PAST_STREAMS_LIMIT", 3):
+            while True:
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 200)
+                seen += [s.pk for s in response.context["ended_streams"]]
+                if not response.context["next_cursor"]:
+                    break
+                params = {"before": response.context["next_cursor"]}
+        self.assertEqual(seen, self.expected)
+
+        response = self.client.get(url, {"before": "garbage"})
+        self.assertEqual(response.status_code, 400)
@@ -1,56 +1,47 @@
+from django.conf import settings
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
+from dashboard.analytics import analytics_report
 from dashboard.models import DashboardSettings
+from dashboard.pagination import keyset_page
+from dashboard.summary import get_summary
 from streaming.models import (
     StreamingConfiguration,
-    StreamingPlatformAccount,
     StreamingSession,
 )
 import json
-from django.http import JsonResponse
+from django.http import HttpResponseBadRequest, JsonResponse
 from streaming.srs_utils import get_stream_stats
 
+# Rows listed per dashboard table (or page, for past streams).
+DASHBOARD_CONFIG_LIMIT = getattr(settings, "DASHBOARD_CONFIG_LIMIT", 50)
+DASHBOARD_PAST_STREAMS_LIMIT = getattr(settings, "DASHBOARD_PAST_STREAMS_LIMIT", 50)
+
 
 @login_required
 def dashboard(request):
-    # Fetch or create dashboard settings (if needed)
-    dashboard_settings, _ = DashboardSettings.objects.get_or_create(user=request.user)
-
-    # Retrieve all streaming configurations for the user
-    streaming_configs = StreamingConfiguration.objects.filter(user=request.user)
-
-    # Check for an active configuration
-    active_config = streaming_configs.filter(is_active=True).first()
-
-    # Check if the user has at least one connected social account marked as active.
-    # (Assuming you set is_active=True when both RTMP URL and stream key are provided.)
-    active_social_count = request.user.streaming_platform_accounts.filter(
-        is_active=True
-    ).count()
+    # Settings, counts, the active configuration and recent sessions come from
+    # the cached summary; only the configuration table is queried per render.
+    summary = get_summary(request.user)
+    active_config = summary["active_config"]
 
     # Compute the full RTMP URL if we have an active config and at least one connected social account.
+    # (Assuming you set is_active=True when both RTMP URL and stream key are provided.)
     studio_url = None
-    if active_config and active_social_count:
+    if active_config and summary["active_destinations"]:
         studio_url = active_config.get_full_rtmp_url()  # This calls the method
 
-    # Also retrieve streaming sessions, metrics, etc. for the dashboard
-    streaming_sessions = StreamingSession.objects.filter(
-        configuration__user=request.user
-    ).order_by("-session_start")
-    metrics = {
-        "views": "+24K",
-        "rated_app": "+55K",
-        "downloads": "+1M",
-        "visitors": "+2M",
-    }
-
+    streaming_configs = StreamingConfiguration.objects.filter(
+        user=request.user
+    ).order_by("-is_active", "-updated_at")[:DASHBOARD_CONFIG_LIMIT]
     context = {
-        "dashboard_settings": dashboard_settings,
+        "dashboard_settings": summary["dashboard_settings"],
         "streaming_configs": streaming_configs,
+        "config_count": summary["config_count"],
         "active_config": active_config,
         "studio_url": studio_url,  # Pass the computed RTMP URL
-        "streaming_sessions": streaming_sessions,
-        "metrics": metrics,
+        "streaming_sessions": summary["recent_sessions"],
+        "metrics": summary["metrics"],
         "active_tab": "all",
     }
     return render(request, "dashboard/index.html", context)
@@ -59,20 +50,16 @@ def dashboard(request):
 @login_required
 def dashboard_drafts(request):
     # "Drafts" tab: for example, non-active streaming configurations can be considered drafts.
-    drafts = StreamingConfiguration.objects.filter(user=request.user, is_active=False)
-    dashboard_settings, _ = DashboardSettings.objects.get_or_create(user=request.user)
-
-    metrics = {
-        "views": "+24K",
-        "rated_app": "+55K",
-        "downloads": "+1M",
-        "visitors": "+2M",
-    }
+    summary = get_summary(request.user)
+    drafts = StreamingConfiguration.objects.filter(
+        user=request.user, is_active=False
+    ).order_by("-updated_at")[:DASHBOARD_CONFIG_LIMIT]
 
     context = {
         "drafts": drafts,
-        "dashboard_settings": dashboard_settings,
-        "metrics": metrics,
+        "draft_count": summary["draft_count"],
+        "dashboard_settings": summary["dashboard_settings"],
+        "metrics": summary["metrics"],
         "active_tab": "drafts",
     }
     return render(request, "dashboard/index.html", context)
@@ -83,19 +70,12 @@ def dashboard_scheduled(request):
     # "Scheduled" tab: if you have scheduled streams, fetch them here.
     # For now, we'll use an empty list as a placeholder.
     scheduled = []
-    dashboard_settings, _ = DashboardSettings.objects.get_or_create(user=request.user)
-
-    metrics = {
-        "views": "+24K",
-        "rated_app": "+55K",
-        "downloads": "+1M",
-        "visitors": "+2M",
-    }
+    summary = get_summary(request.user)
 
     context = {
         "scheduled": scheduled,
-        "dashboard_settings": dashboard_settings,
-        "metrics": metrics,
+        "dashboard_settings": summary["dashboard_settings"],
+        "metrics": summary["metrics"],
         "active_tab": "scheduled",
     }
     return render(request, "dashboard/index.html", context)
@@ -103,24 +83,26 @@ def dashboard_scheduled(request):
 
 @login_required
 def past_streams(request):
-    # Example logic for retrieving ended streams
-    ended_streams = StreamingSession.objects.filter(
-        configuration__user=request.user, status="ended"
-    ).order_by("-session_end")
-
-    dashboard_settings, _ = DashboardSettings.objects.get_or_create(user=request.user)
-
-    metrics = {
-        "views": "+24K",
-        "rated_app": "+55K",
-        "downloads": "+1M",
-        "visitors": "+2M",
-    }
+    # Ended streams, a page at a time; ?before= is the previous page's cursor.
+    try:
+        ended_streams, next_cursor = keyset_page(
+            StreamingSession.objects.filter(
+                user=request.user, status="ended"
+            ).select_related("configuration"),
+            "session_end",
+            cursor=request.GET.get("before"),
+            size=DASHBOARD_PAST_STREAMS_LIMIT,
+        )
+    except ValueError:
+        return HttpResponseBadRequest("Invalid page cursor")
+
+    summary = get_summary(request.user)
 
     context = {
         "ended_streams": ended_streams,
-        "dashboard_settings": dashboard_settings,
-        "metrics": metrics,
+        "next_cursor": next_cursor,
+        "dashboard_settings": summary["dashboard_settings"],
+        "metrics": summary["metrics"],
         "active_tab": "past_streams",
     }
     return render(request, "dashboard/past_streams.html", context)
@@ -131,10 +113,9 @@ def dashboard_settings(request):
     """
     Displays or updates user-specific dashboard settings.
     """
-    # Fetch or create the user's DashboardSettings entry
-    dash_settings, _ = DashboardSettings.objects.get_or_create(user=request.user)
-
     if request.method == "POST":
+        # Update a fresh row, not the cached copy; saving it drops the summary.
+        dash_settings, _ = DashboardSettings.objects.get_or_create(user=request.user)
         # For example, update the theme, notifications, etc.
         new_theme = request.POST.get("theme")
         new_notifications = request.POST.get("notifications_enabled") == "on"
@@ -149,6 +130,7 @@ def dashboard_settings(request):
         )
 
     # If GET, just display the existing settings
+    dash_settings = get_summary(request.user)["dashboard_settings"]
     return render(
         request, "dashboard/settings.html", {"dashboard_settings": dash_settings}
     )
@@ -161,7 +143,7 @@ def video_storage(request):
     Example placeholder for 'Video Storage' page.
     You might list user-uploaded or recorded videos stored on your platform.
     """
-    dashboard_settings, _ = DashboardSettings.objects.get_or_create(user=request.user)
+    dashboard_settings = get_summary(request.user)["dashboard_settings"]
 
     context = {
         "dashboard_settings": dashboard_settings,
@@ -173,13 +155,13 @@ def video_storage(request):
 @login_required
 def analytics(request):
     """
-    Example 'Analytics' page. Replace with real logic if you track viewer metrics, etc.
+    Analytics page: daily and per-platform figures, read from the rollups
+    kept by dashboard.analytics, never from the raw session history.
     """
-    dashboard_settings, _ = DashboardSettings.objects.get_or_create(user=request.user)
+    dashboard_settings = get_summary(request.user)["dashboard_settings"]
 
-    # Example metrics
     context = {
         "dashboard_settings": dashboard_settings,
-        "some_analytics_data": {...},  # Replace with real data
+        "analytics": analytics_report(request.user),
     }
     return render(request, "dashboard/analytics.html", context)
@@ -5,5 +5,5 @@
 python manage.py makemigrations --noinput
 python manage.py migrate --noinput
 
-# Start Gunicorn
-exec gunicorn streamlab.wsgi:application --bind 0.0.0.0:8000
+# Start Gunicorn with ASGI workers (needed for the Server-Sent Events endpoints)
+exec gunicorn streamlab.asgi:application -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:8000
@@ -0,0 +1,169 @@
+// static/js/upload.js
+//
+// Client for the resumable recording upload endpoints (streaming/uploads.py):
+// start an upload, PUT its chunks in order, each with its SHA-256, then
+// finalize. A chunk that fails is retried, and after an interruption the
+// server says which chunk it expects next, so a long recording is never lost
+// to one failed request. Blobs can be appended as they are produced (e.g.
+// MediaRecorder timeslices), so most of a recording is stored by the time it
+// stops.
+
+const RETRY_DELAYS = [1000, 2000, 5000, 10000, 30000];
+
+const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+
+async function sha256Hex(buffer) {
+  const digest = await crypto.subtle.digest('SHA-256', buffer);
+  return Array.from(new Uint8Array(digest))
+    .map(b => b.toString(16).padStart(2, '0'))
+    .join('');
+}
+
+export class ResumableUpload {
+  constructor(state, csrfToken) {
+    this.url       = state.url;
+    this.csrfToken = csrfToken;
+    this.maxChunk  = state.max_chunk_size;
+    this.queue     = Promise.resolve();
+    this._update(state);
+  }
+
+  /**
+   * Open an upload.
+   *
+   * @param {string} startUrl     – the streaming:upload_start URL
+   * @param {string} filename
+   * @param {string} csrfToken
+   * @param {Object} [options]
+   * @param {string} [options.sessionUuid] – the studio session recorded, if any
+   * @param {boolean} [options.live] – blobs are appended while still
+   *   recording; if they stop coming the server finalizes what arrived
+   */
+  static async start(startUrl, filename, csrfToken, { sessionUuid, live } = {}) {
+    const body = new FormData();
+    body.append('filename', filename);
+    if (sessionUuid) body.append('session_uuid', sessionUuid);
+    if (live) body.append('live', '1');
+    const resp = await fetch(startUrl, {
+      method: 'POST',
+      body,
+      headers: { 'X-CSRFToken': csrfToken },
+      credentials: 'same-origin',
+    });
+    if (!resp.ok) throw new Error(`Upload start failed: ${resp.status}`);
+    return new ResumableUpload(await resp.json(), csrfToken);
+  }
+
+  _update(state) {
+    this.offset    = state.offset;
+    this.nextChunk = state.next_chunk;
+    this.state     = state;
+  }
+
+  _request(url, options) {
+    return fetch(url, {
+      credentials: 'same-origin',
+      ...options,
+      headers: { 'X-CSRFToken': this.csrfToken, ...(options.headers || {}) },
+    });
+  }
+
+  /**
+   * Queue a Blob for upload. It goes out in chunks of at most the server's
+   * limit, strictly after everything appended before it.
+   * Returns a promise that settles once this blob is stored. Once a chunk
+   * fails, it and everything queued after it are rejected (the error's
+   * `status` is the server's, if it answered) until recover() is called.
+   */
+  append(blob) {
+    for (let start = 0; start < blob.size; start += this.maxChunk) {
+      const piece = blob.slice(start, start + this.maxChunk);
+      this.queue = this.queue.then(() => this._put(piece));
+    }
+    return this.queue;
+  }
+
+  async _put(piece) {
+    const data     = await piece.arrayBuffer();
+    const checksum = await sha256Hex(data);
+    const index    = this.nextChunk;
+
+    for (let attempt = 0; ; attempt++) {
+      let resp = null;
+      try {
+        resp = await this._request(`${this.url}chunks/${index}/`, {
+          method: 'PUT',
+          body: data,
+          headers: {
+            'Content-Type': 'application/octet-stream',
+            'X-Chunk-SHA256': checksum,
+          },
+        });
+      } catch (err) {
+        console.warn(`Upload: chunk ${index} did not reach the server`, err);
+      }
+      if (resp && resp.ok) {
+        this._update(await resp.json());
+        return;
+      }
+      if (resp && resp.status === 409) {
+        // Out of step with the server (a lost response): ask where we are.
+        await this.resume();
+        if (this.nextChunk > index) return;
+        throw new Error(`Upload expects chunk ${this.nextChunk}, not ${index}`);
+      }
+      // Network errors, corrupted chunks (400) and server errors are retried.
+      if (resp && resp.status !== 400 && resp.status < 500) {
+        const err = new Error(`Chunk upload failed: ${resp.status}`);
+        err.status = resp.status;
+        throw err;
+      }
+      if (attempt >= RETRY_DELAYS.length) {
+        throw new Error(`Chunk ${index} failed after ${attempt + 1} attempts`);
+      }
+      await sleep(RETRY_DELAYS[attempt]);
+    }
+  }
+
+  /** Re-read the upload's progress from the server. */
+  async resume() {
+    const resp = await this._request(this.url, { method: 'GET' });
+    if (!resp.ok) throw new Error(`Upload status failed: ${resp.status}`);
+    this._update(await resp.json());
+    return this.state;
+  }
+
+  /**
+   * After a failed append, clear the failure and re-read the server's
+   * progress. Resolves to the number of bytes stored; append what follows.
+   */
+  async recover() {
+    await this.queue.catch(() => {});
+    this.queue = Promise.resolve();
+    await this.resume();
+    return this.offset;
+  }
+
+  /**
+   * Wait for every queued chunk, then finalize. Resolves to the server's
+   * final state, with file_path and file_url.
+   */
+  async finish() {
+    await this.queue;
+    for (let attempt = 0; ; attempt++) {
+      let resp = null;
+      try {
+        resp = await this._request(`${this.url}finalize/`, { method: 'POST' });
+      } catch (err) {
+        console.warn('Upload: finalize did not reach the server', err);
+      }
+      if (resp && resp.ok) {
+        this._update(await resp.json());
+        return this.state;
+      }
+      if (resp && resp.status < 500) throw new Error(`Finalize failed: ${resp.status}`);
+      if (attempt >= RETRY_DELAYS.length) throw new Error('Finalize failed');
+      await sleep(RETRY_DELAYS[attempt]);
+    }
+  }
+}
@@ -5,6 +5,8 @@ from .models import (
     ScheduledVideo,
     ChatMessage,
     StreamingPlatformAccount,
+    Recording,
+    ProcessedVideo,
 )
 
 
@@ -40,13 +42,20 @@ class ScheduledVideoAdmin(admin.ModelAdmin):
 
 @admin.register(ChatMessage)
 class ChatMessageAdmin(admin.ModelAdmin):
-    list_display = ("user", "streaming_session", "created_at")
+    list_display = (
+        "user",
+        "author_name",
+        "platform",
+        "streaming_session",
+        "created_at",
+    )
     search_fields = (
         "user__username",
+        "author_name",
         "streaming_session__configuration__stream_title",
         "text",
     )
-    list_filter = ("created_at",)
+    list_filter = ("platform", "created_at")
     ordering = ("-created_at",)
 
 
@@ -56,3 +65,26 @@ class StreamingPlatformAccountAdmin(admin.ModelAdmin):
     search_fields = ("user__username", "account_username", "platform")
     list_filter = ("platform", "created_at")
     ordering = ("-created_at",)
+
+
+@admin.register(Recording)
+class RecordingAdmin(admin.ModelAdmin):
+    list_display = ("session", "status", "duration", "size", "created_at")
+    search_fields = ("session__session_uuid", "session__configuration__stream_title")
+    list_filter = ("status", "created_at")
+    ordering = ("-created_at",)
+
+
+@admin.register(ProcessedVideo)
+class ProcessedVideoAdmin(admin.ModelAdmin):
+    list_display = (
+        "source_path",
+        "user",
+        "status",
+        "priority",
+        "duration",
+        "created_at",
+    )
+    search_fields = ("source_path", "sha256", "user__username")
+    list_filter = ("status", "created_at")
+    ordering = ("-created_at",)
@@ -0,0 +1,174 @@
+import logging
+import re
+
+from django.conf import settings
+
+from . import metrics
+from .models import StreamingRelayStatus
+from .proc_accounting import host_headroom, relay_queue
+
+logger = logging.getLogger(__name__)
+
+# Per subscription plan: concurrent destinations across all of a user's live
+# sessions, the highest video bitrate relayed as is (kbps), how many of the
+# relays may re-encode down to that bitrate, and the largest file that may be
+# uploaded (MB; see upload_handlers.py).
+PLAN_LIMITS = getattr(
+    settings,
+    "PLAN_LIMITS",
+    {
+        "free": {
+            "destinations": 2,
+            "bitrate_kbps": 4500,
+            "transcodes": 0,
+            "upload_mb": 2048,
+        },
+        "basic": {
+            "destinations": 4,
+            "bitrate_kbps": 6000,
+            "transcodes": 1,
+            "upload_mb": 8192,
+        },
+        "pro": {
+            "destinations": 10,
+            "bitrate_kbps": 12000,
+            "transcodes": 4,
+            "upload_mb": 32768,
+        },
+    },
+)
+# Host capacity one transcoding relay takes, in stream-copy relays.
+RELAY_TRANSCODE_COST = getattr(settings, "RELAY_TRANSCODE_COST", 8)
+
+
+def plan_limits(user):
+    return PLAN_LIMITS.get(user.subscription_plan, PLAN_LIMITS["free"])
+
+
+def ingest_kbps(session):
+    """
+    The session's ingest bitrate: as SRS measures it once the publisher is
+    connected, otherwise the configuration's declared bitrate.
+    """
+    from .stream_health import get_srs_streams
+
+    stream_key = session.configuration.stream_key
+    for stream in get_srs_streams() or ():
+        if stream.get("name") == stream_key:
+            measured = (stream.get("kbps") or {}).get("recv_30s")
+            if measured:
+                return measured
+    declared = re.match(r"\s*(\d+)", session.configuration.bitrate or "")
+    return int(declared.group(1)) if declared else None
+
+
+def _place(headroom, cost):
+    """
+    Take `cost` relays of capacity from the host with the most left. None
+    without any live resource data; False if no host has room.
+    """
+    if not headroom:
+        return None
+    host = max(headroom, key=headroom.get)
+    if headroom[host] < cost:
+        return False
+    headroom[host] -= cost
+    return host
+
+
+def _refuse(session, account, status, reason):
+    StreamingRelayStatus.objects.update_or_create(
+        session=session,
+        platform=account.platform,
+        defaults={
+            "rtmp_url": account.rtmp_url,
+            "status": status,
+            "log_summary": reason,
+        },
+    )
+
+
+def admit_relays(session, accounts):
+    """
+    Decide which of the relays of `session` to `accounts` its owner's plan
+    admits, whether each has to transcode to stay under the plan's bitrate,
+    and which host runs it. Returns (admitted, refused):
+
+    - admitted: dicts with account, queue, host and transcode_kbps;
+    - refused: (account, reason) pairs.
+
+    Relays over a plan limit are recorded as rejected. Relays no host has room
+    for stay pending, so the health sweep retries them once capacity frees up.
+    """
+    user = session.configuration.user
+    plan = user.subscription_plan
+    limits = plan_limits(user)
+    platforms = {account.platform for account in accounts}
+    # Everything else the user is relaying counts against the plan.
+    others = StreamingRelayStatus.objects.filter(
+        session__configuration__user=user,
+        session__status__in=["starting", "live", "partial"],
+        status__in=["pending", "success"],
+    ).exclude(session=session, platform__in=platforms)
+    running = others.count()
+    transcoding = others.filter(transcode_kbps__isnull=False).count()
+
+    kbps = ingest_kbps(session)
+    cap = limits["bitrate_kbps"]
+    # Only hosts whose workers consume their relay queue; a web or media host
+    # reports its ffmpeg usage too, but nothing there would pick a relay up.
+    headroom = {
+        host: entry["relays_left"]
+        for host, entry in host_headroom().items()
+        if entry["takes_relays"]
+    }
+
+    admitted, refused = [], []
+    for account in sorted(accounts, key=lambda account: account.id):
+        status, reason, transcode_kbps = "rejected", None, None
+        if running >= limits["destinations"]:
+            reason = (
+                f"The {plan} plan allows {limits['destinations']} "
+                "concurrent destinations"
+            )
+        elif kbps is not None and kbps > cap and transcoding >= limits["transcodes"]:
+            reason = (
+                f"Ingest bitrate {kbps:.0f} kbps exceeds the {plan} plan's "
+                f"{cap} kbps and no transcode slot is free"
+            )
+        else:
+            if kbps is not None and kbps > cap:
+                transcode_kbps = cap
+            host = _place(headroom, RELAY_TRANSCODE_COST if transcode_kbps else 1)
+            if host is False:
+                status, reason = "pending", "Waiting for relay capacity"
+
+        if reason:
+            outcome = "deferred" if status == "pending" else "rejected"
+        else:
+            outcome = "transcoded" if transcode_kbps else "admitted"
+        metrics.inc(
+            "streamlab_relay_admissions_total", {"plan": plan, "outcome": outcome}
+        )
+        if reason:
+            logger.warning(
+                "Relay of session %s to %s not started: %s",
+                session.id,
+                account.platform,
+                reason,
+            )
+            _refuse(session, account, status, reason)
+            refused.append((account, reason))
+            continue
+
+        running += 1
+        transcoding += transcode_kbps is not None
+        admitted.append(
+            {
+                "account": account,
+                "host": host,
+                "queue": relay_queue(host) if host else f"relay_{account.platform}",
+                "transcode_kbps": transcode_kbps,
+            }
+        )
+    return admitted, refused
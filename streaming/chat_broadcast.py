@@ -0,0 +1,145 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+import redis.asyncio as aioredis
+from django.conf import settings
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+# Messages for one session are collected for this long and published as one
+# batch, so a busy room costs one PUBLISH per window instead of one per message.
+CHAT_BROADCAST_WINDOW = getattr(settings, "CHAT_BROADCAST_WINDOW", 0.05)
+# Frames a slow client may fall behind before its oldest frames are dropped.
+CHAT_BROADCAST_CLIENT_BACKLOG = getattr(settings, "CHAT_BROADCAST_CLIENT_BACKLOG", 100)
+
+
+def channel_name(session_uuid):
+    return f"chat:broadcast:{session_uuid}"
+
+
+class ChatPublisher:
+    """
+    Per-process publisher. Writers hand over messages without blocking; a
+    background thread publishes each session's batch once per window.
+    """
+
+    def __init__(self, window=CHAT_BROADCAST_WINDOW):
+        self.window = window
+        self._pending = defaultdict(list)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def publish(self, session_uuid, messages):
+        with self._lock:
+            self._pending[str(session_uuid)].extend(messages)
+            # Threads do not survive a fork; start one per worker process.
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._run, name="chat-publisher", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.window)
+            with self._lock:
+                if not self._pending:
+                    continue
+                batch, self._pending = self._pending, defaultdict(list)
+            try:
+                pipe = get_redis_connection("default").pipeline(transaction=False)
+                for session_uuid, messages in batch.items():
+                    pipe.publish(
+                        channel_name(session_uuid),
+                        json.dumps(messages, default=str),
+                    )
+                pipe.execute()
+            except Exception as e:
+                logger.exception("Failed to publish chat batch: %s", e)
+
+
+publisher = ChatPublisher()
+
+
+def publish(session_uuid, messages):
+    """Queue messages for broadcast to every worker with subscribers for the session."""
+    publisher.publish(session_uuid, messages)
+
+
+class ChatHub:
+    """
+    Per-worker subscriber. The worker holds one pub/sub connection and one
+    channel subscription per session that has local clients; each incoming
+    batch is encoded once and shared by all local client queues.
+    """
+
+    def __init__(self):
+        self.listeners = defaultdict(set)
+        self._redis = None
+        self._pubsub = None
+        self._reader = None
+        self._lock = asyncio.Lock()
+
+    def _redis_url(self):
+        return getattr(
+            settings,
+            "CHAT_BROADCAST_REDIS_URL",
+            settings.CACHES["default"]["LOCATION"],
+        )
+
+    async def subscribe(self, session_uuid):
+        queue = asyncio.Queue(maxsize=CHAT_BROADCAST_CLIENT_BACKLOG)
+        session_uuid = str(session_uuid)
+        async with self._lock:
+            if self._pubsub is None:
+                self._redis = aioredis.from_url(self._redis_url())
+                self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            if not self.listeners[session_uuid]:
+                await self._pubsub.subscribe(channel_name(session_uuid))
+            self.listeners[session_uuid].add(queue)
+            if self._reader is None or self._reader.done():
+                self._reader = asyncio.create_task(self._read_forever())
+        return queue
+
+    async def unsubscribe(self, session_uuid, queue):
+        session_uuid = str(session_uuid)
+        async with self._lock:
+            queues = self.listeners.get(session_uuid)
+            if queues is None:
+                return
+            queues.discard(queue)
+            if not queues:
+                del self.listeners[session_uuid]
+                await self._pubsub.unsubscribe(channel_name(session_uuid))
+
+    async def _read_forever(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Chat broadcast connection error: %s", e)
+                await asyncio.sleep(1)
+                continue
+            if not message or message["type"] != "message":
+                continue
+
+            session_uuid = message["channel"].decode().rsplit(":", 1)[-1]
+            frame = b"data: " + message["data"] + b"\n\n"
+            for queue in list(self.listeners.get(session_uuid, ())):
+                if queue.full():
+                    # Slow client: drop its oldest frame rather than block everyone.
+                    queue.get_nowait()
+                queue.put_nowait(frame)
+
+
+hub = ChatHub()
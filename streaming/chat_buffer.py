@@ -0,0 +1,310 @@
+import logging
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from .chat_broadcast import publish
+from .models import ChatMessage, StreamingSession
+from .moderation import moderate_messages
+
+logger = logging.getLogger(__name__)
+
+# Flushed messages stay readable from the stream for this many seconds so that
+# polling clients can keep reading incrementally without touching the database.
+CHAT_BUFFER_RETENTION = getattr(settings, "CHAT_BUFFER_RETENTION", 300)
+# Upper bound on how many messages a single flush writes per bulk_create call.
+CHAT_BUFFER_BATCH_SIZE = getattr(settings, "CHAT_BUFFER_BATCH_SIZE", 500)
+# When this many messages are waiting for one session, the writer asks for an
+# immediate flush instead of waiting for the next beat tick.
+CHAT_BUFFER_MAX_PENDING = getattr(settings, "CHAT_BUFFER_MAX_PENDING", 2000)
+# Idle buffers (and their flush markers) are dropped after this many seconds.
+CHAT_BUFFER_TTL = getattr(settings, "CHAT_BUFFER_TTL", 24 * 3600)
+
+PENDING_SESSIONS_KEY = "chat:pending_sessions"
+
+# Remove a session from the pending set only if its stream has nothing left to
+# flush. Done in Lua so that a concurrent append cannot slip in between the
+# check and the removal.
+_RELEASE_SESSION_SCRIPT = """
+local last = redis.call('GET', KEYS[2])
+local tail = redis.call('XREVRANGE', KEYS[1], '+', '-', 'COUNT', 1)
+if #tail == 0 or (last and tail[1][1] == last) then
+    redis.call('SREM', KEYS[3], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+
+def _stream_key(session_uuid):
+    return f"chat:stream:{session_uuid}"
+
+
+def _flushed_key(session_uuid):
+    return f"chat:flushed:{session_uuid}"
+
+
+def _trimmed_key(session_uuid):
+    return f"chat:trimmed:{session_uuid}"
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _parse_id(entry_id):
+    ms, _, seq = _decode(entry_id).partition("-")
+    return int(ms), int(seq or 0)
+
+
+def _entry_to_message(entry_id, fields):
+    fields = {_decode(k): _decode(v) for k, v in fields.items()}
+    return {
+        "buffer_id": _decode(entry_id),
+        "user_id": int(fields["user_id"]) if fields.get("user_id") else None,
+        "user__username": fields.get("username", ""),
+        "platform": fields.get("platform") or None,
+        "external_id": fields.get("external_id") or None,
+        "text": fields.get("text", ""),
+        "created_at": datetime.fromisoformat(fields["created_at"]),
+    }
+
+
+def append_message(session, user, text):
+    """
+    Append a chat message to the session's Redis stream and return its entry id,
+    or None if moderation blocked it. The message is persisted later by
+    flush_session(); Redis stream ids give the ordering that the flusher
+    preserves when writing rows.
+    """
+    entry_ids = append_messages(
+        session.session_uuid,
+        [
+            {
+                "user_id": user.pk,
+                "username": user.username,
+                "text": text,
+                "created_at": timezone.now().isoformat(),
+            }
+        ],
+    )
+    return entry_ids[0] if entry_ids else None
+
+
+def append_messages(session_uuid, messages):
+    """
+    Append several messages to one session's stream in a single round-trip.
+
+    Each message is a dict with `text`, `created_at` (ISO string) and either
+    `user_id`/`username` for local users or `platform`/`username`/`external_id`
+    for messages ingested from a platform chat. Messages pass through the
+    channel's moderation filter first; returns the entry ids of those kept.
+    """
+    messages = moderate_messages(session_uuid, messages)
+    if not messages:
+        return []
+
+    conn = get_redis_connection("default")
+    key = _stream_key(session_uuid)
+    pipe = conn.pipeline()
+    for message in messages:
+        pipe.xadd(key, {k: v for k, v in message.items() if v is not None})
+    pipe.sadd(PENDING_SESSIONS_KEY, str(session_uuid))
+    pipe.expire(key, CHAT_BUFFER_TTL)
+    pipe.xlen(key)
+    results = pipe.execute()
+    entry_ids, length = results[: len(messages)], results[-1]
+    entry_ids = [_decode(entry_id) for entry_id in entry_ids]
+
+    publish(
+        session_uuid,
+        [
+            {
+                "id": entry_id,
+                "user__username": message.get("username", ""),
+                "platform": message.get("platform"),
+                "text": message["text"],
+                "created_at": message["created_at"],
+            }
+            for entry_id, message in zip(entry_ids, messages)
+        ],
+    )
+
+    if length > CHAT_BUFFER_MAX_PENDING:
+        # Backlog is building up faster than the beat flusher drains it.
+        if conn.set(f"chat:flush-requested:{session_uuid}", 1, nx=True, ex=5):
+            from .tasks import flush_chat_buffer
+
+            flush_chat_buffer.delay(str(session_uuid))
+
+    return entry_ids
+
+
+def flush_session(session_uuid, batch_size=None):
+    """
+    Persist all not-yet-flushed messages of one session with bulk_create, in
+    stream order. Returns the number of messages written.
+    """
+    batch_size = batch_size or CHAT_BUFFER_BATCH_SIZE
+    conn = get_redis_connection("default")
+    key = _stream_key(session_uuid)
+    marker_key = _flushed_key(session_uuid)
+
+    lock = conn.lock(f"chat:flush-lock:{session_uuid}", timeout=60)
+    if not lock.acquire(blocking=False):
+        return 0
+
+    try:
+        session_id = (
+            StreamingSession.objects.filter(session_uuid=session_uuid)
+            .values_list("id", flat=True)
+            .first()
+        )
+        if session_id is None:
+            logger.warning("Dropping chat buffer for unknown session %s", session_uuid)
+            conn.delete(key, marker_key, _trimmed_key(session_uuid))
+            conn.srem(PENDING_SESSIONS_KEY, str(session_uuid))
+            return 0
+
+        last_id = _decode(conn.get(marker_key)) or "0-0"
+        written = 0
+        while True:
+            entries = conn.xrange(key, min=f"({last_id}", max="+", count=batch_size)
+            if not entries:
+                break
+
+            messages = [
+                _entry_to_message(entry_id, fields) for entry_id, fields in entries
+            ]
+            # ignore_conflicts + the unique constraints make a retried flush
+            # idempotent and drop platform messages that were delivered twice.
+            ChatMessage.objects.bulk_create(
+                [
+                    ChatMessage(
+                        streaming_session_id=session_id,
+                        user_id=message["user_id"],
+                        platform=message["platform"],
+                        author_name=(
+                            message["user__username"] if message["platform"] else None
+                        ),
+                        external_id=message["external_id"],
+                        text=message["text"],
+                        created_at=message["created_at"],
+                        buffer_id=message["buffer_id"],
+                    )
+                    for message in messages
+                ],
+                batch_size=batch_size,
+                ignore_conflicts=True,
+            )
+            last_id = messages[-1]["buffer_id"]
+            conn.set(marker_key, last_id, ex=CHAT_BUFFER_TTL)
+            written += len(messages)
+
+        # Keep recently flushed entries around for incremental readers, but
+        # never trim anything that has not been written yet.
+        cutoff_ms = int(
+            (timezone.now() - timedelta(seconds=CHAT_BUFFER_RETENTION)).timestamp()
+            * 1000
+        )
+        min_id = min(_parse_id(last_id), (cutoff_ms, 0))
+        min_id = f"{min_id[0]}-{min_id[1]}"
+        # Remember the newest entry the trim may remove, so that readers can
+        # tell a cursor that fell behind the trim from one that is caught up.
+        trimmed = conn.xrevrange(key, max=f"({min_id}", min="-", count=1)
+        if trimmed:
+            conn.set(_trimmed_key(session_uuid), trimmed[0][0], ex=CHAT_BUFFER_TTL)
+        conn.xtrim(key, minid=min_id, approximate=True)
+        conn.register_script(_RELEASE_SESSION_SCRIPT)(
+            keys=[key, marker_key, PENDING_SESSIONS_KEY], args=[str(session_uuid)]
+        )
+        return written
+    finally:
+        try:
+            lock.release()
+        except Exception:
+            logger.warning(
+                "Chat flush lock for %s expired before release", session_uuid
+            )
+
+
+def flush_all(batch_size=None):
+    """Flush every session that has buffered messages."""
+    conn = get_redis_connection("default")
+    written = 0
+    for session_uuid in conn.smembers(PENDING_SESSIONS_KEY):
+        session_uuid = _decode(session_uuid)
+        try:
+            written += flush_session(session_uuid, batch_size=batch_size)
+        except Exception as e:
+            logger.exception("Failed to flush chat buffer for %s: %s", session_uuid, e)
+    return written
+
+
+def pending_messages(session_uuid):
+    """Messages of a session that are still waiting in Redis to be flushed."""
+    conn = get_redis_connection("default")
+    marker = _decode(conn.get(_flushed_key(session_uuid))) or "0-0"
+    return [
+        _entry_to_message(entry_id, fields)
+        for entry_id, fields in conn.xrange(
+            _stream_key(session_uuid), min=f"({marker}", max="+"
+        )
+    ]
+
+
+def read_messages(session, after=None):
+    """
+    Return (messages, cursor, reset) for a session.
+
+    With an `after` cursor only newer entries are read straight from the Redis
+    stream. Without one, or if entries after the cursor have already been
+    trimmed away, the persisted history is loaded and the unflushed tail from
+    the stream appended; `reset` is then True and the messages replace what
+    the reader has rather than following it.
+    """
+    conn = get_redis_connection("default")
+    key = _stream_key(session.session_uuid)
+
+    if after:
+        try:
+            after_id = _parse_id(after)
+        except ValueError:
+            after_id = None
+        head = conn.xrange(key, count=1)
+        trimmed = _decode(conn.get(_trimmed_key(session.session_uuid)))
+        if after_id and (
+            not head
+            or _parse_id(head[0][0]) <= after_id
+            # Everything newer than the cursor is still in the stream.
+            or (trimmed and _parse_id(trimmed) <= after_id)
+        ):
+            entries = conn.xrange(key, min=f"({after}", max="+")
+            messages = [
+                _entry_to_message(entry_id, fields) for entry_id, fields in entries
+            ]
+            cursor = messages[-1]["buffer_id"] if messages else after
+            return messages, cursor, False
+
+    marker = _decode(conn.get(_flushed_key(session.session_uuid)))
+    pending = pending_messages(session.session_uuid)
+    persisted = list(
+        session.chat_messages.order_by("id").values(
+            "user__username",
+            "author_name",
+            "platform",
+            "text",
+            "created_at",
+            "buffer_id",
+        )
+    )
+    for message in persisted:
+        author_name = message.pop("author_name")
+        message["user__username"] = message["user__username"] or author_name
+    # A flush may have landed between reading the marker and the rows.
+    seen = {message["buffer_id"] for message in persisted if message["buffer_id"]}
+    messages = persisted + [m for m in pending if m["buffer_id"] not in seen]
+    cursor = pending[-1]["buffer_id"] if pending else (marker or "0-0")
+    return messages, cursor, True
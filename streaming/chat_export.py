@@ -0,0 +1,134 @@
+import csv
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .chat_buffer import pending_messages
+from .models import ChatMessage
+
+# Rows fetched per keyset page; memory use is bounded by one page.
+CHAT_EXPORT_PAGE_SIZE = getattr(settings, "CHAT_EXPORT_PAGE_SIZE", 2000)
+# Encoded rows are joined into chunks of about this many bytes before sending.
+CHAT_EXPORT_CHUNK_BYTES = getattr(settings, "CHAT_EXPORT_CHUNK_BYTES", 64 * 1024)
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+EXPORT_COLUMNS = ["created_at", "author", "platform", "text"]
+
+
+class _Echo:
+    """File-like object whose write() hands the line straight back to csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+async def iter_session_messages(session, page_size=CHAT_EXPORT_PAGE_SIZE):
+    """
+    Yield every chat message of a session, oldest first, as dicts with the
+    export columns. The database is read in keyset pages on (session, id);
+    messages still waiting in the Redis buffer are appended at the end.
+    """
+    # Snapshot the buffer tail first: anything flushed after this point is
+    # picked up by the pages below, and the buffer_id check drops duplicates.
+    pending = await sync_to_async(pending_messages)(session.session_uuid)
+    seen = set()
+
+    last_id = 0
+    while True:
+        page = (
+            ChatMessage.objects.filter(streaming_session=session, id__gt=last_id)
+            .order_by("id")
+            .values(
+                "id",
+                "created_at",
+                "user__username",
+                "author_name",
+                "platform",
+                "text",
+                "buffer_id",
+            )[:page_size]
+        )
+        count = 0
+        async for row in page.aiterator(chunk_size=page_size):
+            count += 1
+            last_id = row["id"]
+            if row["buffer_id"]:
+                seen.add(row["buffer_id"])
+            yield {
+                "created_at": row["created_at"],
+                "author": row["user__username"] or row["author_name"] or "",
+                "platform": row["platform"] or "",
+                "text": row["text"],
+            }
+        if count < page_size:
+            break
+
+    for message in pending:
+        if message["buffer_id"] in seen:
+            continue
+        yield {
+            "created_at": message["created_at"],
+            "author": message["user__username"] or "",
+            "platform": message["platform"] or "",
+            "text": message["text"],
+        }
+
+
+async def export_chunks(session, fmt="csv", compress=False):
+    """
+    Encode a session's chat history as CSV or NDJSON byte chunks, optionally
+    gzip-compressed. The first chunk is produced before any query runs.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def emit(data):
+        return compressor.compress(data) if compressor else data
+
+    if fmt == "csv":
+        writer = csv.writer(_Echo())
+        # Written up front so the client gets its first byte immediately.
+        yield emit(writer.writerow(EXPORT_COLUMNS).encode())
+
+        def encode(row):
+            return writer.writerow(
+                [
+                    row["created_at"].isoformat(),
+                    row["author"],
+                    row["platform"],
+                    row["text"],
+                ]
+            )
+
+    else:
+
+        def encode(row):
+            return (
+                json.dumps(
+                    dict(row, created_at=row["created_at"].isoformat()),
+                    ensure_ascii=False,
+                )
+                + "\n"
+            )
+
+    buffered = []
+    size = 0
+    async for row in iter_session_messages(session):
+        line = encode(row)
+        buffered.append(line)
+        size += len(line)
+        if size >= CHAT_EXPORT_CHUNK_BYTES:
+            data = emit("".join(buffered).encode())
+            buffered, size = [], 0
+            if data:
+                yield data
+
+    tail = "".join(buffered).encode()
+    if compressor:
+        yield compressor.compress(tail) + compressor.flush()
+    elif tail:
+        yield tail
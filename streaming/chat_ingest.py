@@ -0,0 +1,522 @@
+import asyncio
+import itertools
+import logging
+import random
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+import aiohttp
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .chat_buffer import append_messages
+from .models import StreamingPlatformAccount, StreamingSession
+
+logger = logging.getLogger(__name__)
+
+# How often the set of live sessions is re-read from the database.
+CHAT_INGEST_REFRESH_INTERVAL = getattr(settings, "CHAT_INGEST_REFRESH_INTERVAL", 30)
+# How long ingested messages are collected before they are written as one batch.
+CHAT_INGEST_WRITE_INTERVAL = getattr(settings, "CHAT_INGEST_WRITE_INTERVAL", 0.5)
+
+
+class ChatSource:
+    """One platform chat attached to one live streaming session."""
+
+    def __init__(self, session_uuid, account_id, platform, account_username, token):
+        self.session_uuid = session_uuid
+        self.account_id = account_id
+        self.platform = platform
+        self.account_username = account_username
+        self.access_token = token
+        # Provider specific state (page tokens, cursors, resolved chat ids ...).
+        self.state = {}
+        self._seen = OrderedDict()
+
+    @property
+    def key(self):
+        return (str(self.session_uuid), self.account_id)
+
+    def unseen(self, messages, limit=2000):
+        """Drop messages already delivered by an earlier, overlapping poll."""
+        fresh = []
+        for message in messages:
+            if message.external_id in self._seen:
+                continue
+            self._seen[message.external_id] = None
+            fresh.append(message)
+        while len(self._seen) > limit:
+            self._seen.popitem(last=False)
+        return fresh
+
+    def __repr__(self):
+        return f"<ChatSource {self.platform} session={self.session_uuid}>"
+
+
+class IngestedMessage:
+    """A platform chat message normalized for the chat buffer."""
+
+    __slots__ = ("platform", "external_id", "author", "text", "created_at")
+
+    def __init__(self, platform, external_id, author, text, created_at=None):
+        self.platform = platform
+        self.external_id = str(external_id)
+        self.author = author or ""
+        self.text = text or ""
+        self.created_at = created_at or timezone.now()
+
+    def as_buffer_fields(self):
+        return {
+            "platform": self.platform,
+            "external_id": self.external_id,
+            "username": self.author,
+            "text": self.text,
+            "created_at": self.created_at.isoformat(),
+        }
+
+
+class RateLimiter:
+    """Token bucket shared by every source of one provider."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = None
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if self.updated is not None:
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated) * self.rate
+                )
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ChatProvider:
+    """
+    Base class for platform chat clients.
+
+    A provider is created once per ingestion service and runs one coroutine per
+    attached source; `emit(source, messages)` hands normalized messages back
+    to the service.
+    """
+
+    platform = None
+
+    def __init__(self, http, emit):
+        self.http = http
+        self.emit = emit
+
+    async def run(self, source):
+        raise NotImplementedError
+
+
+class PollingChatProvider(ChatProvider):
+    """Provider for APIs that are polled; honours interval hints and rate limits."""
+
+    # Never poll one chat more often than this, whatever the API suggests.
+    min_interval = 2.0
+    # Requests per second across all sources of this provider, and burst size.
+    rate = 10.0
+    burst = 20
+    max_backoff = 60.0
+
+    def __init__(self, http, emit):
+        super().__init__(http, emit)
+        self.limiter = RateLimiter(self.rate, self.burst)
+
+    async def poll(self, source):
+        """Return (messages, seconds until the next poll)."""
+        raise NotImplementedError
+
+    async def run(self, source):
+        backoff = self.min_interval
+        # Spread the first polls so thousands of sources don't fire together.
+        await asyncio.sleep(random.uniform(0, self.min_interval))
+        while True:
+            await self.limiter.acquire()
+            try:
+                messages, interval = await self.poll(source)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("%s poll failed for %s: %s", self.platform, source, e)
+                backoff = min(backoff * 2, self.max_backoff)
+                await asyncio.sleep(backoff)
+                continue
+
+            backoff = self.min_interval
+            messages = source.unseen(messages)
+            if messages:
+                self.emit(source, messages)
+            await asyncio.sleep(max(interval or 0, self.min_interval))
+
+
+class YouTubeChatProvider(PollingChatProvider):
+    """YouTube Data API liveChatMessages; uses pollingIntervalMillis as the pace."""
+
+    platform = "youtube"
+    api_url = "https://www.googleapis.com/youtube/v3"
+    # liveChatMessages.list is quota-heavy; keep the whole process well below it.
+    rate = 5.0
+    burst = 10
+
+    async def _get(self, path, source, params):
+        headers = {"Authorization": f"Bearer {source.access_token}"}
+        async with self.http.get(
+            f"{self.api_url}/{path}", headers=headers, params=params
+        ) as resp:
+            resp.raise_for_status()
+            return await resp.json()
+
+    async def poll(self, source):
+        live_chat_id = source.state.get("live_chat_id")
+        if not live_chat_id:
+            data = await self._get(
+                "liveBroadcasts",
+                source,
+                {"part": "snippet", "broadcastStatus": "active"},
+            )
+            items = data.get("items", [])
+            if not items:
+                return [], 30
+            live_chat_id = items[0]["snippet"].get("liveChatId")
+            source.state["live_chat_id"] = live_chat_id
+
+        params = {"liveChatId": live_chat_id, "part": "snippet,authorDetails"}
+        if source.state.get("page_token"):
+            params["pageToken"] = source.state["page_token"]
+        data = await self._get("liveChat/messages", source, params)
+        source.state["page_token"] = data.get("nextPageToken")
+
+        messages = [
+            IngestedMessage(
+                self.platform,
+                item["id"],
+                item.get("authorDetails", {}).get("displayName"),
+                item["snippet"].get("displayMessage"),
+                _parse_timestamp(item["snippet"].get("publishedAt")),
+            )
+            for item in data.get("items", [])
+        ]
+        return messages, data.get("pollingIntervalMillis", 5000) / 1000
+
+
+class FacebookChatProvider(PollingChatProvider):
+    """Graph API comments on the user's current live video."""
+
+    platform = "facebook"
+    api_url = "https://graph.facebook.com/v14.0"
+    min_interval = 3.0
+
+    async def _get(self, path, source, params):
+        params = dict(params, access_token=source.access_token)
+        async with self.http.get(f"{self.api_url}/{path}", params=params) as resp:
+            resp.raise_for_status()
+            return await resp.json()
+
+    async def poll(self, source):
+        video_id = source.state.get("live_video_id")
+        if not video_id:
+            data = await self._get(
+                "me/live_videos", source, {"broadcast_status": '["LIVE"]'}
+            )
+            videos = data.get("data", [])
+            if not videos:
+                return [], 30
+            video_id = source.state["live_video_id"] = videos[0]["id"]
+
+        params = {
+            "order": "chronological",
+            "filter": "stream",
+            "live_filter": "no_filter",
+            "fields": "id,message,created_time,from{name}",
+            "limit": 100,
+        }
+        if source.state.get("after"):
+            params["after"] = source.state["after"]
+        data = await self._get(f"{video_id}/comments", source, params)
+        after = data.get("paging", {}).get("cursors", {}).get("after")
+        if after:
+            source.state["after"] = after
+
+        messages = [
+            IngestedMessage(
+                self.platform,
+                item["id"],
+                item.get("from", {}).get("name"),
+                item.get("message"),
+                _parse_timestamp(item.get("created_time")),
+            )
+            for item in data.get("data", [])
+        ]
+        return messages, self.min_interval
+
+
+class TwitchChatProvider(ChatProvider):
+    """
+    Twitch chat over IRC-on-WebSocket. Every channel is joined on one shared
+    anonymous connection, so thousands of sessions cost a single socket.
+    """
+
+    platform = "twitch"
+    irc_url = "wss://irc-ws.chat.twitch.tv:443"
+    # Twitch allows 20 JOINs per 10 seconds for anonymous connections.
+    join_rate = 2.0
+
+    def __init__(self, http, emit):
+        super().__init__(http, emit)
+        self.channels = {}
+        self.joiner = RateLimiter(self.join_rate, burst=20)
+        self._ws = None
+        self._connection = None
+        self._connected = asyncio.Event()
+
+    async def run(self, source):
+        channel = (source.account_username or "").lower().lstrip("#")
+        if not channel:
+            logger.warning("Twitch source %s has no channel name", source)
+            return
+        if self._connection is None or self._connection.done():
+            self._connection = asyncio.create_task(self._connect_forever())
+
+        sources = self.channels.setdefault(channel, set())
+        sources.add(source)
+        try:
+            # Channels registered before the socket is up are joined on connect.
+            if len(sources) == 1 and self._connected.is_set():
+                await self._join(channel)
+            await asyncio.Event().wait()  # until the service cancels us
+        finally:
+            sources = self.channels.get(channel, set())
+            sources.discard(source)
+            if not sources:
+                self.channels.pop(channel, None)
+                if self._ws is not None and not self._ws.closed:
+                    await self._ws.send_str(f"PART #{channel}")
+
+    async def _join(self, channel):
+        await self.joiner.acquire()
+        await self._ws.send_str(f"JOIN #{channel}")
+
+    async def _connect_forever(self):
+        backoff = 1
+        while True:
+            try:
+                async with self.http.ws_connect(self.irc_url, heartbeat=60) as ws:
+                    await ws.send_str("CAP REQ :twitch.tv/tags")
+                    await ws.send_str(f"NICK justinfan{random.randint(10000, 99999)}")
+                    self._ws = ws
+                    self._connected.set()
+                    for channel in list(self.channels):
+                        await self._join(channel)
+                    backoff = 1
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            for line in msg.data.split("\r\n"):
+                                await self._handle_line(ws, line)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Twitch IRC connection dropped: %s", e)
+            self._connected.clear()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+
+    async def _handle_line(self, ws, line):
+        if not line:
+            return
+        if line.startswith("PING"):
+            await ws.send_str("PONG" + line[4:])
+            return
+
+        tags = {}
+        if line.startswith("@"):
+            raw_tags, _, line = line[1:].partition(" ")
+            tags = dict(tag.partition("=")[::2] for tag in raw_tags.split(";"))
+        prefix, _, rest = line.partition(" ")
+        command, _, rest = rest.partition(" ")
+        if command != "PRIVMSG":
+            return
+        channel, _, text = rest.partition(" :")
+        sources = self.channels.get(channel.lstrip("#"))
+        if not sources:
+            return
+
+        sent_ts = tags.get("tmi-sent-ts")
+        message = IngestedMessage(
+            self.platform,
+            tags.get("id") or f"{channel}:{sent_ts}:{prefix}",
+            tags.get("display-name") or prefix.lstrip(":").partition("!")[0],
+            text,
+            (
+                datetime.fromtimestamp(int(sent_ts) / 1000, tz=dt_timezone.utc)
+                if sent_ts
+                else None
+            ),
+        )
+        for source in sources:
+            fresh = source.unseen([message])
+            if fresh:
+                self.emit(source, fresh)
+
+
+class FakeChatProvider(PollingChatProvider):
+    """
+    Local stand-in for any platform: produces a few synthetic messages per poll.
+    Used for tests, demos and load runs of the ingestion service.
+    """
+
+    platform = "fake"
+    min_interval = 1.0
+    rate = 10000.0
+    burst = 10000
+    messages_per_poll = 3
+
+    _counter = itertools.count()
+
+    async def poll(self, source):
+        messages = [
+            IngestedMessage(
+                source.platform,
+                f"fake-{next(self._counter)}",
+                f"viewer{random.randint(1, 500)}",
+                f"hello from {source.platform}",
+            )
+            for _ in range(random.randint(0, self.messages_per_poll))
+        ]
+        return messages, self.min_interval
+
+
+DEFAULT_PROVIDERS = {
+    "youtube": "streaming.chat_ingest.YouTubeChatProvider",
+    "twitch": "streaming.chat_ingest.TwitchChatProvider",
+    "facebook": "streaming.chat_ingest.FacebookChatProvider",
+}
+
+
+def get_provider_classes(use_fake=False):
+    """Provider classes by platform, overridable with CHAT_INGEST_PROVIDERS."""
+    paths = dict(DEFAULT_PROVIDERS)
+    paths.update(getattr(settings, "CHAT_INGEST_PROVIDERS", {}))
+    if use_fake:
+        paths = {
+            platform: "streaming.chat_ingest.FakeChatProvider" for platform in paths
+        }
+    return {platform: import_string(path) for platform, path in paths.items()}
+
+
+def _parse_timestamp(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def load_sources(platforms):
+    """All platform chats of currently live sessions, keyed by ChatSource.key."""
+    sessions = list(
+        StreamingSession.objects.filter(status__in=["live", "partial"]).values(
+            "session_uuid", "configuration__user_id"
+        )
+    )
+    accounts_by_user = defaultdict(list)
+    for account in StreamingPlatformAccount.objects.filter(
+        user_id__in={s["configuration__user_id"] for s in sessions},
+        platform__in=platforms,
+        is_active=True,
+    ).values("id", "user_id", "platform", "account_username", "access_token"):
+        accounts_by_user[account["user_id"]].append(account)
+
+    sources = {}
+    for session in sessions:
+        for account in accounts_by_user[session["configuration__user_id"]]:
+            source = ChatSource(
+                session["session_uuid"],
+                account["id"],
+                account["platform"],
+                account["account_username"],
+                account["access_token"],
+            )
+            sources[source.key] = source
+    return sources
+
+
+def write_batch(batch):
+    """Append collected messages to each session's chat buffer, one pipeline per session."""
+    for session_uuid, messages in batch.items():
+        append_messages(session_uuid, [m.as_buffer_fields() for m in messages])
+
+
+class ChatIngestService:
+    """
+    Keeps every platform chat of every live session open on one event loop and
+    writes what arrives through the chat buffer in periodic batches.
+    """
+
+    def __init__(self, provider_classes=None, use_fake=False):
+        self.provider_classes = provider_classes or get_provider_classes(use_fake)
+        self.providers = {}
+        self.tasks = {}
+        self.pending = defaultdict(list)
+
+    def emit(self, source, messages):
+        self.pending[str(source.session_uuid)].extend(messages)
+
+    async def run(self):
+        timeout = aiohttp.ClientTimeout(total=15)
+        connector = aiohttp.TCPConnector(limit=200)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as http:
+            self.providers = {
+                platform: cls(http, self.emit)
+                for platform, cls in self.provider_classes.items()
+            }
+            writer = asyncio.create_task(self._write_forever())
+            try:
+                while True:
+                    await self.sync_sources()
+                    await asyncio.sleep(CHAT_INGEST_REFRESH_INTERVAL)
+            finally:
+                for task in self.tasks.values():
+                    task.cancel()
+                writer.cancel()
+                await asyncio.gather(
+                    *self.tasks.values(), writer, return_exceptions=True
+                )
+                await self.flush()
+
+    async def sync_sources(self):
+        """Start tasks for newly live chats and cancel those whose session ended."""
+        sources = await sync_to_async(load_sources)(list(self.providers))
+        for key in set(self.tasks) - set(sources):
+            self.tasks.pop(key).cancel()
+        for key, source in sources.items():
+            if key not in self.tasks or self.tasks[key].done():
+                provider = self.providers[source.platform]
+                self.tasks[key] = asyncio.create_task(provider.run(source))
+        logger.info("Chat ingestion attached to %d platform chats", len(self.tasks))
+
+    async def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, defaultdict(list)
+        try:
+            await sync_to_async(write_batch)(batch)
+        except Exception as e:
+            logger.exception("Failed to write ingested chat batch: %s", e)
+
+    async def _write_forever(self):
+        while True:
+            await asyncio.sleep(CHAT_INGEST_WRITE_INTERVAL)
+            await self.flush()
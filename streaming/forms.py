@@ -32,6 +32,7 @@ class StreamingConfigurationForm(forms.ModelForm):
             "pull_links",
             "embed_player_url",
             "embed_chat_url",
+            "banned_terms",
             "resolution",
             "bitrate",
             "is_active",
@@ -0,0 +1,455 @@
+import logging
+import os
+import subprocess
+import threading
+import time
+from importlib import import_module
+
+import requests
+from django.conf import settings
+from django.contrib.auth import (
+    BACKEND_SESSION_KEY,
+    HASH_SESSION_KEY,
+    SESSION_KEY,
+    get_user_model,
+)
+from django.middleware.csrf import CSRF_ALLOWED_CHARS, CSRF_SECRET_LENGTH
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from .metrics import _queue_lengths
+from .models import (
+    PLATFORM_CHOICES,
+    StreamingConfiguration,
+    StreamingPlatformAccount,
+    StreamingRelayStatus,
+    StreamingSession,
+)
+from .probe import free_port, percentiles
+
+logger = logging.getLogger(__name__)
+
+# Relay status is kept per (session, platform), so each destination of one
+# publisher needs its own platform.
+MAX_DESTINATIONS = len(PLATFORM_CHOICES)
+# Usernames of load-test users start with this, which is how cleanup finds them.
+LOADTEST_USER_PREFIX = "loadtest-"
+# Plan of load-test users; admission rejects destinations beyond its limit, so
+# the default is the one that admits the most.
+LOADTEST_PLAN = "pro"
+
+
+def create_fixtures(run, publishers, destinations, sink_urls, plan=LOADTEST_PLAN):
+    """
+    A user per publisher on subscription `plan`, each with one streaming
+    configuration and `destinations` platform accounts. `sink_urls(i, j)`
+    gives the RTMP base URL destination j of publisher i relays to. Returns
+    the configurations.
+    """
+    User = get_user_model()
+    platforms = [platform for platform, _ in PLATFORM_CHOICES]
+    configs = []
+    for i in range(publishers):
+        user = User.objects.create_user(
+            username=f"{LOADTEST_USER_PREFIX}{run}-{i}",
+            email=f"{LOADTEST_USER_PREFIX}{run}-{i}@example.invalid",
+            subscription_plan=plan,
+        )
+        configs.append(
+            StreamingConfiguration.objects.create(
+                user=user,
+                stream_title=f"Load test {run} #{i}",
+                rtmp_url=f"rtmp://{settings.SRS_SERVER_HOST}/live",
+                stream_key=f"{run}-{i}",
+                is_active=True,
+            )
+        )
+        StreamingPlatformAccount.objects.bulk_create(
+            StreamingPlatformAccount(
+                user=user,
+                platform=platforms[j],
+                account_username=user.username,
+                rtmp_url=sink_urls(i, j),
+                stream_key=f"{run}-{i}-{j}",
+                is_active=True,
+            )
+            for j in range(destinations)
+        )
+    return configs
+
+
+def delete_fixtures(run=None):
+    """Delete load-test users (and, by cascade, their sessions); all runs by default."""
+    prefix = LOADTEST_USER_PREFIX + (f"{run}-" if run else "")
+    return get_user_model().objects.filter(username__startswith=prefix).delete()[0]
+
+
+def http_client(user, base_url):
+    """
+    A requests session logged in as `user` against the running site, sharing
+    its session store, with a CSRF token accepted by state-changing views.
+    """
+    store = import_module(settings.SESSION_ENGINE).SessionStore()
+    store[SESSION_KEY] = str(user.pk)
+    store[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    store[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    store.create()
+    csrf_token = get_random_string(CSRF_SECRET_LENGTH, CSRF_ALLOWED_CHARS)
+
+    client = requests.Session()
+    # Set as a header rather than a cookie jar, which would honour the
+    # Secure flag and drop them on plain-HTTP test deployments.
+    client.headers.update(
+        {
+            "Cookie": f"{settings.SESSION_COOKIE_NAME}={store.session_key}; "
+            f"{settings.CSRF_COOKIE_NAME}={csrf_token}",
+            "X-CSRFToken": csrf_token,
+            "Origin": base_url,
+            "Referer": f"{base_url}/",
+        }
+    )
+    return client
+
+
+def publisher_command(target, preset="veryfast", bitrate="2500k"):
+    """An ffmpeg test-pattern publisher, roughly what OBS sends at 720p30."""
+    return [
+        "ffmpeg",
+        "-loglevel",
+        "error",
+        "-re",
+        "-f",
+        "lavfi",
+        "-i",
+        "testsrc2=size=1280x720:rate=30",
+        "-re",
+        "-f",
+        "lavfi",
+        "-i",
+        "sine=frequency=440:sample_rate=44100",
+        "-c:v",
+        "libx264",
+        "-preset",
+        preset,
+        "-tune",
+        "zerolatency",
+        "-b:v",
+        bitrate,
+        "-g",
+        "60",
+        "-pix_fmt",
+        "yuv420p",
+        "-c:a",
+        "aac",
+        "-f",
+        "flv",
+        target,
+    ]
+
+
+class Sink:
+    """
+    A local RTMP endpoint standing in for one destination. It accepts a single
+    relay connection, discards the media and notes when the relay connected.
+    """
+
+    def __init__(self, app="sink"):
+        self.port = free_port()
+        self.app = app
+        self.connected_at = None
+        self._process = None
+
+    @property
+    def base_url(self):
+        return f"rtmp://127.0.0.1:{self.port}/{self.app}"
+
+    def start(self, stream_key):
+        self._process = subprocess.Popen(
+            [
+                "ffmpeg",
+                "-hide_banner",
+                "-loglevel",
+                "info",
+                "-listen",
+                "1",
+                "-i",
+                f"{self.base_url}/{stream_key}",
+                "-c",
+                "copy",
+                "-f",
+                "null",
+                "-",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        threading.Thread(target=self._watch, name="loadtest-sink", daemon=True).start()
+        return self
+
+    def _watch(self):
+        for line in self._process.stderr:
+            # Printed once the relay has connected and its stream was probed.
+            if self.connected_at is None and line.startswith("Input #0"):
+                self.connected_at = time.monotonic()
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait()
+
+
+class HostSampler:
+    """Samples host CPU, memory, load and Celery queue depth once a second."""
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.samples = []
+        self._stopped = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, name="loadtest-host", daemon=True).start()
+        return self
+
+    @staticmethod
+    def _cpu_times():
+        with open("/proc/stat") as f:
+            values = [int(v) for v in f.readline().split()[1:]]
+        idle = values[3] + values[4]  # idle + iowait
+        return sum(values), idle
+
+    @staticmethod
+    def _memory():
+        info = {}
+        with open("/proc/meminfo") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                info[key] = int(value.split()[0]) * 1024
+        return info["MemTotal"], info["MemAvailable"]
+
+    def _run(self):
+        total, idle = self._cpu_times()
+        while not self._stopped.wait(self.interval):
+            new_total, new_idle = self._cpu_times()
+            busy = 1 - (new_idle - idle) / max(1, new_total - total)
+            total, idle = new_total, new_idle
+            mem_total, mem_available = self._memory()
+            queues = _queue_lengths()
+            self.samples.append(
+                {
+                    "cpu_percent": round(busy * 100, 1),
+                    "memory_used_bytes": mem_total - mem_available,
+                    "load1": os.getloadavg()[0],
+                    "queued_tasks": sum(queues.values()),
+                }
+            )
+
+    def stop(self):
+        self._stopped.set()
+
+    def summary(self):
+        result = {}
+        for key in ("cpu_percent", "memory_used_bytes", "load1", "queued_tasks"):
+            values = [sample[key] for sample in self.samples]
+            if values:
+                result[key] = {"mean": sum(values) / len(values), "max": max(values)}
+        return result
+
+
+class Publisher:
+    """One synthetic streamer: go_live over HTTP, then publish to SRS."""
+
+    def __init__(self, config, base_url, preset, bitrate):
+        self.config = config
+        self.base_url = base_url
+        self.preset = preset
+        self.bitrate = bitrate
+        self.client = http_client(config.user, base_url)
+        self.started_at = None
+        self.go_live_seconds = None
+        self.go_live_error = None
+        self.session_id = None
+        self.live_at = None
+        self.relays_up = {}
+        self.stop_seconds = None
+        self._process = None
+
+    def go_live(self):
+        self.started_at = time.monotonic()
+        url = self.base_url + reverse("streaming:go_live", args=[self.config.id])
+        try:
+            response = self.client.post(url, timeout=30)
+            self.go_live_seconds = time.monotonic() - self.started_at
+            body = response.json()
+            if response.status_code != 200 or body.get("status") != "success":
+                self.go_live_error = body.get("message", str(response.status_code))
+                return
+            self.session_id = body["session_id"]
+        except (requests.RequestException, ValueError) as e:
+            self.go_live_seconds = time.monotonic() - self.started_at
+            self.go_live_error = str(e)
+            return
+
+        self._process = subprocess.Popen(
+            publisher_command(
+                f"rtmp://{settings.SRS_SERVER_HOST}/live/{self.config.stream_key}",
+                self.preset,
+                self.bitrate,
+            ),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+    @property
+    def exited(self):
+        return self._process is not None and self._process.poll() is not None
+
+    def stop(self):
+        if self.session_id is not None:
+            started = time.monotonic()
+            try:
+                self.client.get(
+                    self.base_url
+                    + reverse("streaming:stop_live", args=[self.session_id]),
+                    timeout=30,
+                    allow_redirects=False,
+                )
+                self.stop_seconds = time.monotonic() - started
+            except requests.RequestException as e:
+                logger.warning("Stopping load-test session failed: %s", e)
+        if self._process is not None and self._process.poll() is None:
+            self._process.terminate()
+            self._process.wait()
+
+
+def _poll_relays(publishers, destinations):
+    """Note when each session's relays are first seen running."""
+    by_session = {p.session_id: p for p in publishers if p.session_id is not None}
+    if not by_session:
+        return
+    now = time.monotonic()
+    for session_id, platform in StreamingRelayStatus.objects.filter(
+        session_id__in=by_session, status="success"
+    ).values_list("session_id", "platform"):
+        publisher = by_session[session_id]
+        publisher.relays_up.setdefault(platform, now)
+        if publisher.live_at is None and len(publisher.relays_up) >= destinations:
+            publisher.live_at = now
+
+
+def run_load_test(
+    publishers,
+    destinations,
+    base_url,
+    ramp=1.0,
+    hold=60,
+    preset="veryfast",
+    bitrate="2500k",
+    sink_url=None,
+    keep=False,
+    plan=LOADTEST_PLAN,
+):
+    """
+    Start `publishers` synthetic streamers `ramp` seconds apart, each relayed
+    to `destinations` sinks, hold them for `hold` seconds and tear down. The
+    publishers are users on `plan`.
+    Without `sink_url` every destination gets its own local ffmpeg sink.
+    Returns the report as a dict.
+    """
+    run = get_random_string(6, "abcdefghijklmnopqrstuvwxyz0123456789")
+    sinks = {}
+    if sink_url is None:
+        for i in range(publishers):
+            for j in range(destinations):
+                sinks[i, j] = Sink().start(f"{run}-{i}-{j}")
+
+    configs = create_fixtures(
+        run,
+        publishers,
+        destinations,
+        lambda i, j: sinks[i, j].base_url if sinks else sink_url,
+        plan=plan,
+    )
+    streamers = [Publisher(config, base_url, preset, bitrate) for config in configs]
+    host = HostSampler().start()
+    started = time.monotonic()
+    try:
+        for streamer in streamers:
+            threading.Thread(target=streamer.go_live, daemon=True).start()
+            deadline = time.monotonic() + ramp
+            while time.monotonic() < deadline:
+                _poll_relays(streamers, destinations)
+                time.sleep(min(0.5, ramp))
+        deadline = time.monotonic() + hold
+        while time.monotonic() < deadline:
+            _poll_relays(streamers, destinations)
+            time.sleep(0.5)
+        exited = sum(1 for streamer in streamers if streamer.exited)
+    finally:
+        host.stop()
+        for streamer in streamers:
+            streamer.stop()
+        for sink in sinks.values():
+            sink.stop()
+
+    session_states = dict(
+        StreamingSession.objects.filter(
+            id__in=[s.session_id for s in streamers if s.session_id]
+        ).values_list("id", "status")
+    )
+    relay_errors = StreamingRelayStatus.objects.filter(
+        session_id__in=session_states, status="error"
+    ).count()
+    if not keep:
+        delete_fixtures(run)
+
+    relay_spawn = [up - s.started_at for s in streamers for up in s.relays_up.values()]
+    sink_connect = [
+        sink.connected_at - streamers[i].started_at
+        for (i, _), sink in sinks.items()
+        if sink.connected_at is not None and streamers[i].started_at is not None
+    ]
+    total_relays = publishers * destinations
+    return {
+        "run": run,
+        "parameters": {
+            "publishers": publishers,
+            "destinations": destinations,
+            "plan": plan,
+            "ramp": ramp,
+            "hold": hold,
+            "preset": preset,
+            "bitrate": bitrate,
+            "cpu_count": os.cpu_count(),
+        },
+        "duration": time.monotonic() - started,
+        "go_live_seconds": percentiles(
+            [s.go_live_seconds for s in streamers if s.go_live_seconds is not None]
+        ),
+        "time_to_live_seconds": percentiles(
+            [s.live_at - s.started_at for s in streamers if s.live_at is not None]
+        ),
+        "relay_spawn_seconds": percentiles(relay_spawn),
+        "sink_connect_seconds": percentiles(sink_connect),
+        "stop_live_seconds": percentiles(
+            [s.stop_seconds for s in streamers if s.stop_seconds is not None]
+        ),
+        "failures": {
+            "go_live": sum(1 for s in streamers if s.go_live_error),
+            "never_live": sum(1 for s in streamers if s.live_at is None),
+            "publisher_exited": exited,
+            "relay_errors": relay_errors,
+            "relays_missing": total_relays - len(relay_spawn),
+            "sessions_failed": sum(
+                1 for status in session_states.values() if status in ("failed", "error")
+            ),
+        },
+        "failure_rate": {
+            "sessions": sum(1 for s in streamers if s.live_at is None) / publishers,
+            "relays": (total_relays - len(relay_spawn)) / total_relays,
+        },
+        "go_live_errors": sorted(
+            {s.go_live_error for s in streamers if s.go_live_error}
+        ),
+        "host": host.summary(),
+    }
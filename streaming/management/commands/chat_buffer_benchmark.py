@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+
+from streaming.chat_buffer import append_message, flush_session
+from streaming.models import ChatMessage, StreamingSession
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure sustained chat throughput through the write-behind buffer: "
+        "Redis appends per second, bulk flush rate and end-to-end rate."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("session_id", type=int)
+        parser.add_argument("--messages", type=int, default=10000)
+        parser.add_argument(
+            "--flush-every",
+            type=int,
+            default=1000,
+            help="Flush after this many appends, like a beat tick under load.",
+        )
+        parser.add_argument(
+            "--keep",
+            action="store_true",
+            help="Keep the benchmark messages instead of deleting them afterwards.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            session = StreamingSession.objects.select_related(
+                "configuration__user"
+            ).get(id=options["session_id"])
+        except StreamingSession.DoesNotExist:
+            raise CommandError(f"Session {options['session_id']} does not exist")
+
+        user = session.configuration.user
+        total = options["messages"]
+        flush_every = max(1, options["flush_every"])
+        last_row_id = ChatMessage.objects.aggregate(last=Max("id"))["last"] or 0
+
+        append_time = flush_time = 0.0
+        flushed = 0
+        started = time.perf_counter()
+        for i in range(total):
+            t0 = time.perf_counter()
+            append_message(session, user, f"benchmark message {i}")
+            append_time += time.perf_counter() - t0
+
+            if (i + 1) % flush_every == 0:
+                t0 = time.perf_counter()
+                flushed += flush_session(session.session_uuid)
+                flush_time += time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        flushed += flush_session(session.session_uuid)
+        flush_time += time.perf_counter() - t0
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f"messages:          {total}")
+        self.stdout.write(f"persisted:         {flushed}")
+        self.stdout.write(f"append rate:       {total / append_time:,.0f} msg/s")
+        if flush_time:
+            self.stdout.write(f"flush rate:        {flushed / flush_time:,.0f} msg/s")
+        self.stdout.write(f"sustained rate:    {total / elapsed:,.0f} msg/s")
+
+        if not options["keep"]:
+            deleted, _ = ChatMessage.objects.filter(
+                streaming_session=session, id__gt=last_row_id
+            ).delete()
+            self.stdout.write(f"cleaned up {deleted} benchmark messages")
@@ -0,0 +1,27 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from streaming.chat_ingest import ChatIngestService
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the chat ingestion service: keeps the YouTube, Twitch and Facebook "
+        "chats of every live session open on one event loop and feeds them into "
+        "the session chat."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fake",
+            action="store_true",
+            help="Use local fake providers instead of the real platform APIs.",
+        )
+
+    def handle(self, *args, **options):
+        service = ChatIngestService(use_fake=options["fake"])
+        try:
+            asyncio.run(service.run())
+        except KeyboardInterrupt:
+            self.stdout.write("Chat ingestion stopped.")
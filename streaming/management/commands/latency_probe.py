@@ -0,0 +1,136 @@
+import itertools
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from streaming.models import StreamingConfiguration, StreamingPlatformAccount
+from streaming.probe import run_probe
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure glass-to-glass latency: publish frames with a timestamp drawn "
+        "into them, read them back from SRS and from a local RTMP sink fed by "
+        "a relay, and report latency percentiles per hop. Repeat --preset and "
+        "--relay-mode to compare every combination."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "stream_key",
+            help="Stream key of an active configuration to publish under.",
+        )
+        parser.add_argument("--ingest", choices=("rtmp", "webrtc"), default="rtmp")
+        parser.add_argument(
+            "--preset",
+            action="append",
+            help="x264 preset of the RTMP publisher (default veryfast).",
+        )
+        parser.add_argument(
+            "--tune", default="zerolatency", help="x264 tune; empty for none."
+        )
+        parser.add_argument(
+            "--relay-mode",
+            action="append",
+            choices=("copy", "transcode"),
+            help="Relay video by stream copy (default) or by re-encoding.",
+        )
+        parser.add_argument("--relay-preset", default="veryfast")
+        parser.add_argument("--duration", type=int, default=30)
+        parser.add_argument(
+            "--warmup",
+            type=int,
+            default=5,
+            help="Seconds of frames to ignore while every hop connects.",
+        )
+        parser.add_argument(
+            "--offer-url",
+            help="WebRTC offer endpoint (default: http://localhost:8000 + offer URL).",
+        )
+        parser.add_argument(
+            "--allow-destinations",
+            action="store_true",
+            help="Publish even though the key's owner has real destinations "
+            "configured, which SRS's on_publish hook will relay the probe to.",
+        )
+        parser.add_argument("--json", action="store_true")
+
+    def handle(self, *args, **options):
+        config = (
+            StreamingConfiguration.objects.filter(
+                stream_key=options["stream_key"], is_active=True
+            )
+            .select_related("user")
+            .first()
+        )
+        if config is None:
+            raise CommandError("No active configuration with that stream key")
+        has_destinations = StreamingPlatformAccount.objects.filter(
+            user=config.user, rtmp_url__isnull=False, stream_key__isnull=False
+        ).exists()
+        if has_destinations and not options["allow_destinations"]:
+            raise CommandError(
+                f"{config.user} has destinations configured; use a dedicated "
+                "probe account or pass --allow-destinations"
+            )
+
+        offer_url = options["offer_url"] or (
+            f"http://localhost:8000{reverse('streaming:offer')}"
+        )
+        presets = options["preset"] or ["veryfast"]
+        if options["ingest"] == "webrtc":
+            # The browser side always encodes VP8; x264 presets do not apply.
+            presets = ["-"]
+        relay_modes = options["relay_mode"] or ["copy"]
+
+        results = []
+        for preset, relay_mode in itertools.product(presets, relay_modes):
+            if not options["json"]:
+                self.stderr.write(
+                    f"Probing {options['ingest']} ingest, preset {preset}, "
+                    f"{relay_mode} relay for {options['duration']}s..."
+                )
+            result = run_probe(
+                config.stream_key,
+                ingest=options["ingest"],
+                preset=preset,
+                tune=options["tune"],
+                relay_mode=relay_mode,
+                relay_preset=options["relay_preset"],
+                duration=options["duration"],
+                warmup=options["warmup"],
+                offer_url=offer_url,
+            )
+            result.update(
+                ingest=options["ingest"], preset=preset, relay_mode=relay_mode
+            )
+            results.append(result)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(
+            f"{'ingest':<7} {'preset':<10} {'relay':<10} {'hop':<26} "
+            f"{'frames':>6} {'p50':>6} {'p90':>6} {'p99':>6} {'max':>6}"
+        )
+        for result in results:
+            prefix = (
+                f"{result['ingest']:<7} {result['preset']:<10} "
+                f"{result['relay_mode']:<10}"
+            )
+            for hop, stats in result["hops"].items():
+                if stats is None:
+                    self.stdout.write(f"{prefix} {hop:<26} {'no frames decoded':>34}")
+                    continue
+                self.stdout.write(
+                    f"{prefix} {hop:<26} {stats['frames']:>6} "
+                    + " ".join(f"{stats[p]:>6}" for p in ("p50", "p90", "p99", "max"))
+                )
+            if result["error"]:
+                self.stdout.write(f"{prefix} publisher error: {result['error']}")
+        self.stdout.write(
+            "Latencies in ms; frames sent per run: "
+            + ", ".join(str(result["frames_sent"]) for result in results)
+        )
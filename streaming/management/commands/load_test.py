@@ -0,0 +1,146 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from streaming.admission import PLAN_LIMITS
+from streaming.loadtest import (
+    LOADTEST_PLAN,
+    MAX_DESTINATIONS,
+    delete_fixtures,
+    run_load_test,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the streaming stack: start N synthetic ffmpeg publishers "
+        "through go_live and SRS, each relayed to M local sinks by the Celery "
+        "relay tasks, and report time-to-live, relay spawn times, failure "
+        "rates and host resource use. Needs the site, SRS (with its hooks "
+        "pointing at the site) and the Celery workers running."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--publishers", type=int, default=10)
+        parser.add_argument(
+            "--destinations",
+            type=int,
+            default=2,
+            help=f"Destinations per publisher (at most {MAX_DESTINATIONS}).",
+        )
+        parser.add_argument(
+            "--plan",
+            choices=sorted(PLAN_LIMITS),
+            default=LOADTEST_PLAN,
+            help="Subscription plan of the load-test users, whose destination "
+            "limit must allow --destinations.",
+        )
+        parser.add_argument(
+            "--ramp",
+            type=float,
+            default=1.0,
+            help="Seconds between publishers starting.",
+        )
+        parser.add_argument(
+            "--hold",
+            type=int,
+            default=60,
+            help="Seconds to keep every publisher live after the last one started.",
+        )
+        parser.add_argument("--base-url", default="http://localhost:8000")
+        parser.add_argument("--preset", default="veryfast")
+        parser.add_argument("--bitrate", default="2500k")
+        parser.add_argument(
+            "--sink-url",
+            help="Relay to this RTMP base URL instead of starting a local ffmpeg "
+            "sink per destination.",
+        )
+        parser.add_argument("--output", help="Also write the JSON report to this file.")
+        parser.add_argument(
+            "--keep",
+            action="store_true",
+            help="Keep the load-test users, sessions and accounts afterwards.",
+        )
+        parser.add_argument(
+            "--cleanup",
+            action="store_true",
+            help="Only delete what earlier (kept or interrupted) runs left behind.",
+        )
+
+    def handle(self, *args, **options):
+        if options["cleanup"]:
+            deleted = delete_fixtures()
+            self.stdout.write(f"Deleted {deleted} load-test objects")
+            return
+        if not 1 <= options["destinations"] <= MAX_DESTINATIONS:
+            raise CommandError(
+                f"--destinations must be between 1 and {MAX_DESTINATIONS}"
+            )
+        allowed = PLAN_LIMITS[options["plan"]]["destinations"]
+        if options["destinations"] > allowed:
+            raise CommandError(
+                f"The {options['plan']} plan admits at most {allowed} destinations"
+            )
+        if options["publishers"] < 1:
+            raise CommandError("--publishers must be at least 1")
+
+        report = run_load_test(
+            options["publishers"],
+            options["destinations"],
+            options["base_url"].rstrip("/"),
+            ramp=options["ramp"],
+            hold=options["hold"],
+            preset=options["preset"],
+            bitrate=options["bitrate"],
+            sink_url=options["sink_url"],
+            keep=options["keep"],
+            plan=options["plan"],
+        )
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+
+        params = report["parameters"]
+        self.stdout.write(
+            f"run {report['run']}: {params['publishers']} publishers x "
+            f"{params['destinations']} destinations, {report['duration']:.0f}s"
+        )
+        for key, label in (
+            ("go_live_seconds", "go_live response"),
+            ("time_to_live_seconds", "time to live"),
+            ("relay_spawn_seconds", "relay confirmed"),
+            ("sink_connect_seconds", "relay at sink"),
+            ("stop_live_seconds", "stop_live response"),
+        ):
+            stats = report[key]
+            if stats is None:
+                self.stdout.write(f"{label + ':':<20} no samples")
+                continue
+            self.stdout.write(
+                f"{label + ':':<20} p50 {stats['p50']:6.2f}s  "
+                f"p90 {stats['p90']:6.2f}s  p99 {stats['p99']:6.2f}s  "
+                f"max {stats['max']:6.2f}s  (n={stats['frames']})"
+            )
+        failures = report["failures"]
+        self.stdout.write(
+            "failures:           "
+            + ", ".join(f"{name} {count}" for name, count in failures.items())
+        )
+        self.stdout.write(
+            f"failure rate:       sessions {report['failure_rate']['sessions']:.1%}, "
+            f"relays {report['failure_rate']['relays']:.1%}"
+        )
+        for error in report["go_live_errors"]:
+            self.stdout.write(f"go_live error:      {error}")
+        host = report["host"]
+        if host:
+            self.stdout.write(
+                f"host cpu:           mean {host['cpu_percent']['mean']:.0f}%, "
+                f"max {host['cpu_percent']['max']:.0f}%"
+            )
+            self.stdout.write(
+                "host memory:        max "
+                f"{host['memory_used_bytes']['max'] / 2**30:.1f} GiB, "
+                f"load1 max {host['load1']['max']:.1f}, "
+                f"queued tasks max {host['queued_tasks']['max']}"
+            )
@@ -0,0 +1,65 @@
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand
+
+from streaming.moderation import TermMatcher
+
+
+def _word(rng, low=3, high=10):
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(low, high)))
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the chat moderation matcher: compile time for a banned-term "
+        "list and scan throughput over synthetic chat messages."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--terms", type=int, default=10000)
+        parser.add_argument("--messages", type=int, default=100000)
+        parser.add_argument(
+            "--hit-rate",
+            type=float,
+            default=0.01,
+            help="Fraction of messages that contain a banned term.",
+        )
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        terms = [
+            " ".join(_word(rng) for _ in range(rng.choice((1, 1, 1, 2))))
+            for _ in range(options["terms"])
+        ]
+        messages = []
+        for _ in range(options["messages"]):
+            words = [_word(rng, 2, 8) for _ in range(rng.randint(3, 25))]
+            if rng.random() < options["hit_rate"]:
+                words.insert(rng.randrange(len(words) + 1), rng.choice(terms))
+            messages.append(" ".join(words))
+
+        started = time.perf_counter()
+        matcher = TermMatcher(terms)
+        compile_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        hits = sum(1 for message in messages if matcher.search(message))
+        search_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for message in messages:
+            matcher.mask(message)
+        mask_time = time.perf_counter() - started
+
+        total_chars = sum(len(message) for message in messages)
+        self.stdout.write(f"terms:             {len(matcher)}")
+        self.stdout.write(f"compile time:      {compile_time * 1000:,.1f} ms")
+        self.stdout.write(f"messages:          {len(messages)} ({hits} with hits)")
+        self.stdout.write(
+            f"search rate:       {len(messages) / search_time:,.0f} msg/s, "
+            f"{total_chars / search_time / 1e6:,.2f} M chars/s"
+        )
+        self.stdout.write(f"mask rate:         {len(messages) / mask_time:,.0f} msg/s")
@@ -0,0 +1,341 @@
+"""
+Post-processing of uploaded recordings into something players handle well: a
+faststart MP4 (remuxed when the codecs allow, transcoded otherwise), its
+duration and keyframe times, a poster frame and a thumbnail sprite.
+
+Jobs run as process_video_task on the "media" Celery queue, whose worker runs
+at most one ffmpeg per MEDIA_FFMPEG_THREADS cores. Smaller uploads get a
+higher priority so a short clip is not stuck behind an hour-long stream, and
+uploads with the same content hash are only processed once.
+"""
+
+import hashlib
+import logging
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .models import ProcessedVideo
+from .recordings import probe
+from .uploads import store_file
+
+logger = logging.getLogger(__name__)
+
+# Threads one ffmpeg may use; run the media worker with a concurrency of
+# cores / MEDIA_FFMPEG_THREADS so jobs never oversubscribe the CPU.
+MEDIA_FFMPEG_THREADS = getattr(settings, "MEDIA_FFMPEG_THREADS", 2)
+MEDIA_PROCESSED_DIR = getattr(settings, "MEDIA_PROCESSED_DIR", "recordings/processed")
+MEDIA_PROCESSING_TIMEOUT = getattr(settings, "MEDIA_PROCESSING_TIMEOUT", 4 * 3600)
+# Uploads up to each size (MB) get the matching Celery priority; larger ones
+# get the last.
+MEDIA_PRIORITY_SIZES = getattr(settings, "MEDIA_PRIORITY_SIZES", [(100, 0), (1024, 3)])
+MEDIA_PRIORITY_LARGE = 6
+# About this many tiles per sprite, 160 px wide, in rows of SPRITE_COLUMNS.
+SPRITE_TILES = 100
+SPRITE_COLUMNS = 10
+SPRITE_WIDTH = 160
+
+# Codecs an MP4 can carry that every browser plays; anything else is
+# transcoded to H.264/AAC.
+_COPY_VIDEO = {"h264"}
+_COPY_AUDIO = {"aac", "mp3"}
+_HASH_BLOCK = 1024 * 1024
+
+
+class ProcessingError(Exception):
+    pass
+
+
+def priority_for(size):
+    for megabytes, priority in MEDIA_PRIORITY_SIZES:
+        if size <= megabytes * 1024 * 1024:
+            return priority
+    return MEDIA_PRIORITY_LARGE
+
+
+def enqueue(user, source_path, sha256=None, size=None):
+    """
+    Queue post-processing of the stored file `source_path` once the current
+    transaction commits. `sha256` is the content hash if the upload already
+    computed it; otherwise the job computes it first.
+    """
+    if size is None:
+        size = default_storage.size(source_path)
+    job = ProcessedVideo.objects.create(
+        user=user, source_path=source_path, sha256=sha256, priority=priority_for(size)
+    )
+    from .tasks import process_video_task
+
+    transaction.on_commit(
+        lambda: process_video_task.apply_async(args=[job.pk], priority=job.priority)
+    )
+    return job
+
+
+def _run(args, timeout=MEDIA_PROCESSING_TIMEOUT):
+    result = subprocess.run(args, capture_output=True, text=True, timeout=timeout)
+    if result.returncode != 0:
+        raise ProcessingError(f"{args[0]}: {result.stderr.strip()[-500:]}")
+    return result.stdout
+
+
+@contextmanager
+def _local_source(name):
+    """A local path to the stored file `name`, copied out of remote storage if need be."""
+    try:
+        path = default_storage.path(name)
+    except NotImplementedError:
+        path = None
+    if path is not None:
+        yield path
+        return
+    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(name)[1]) as copy:
+        with default_storage.open(name, "rb") as f:
+            shutil.copyfileobj(f, copy, _HASH_BLOCK)
+        copy.flush()
+        yield copy.name
+
+
+def _hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _can_copy(details):
+    video = [s for s in details["streams"] if s.get("codec_type") == "video"]
+    audio = [s for s in details["streams"] if s.get("codec_type") == "audio"]
+    return (
+        len(video) == 1
+        and video[0].get("codec_name") in _COPY_VIDEO
+        and all(s.get("codec_name") in _COPY_AUDIO for s in audio)
+    )
+
+
+def _to_mp4(source, output, copy):
+    codecs = (
+        ["-c", "copy"]
+        if copy
+        else [
+            "-c:v",
+            "libx264",
+            "-preset",
+            "veryfast",
+            "-crf",
+            "23",
+            "-pix_fmt",
+            "yuv420p",
+            "-c:a",
+            "aac",
+            "-b:a",
+            "160k",
+        ]
+    )
+    _run(
+        [
+            "ffmpeg",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-y",
+            "-i",
+            source,
+            "-map",
+            "0:v:0",
+            "-map",
+            "0:a?",
+            *codecs,
+            "-threads",
+            str(MEDIA_FFMPEG_THREADS),
+            "-movflags",
+            "+faststart",
+            output,
+        ]
+    )
+
+
+def _keyframes(path):
+    out = _run(
+        [
+            "ffprobe",
+            "-v",
+            "error",
+            "-select_streams",
+            "v:0",
+            "-skip_frame",
+            "nokey",
+            "-show_entries",
+            "frame=pts_time",
+            "-of",
+            "csv=p=0",
+            path,
+        ]
+    )
+    return [round(float(line), 3) for line in out.split() if line not in ("", "N/A")]
+
+
+def _poster(path, output, duration):
+    _run(
+        [
+            "ffmpeg",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-y",
+            "-ss",
+            f"{min(1.0, duration / 10):.3f}",
+            "-i",
+            path,
+            "-frames:v",
+            "1",
+            "-vf",
+            "scale=640:-2",
+            output,
+        ]
+    )
+
+
+def _sprite(path, output, duration):
+    """One image of SPRITE_TILES thumbnails; returns the seconds between them."""
+    interval = max(duration / SPRITE_TILES, 1.0)
+    rows = max(1, math.ceil(min(SPRITE_TILES, duration / interval) / SPRITE_COLUMNS))
+    _run(
+        [
+            "ffmpeg",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-y",
+            "-i",
+            path,
+            "-vf",
+            f"fps=1/{interval:.3f},scale={SPRITE_WIDTH}:-2,"
+            f"tile={SPRITE_COLUMNS}x{rows}",
+            "-frames:v",
+            "1",
+            "-threads",
+            str(MEDIA_FFMPEG_THREADS),
+            output,
+        ]
+    )
+    return interval
+
+
+_OUTPUTS = (
+    "file_path",
+    "poster_path",
+    "sprite_path",
+    "sprite_interval",
+    "duration",
+    "keyframes",
+    "codecs",
+)
+
+
+def _copy_outputs(job, original):
+    for field in _OUTPUTS:
+        setattr(job, field, getattr(original, field))
+
+
+def _claim(job_id):
+    """Mark a queued job as processing; None if another worker has it or it is done."""
+    with transaction.atomic():
+        job = (
+            ProcessedVideo.objects.select_for_update(skip_locked=True)
+            .filter(pk=job_id, status="queued")
+            .first()
+        )
+        if job is not None:
+            job.status = "processing"
+            job.save(update_fields=["status", "updated_at"])
+    return job
+
+
+def _original(job):
+    """The earliest other live job for the same content, if any."""
+    return (
+        ProcessedVideo.objects.filter(
+            sha256=job.sha256, status__in=["queued", "processing", "ready"]
+        )
+        .filter(pk__lt=job.pk)
+        .order_by("pk")
+        .first()
+    )
+
+
+def process_video(job_id):
+    """Run one post-processing job. Running it again does nothing."""
+    job = _claim(job_id)
+    if job is None:
+        return None
+    try:
+        with _local_source(job.source_path) as source:
+            if not job.sha256:
+                job.sha256 = _hash(source)
+                job.save(update_fields=["sha256", "updated_at"])
+            original = _original(job)
+            if original is not None:
+                # Same content as an earlier upload: share its outputs, which
+                # it copies here itself if it is still being processed.
+                job.duplicate_of = original
+                job.status = "duplicate"
+                job.save(update_fields=["duplicate_of", "status", "updated_at"])
+                original.refresh_from_db()
+                if original.status == "ready":
+                    _copy_outputs(job, original)
+                    job.save(update_fields=[*_OUTPUTS, "updated_at"])
+                return job
+            _process(job, source)
+    except Exception as e:
+        logger.error("Processing %s failed: %s", job.source_path, e)
+        job.status = "failed"
+        job.error_message = str(e)
+        job.save(update_fields=["status", "error_message", "updated_at"])
+        job.duplicates.update(status="failed", error_message=job.error_message)
+        return job
+
+    job.status = "ready"
+    job.error_message = None
+    job.save()
+    duplicates = list(job.duplicates.all())
+    for duplicate in duplicates:
+        _copy_outputs(duplicate, job)
+    ProcessedVideo.objects.bulk_update(duplicates, _OUTPUTS)
+    return job
+
+
+def _process(job, source):
+    details = probe(source)
+    prefix = f"{MEDIA_PROCESSED_DIR}/{job.sha256[:2]}/{job.sha256}"
+    with tempfile.TemporaryDirectory() as work:
+        video = os.path.join(work, "video.mp4")
+        _to_mp4(source, video, copy=_can_copy(details))
+        output = probe(video)
+        duration = output["duration"] or details["duration"]
+        job.keyframes = _keyframes(video)
+        poster = os.path.join(work, "poster.jpg")
+        _poster(video, poster, duration)
+        sprite = os.path.join(work, "sprite.jpg")
+        job.sprite_interval = _sprite(video, sprite, duration)
+
+        job.file_path = store_file(video, f"{prefix}/video.mp4")
+        job.poster_path = store_file(poster, f"{prefix}/poster.jpg")
+        job.sprite_path = store_file(sprite, f"{prefix}/sprite.jpg")
+    job.duration = timedelta(seconds=round(duration, 3))
+    job.codecs = output
+    logger.info(
+        "Processed %s into %s (%s)",
+        job.source_path,
+        job.file_path,
+        "remuxed" if _can_copy(details) else "transcoded",
+    )
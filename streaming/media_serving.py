@@ -0,0 +1,139 @@
+"""
+Access-checked serving of recordings and other uploaded media.
+
+Django only decides who may read a file and answers conditional requests; the
+bytes are sent by the front proxy when MEDIA_ACCEL_REDIRECT is set (nginx:
+X-Accel-Redirect to an internal location aliasing MEDIA_ROOT, which handles
+Range itself), e.g.
+
+    location /protected-media/ {
+        internal;
+        alias /app/media/;
+    }
+
+That is the way to run it in production. Without it, Django serves the file
+itself (single byte ranges with 206): under a WSGI server as a file object,
+which the server may sendfile(); under ASGI (how this site is deployed, for
+the Server-Sent Events endpoints) as an asynchronous iterator that reads one
+block at a time off the event loop, so a worker never holds more than a
+block of a file in memory.
+"""
+
+import asyncio
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db.models import Q
+from django.urls import reverse
+from django.utils.http import http_date, quote_etag
+
+from .models import ProcessedVideo, Recording, RecordingUpload, ScheduledVideo
+
+# URL prefix of the proxy's internal location for MEDIA_ROOT, or None to
+# serve from Django.
+MEDIA_ACCEL_REDIRECT = getattr(settings, "MEDIA_ACCEL_REDIRECT", None)
+# Browsers may reuse a file this long before revalidating it.
+MEDIA_CACHE_MAX_AGE = getattr(settings, "MEDIA_CACHE_MAX_AGE", 3600)
+
+# Bytes read at a time when Django serves a file under ASGI.
+MEDIA_BLOCK_SIZE = getattr(settings, "MEDIA_BLOCK_SIZE", 256 * 1024)
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def media_url(name):
+    """The access-checked URL of the stored file `name`."""
+    return reverse("streaming:serve_media", args=[name])
+
+
+def may_read(user, name):
+    """Whether `user` owns (or, as staff, may see) the stored file `name`."""
+    if user.is_staff:
+        return True
+    return (
+        ProcessedVideo.objects.filter(
+            Q(source_path=name)
+            | Q(file_path=name)
+            | Q(poster_path=name)
+            | Q(sprite_path=name),
+            user=user,
+        ).exists()
+        or RecordingUpload.objects.filter(user=user, file_path=name).exists()
+        or Recording.objects.filter(
+            session__configuration__user=user, file_path=name
+        ).exists()
+        or ScheduledVideo.objects.filter(user=user, video_file=name).exists()
+    )
+
+
+def file_validators(stat):
+    """Strong ETag and Last-Modified of a file, from its size and mtime."""
+    etag = quote_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+    return etag, int(stat.st_mtime)
+
+
+def byte_range(request, size, etag, last_modified):
+    """
+    The (start, end) inclusive byte range the request asks for, None for the
+    whole file, or False if the range cannot be satisfied. Multiple ranges,
+    and a range whose If-Range no longer matches, get the whole file.
+    """
+    header = request.headers.get("Range")
+    if not header:
+        return None
+    if_range = request.headers.get("If-Range")
+    if if_range and if_range not in (etag, http_date(last_modified)):
+        return None
+    match = _RANGE.match(header.replace(" ", ""))
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":
+        # The final `last` bytes.
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+class RangeFile:
+    """
+    `length` bytes of an open file from `start`. Reads stop at the end of the
+    range; fileno() stays available so a WSGI server can sendfile() it,
+    bounded by the response's Content-Length. Iterated asynchronously, it
+    yields MEDIA_BLOCK_SIZE blocks read in a thread.
+    """
+
+    def __init__(self, f, start, length):
+        f.seek(start)
+        self.name = f.name
+        self._file = f
+        self._remaining = length
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    async def __aiter__(self):
+        while data := await asyncio.to_thread(self.read, MEDIA_BLOCK_SIZE):
+            yield data
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def close(self):
+        self._file.close()
+
+
+def accel_path(name):
+    """The proxy-internal URI of storage name `name`, for X-Accel-Redirect."""
+    return MEDIA_ACCEL_REDIRECT.rstrip("/") + "/" + quote(name.lstrip("/"))
@@ -0,0 +1,275 @@
+import functools
+import logging
+import time
+
+import redis
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from .models import PLATFORM_CHOICES
+from .proc_accounting import prometheus_samples
+
+logger = logging.getLogger(__name__)
+
+# Metrics live in Redis so that web workers, Celery workers and relay threads
+# all feed the same series; a scrape is a handful of Redis reads.
+_COUNTERS_KEY = "prom:counters"
+_GAUGES_KEY = "prom:gauges"
+_GAUGE_EXPIRY_KEY = "prom:gauges:expiry"
+
+
+def _histogram_key(name):
+    return f"prom:hist:{name}"
+
+
+def _family_key(name):
+    return f"prom:family:{name}"
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help)
+METRICS = {
+    "streamlab_relays": ("gauge", "Relays of live sessions by state and platform."),
+    "streamlab_relay_restarts_total": (
+        "counter",
+        "Relay restarts queued, by platform and reason.",
+    ),
+    "streamlab_relay_admissions_total": (
+        "counter",
+        "Relay admission decisions, by subscription plan and outcome.",
+    ),
+    "streamlab_relay_anomalies_total": (
+        "counter",
+        "Relay anomalies detected on bitrate and speed, by platform and kind.",
+    ),
+    "streamlab_ffmpeg_cpu_seconds_total": (
+        "counter",
+        "CPU time used by a relay or ingest ffmpeg process.",
+    ),
+    "streamlab_ffmpeg_rss_bytes": (
+        "gauge",
+        "Resident memory of a relay or ingest ffmpeg process.",
+    ),
+    "streamlab_ffmpeg_io_bytes_total": (
+        "counter",
+        "Bytes read and written (network included) by an ffmpeg process.",
+    ),
+    "streamlab_host_relay_headroom": (
+        "gauge",
+        "Further relays of the current average cost a host has room for.",
+    ),
+    "streamlab_srs_api_request_duration_seconds": (
+        "histogram",
+        "Latency of SRS HTTP API calls, by endpoint.",
+    ),
+    "streamlab_srs_hook_duration_seconds": (
+        "histogram",
+        "Time spent handling SRS HTTP callbacks, by hook.",
+    ),
+    "streamlab_celery_queue_length": (
+        "gauge",
+        "Messages waiting in a Celery queue.",
+    ),
+    "streamlab_webrtc_ingest_fps": (
+        "gauge",
+        "Frames per second received from a WebRTC publisher.",
+    ),
+}
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return ",".join(
+        '{}="{}"'.format(
+            key,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for key, value in sorted(labels.items())
+    )
+
+
+def _series(name, labelstr, suffix=""):
+    return f"{name}{suffix}{{{labelstr}}}" if labelstr else f"{name}{suffix}"
+
+
+def _safely(func):
+    """Metrics must never break the code path they observe."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            logger.debug("Failed to record metric: %s", e)
+
+    return wrapper
+
+
+@_safely
+def inc(name, labels=None, amount=1):
+    get_redis_connection("default").hincrbyfloat(
+        _COUNTERS_KEY, f"{name}|{_labels(labels)}", amount
+    )
+
+
+@_safely
+def observe(name, value, labels=None):
+    """Add one observation (in seconds) to a latency histogram."""
+    labelstr = _labels(labels)
+    index = next(
+        (i for i, bound in enumerate(LATENCY_BUCKETS) if value <= bound),
+        len(LATENCY_BUCKETS),
+    )
+    key = _histogram_key(name)
+    pipe = get_redis_connection("default").pipeline(transaction=False)
+    pipe.hincrby(key, f"{labelstr}|{index}", 1)
+    pipe.hincrby(key, f"{labelstr}|count", 1)
+    pipe.hincrbyfloat(key, f"{labelstr}|sum", value)
+    pipe.execute()
+
+
+@_safely
+def set_gauge(name, value, labels=None, ttl=60):
+    """Set a gauge that disappears if it is not refreshed within `ttl` seconds."""
+    field = f"{name}|{_labels(labels)}"
+    pipe = get_redis_connection("default").pipeline(transaction=False)
+    pipe.hset(_GAUGES_KEY, field, value)
+    pipe.zadd(_GAUGE_EXPIRY_KEY, {field: time.time() + ttl})
+    pipe.execute()
+
+
+@_safely
+def set_family(name, samples, ttl=300):
+    """Replace every series of a gauge at once from (labels, value) pairs."""
+    key = _family_key(name)
+    pipe = get_redis_connection("default").pipeline(transaction=True)
+    pipe.delete(key)
+    mapping = {_labels(labels): value for labels, value in samples}
+    if mapping:
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, ttl)
+    pipe.execute()
+
+
+class timed:
+    """Decorator / context manager observing the wrapped call's duration."""
+
+    def __init__(self, name, labels=None):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self._started, self.labels)
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(self.name, self.labels):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+
+def _queue_lengths():
+    """LLEN of each relay_<platform> queue plus the default queue on the broker."""
+    queues = ["celery"] + [f"relay_{platform}" for platform, _ in PLATFORM_CHOICES]
+    try:
+        broker = redis.from_url(settings.CELERY_BROKER_URL, socket_timeout=1)
+        pipe = broker.pipeline(transaction=False)
+        for queue in queues:
+            pipe.llen(queue)
+        return dict(zip(queues, pipe.execute()))
+    except Exception as e:
+        logger.warning("Could not read Celery queue lengths: %s", e)
+        return {}
+
+
+def _format(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def render():
+    """The current metrics in the Prometheus text exposition format."""
+    conn = get_redis_connection("default")
+    now = time.time()
+    pipe = conn.pipeline(transaction=False)
+    pipe.zrangebyscore(_GAUGE_EXPIRY_KEY, "-inf", now)
+    pipe.hgetall(_COUNTERS_KEY)
+    pipe.hgetall(_GAUGES_KEY)
+    histogram_names = [n for n, (kind, _) in METRICS.items() if kind == "histogram"]
+    family_names = [n for n, (kind, _) in METRICS.items() if kind == "gauge"]
+    for name in histogram_names:
+        pipe.hgetall(_histogram_key(name))
+    for name in family_names:
+        pipe.hgetall(_family_key(name))
+    expired, counters, gauges, *rest = pipe.execute()
+    histograms = dict(zip(histogram_names, rest[: len(histogram_names)]))
+    families = dict(zip(family_names, rest[len(histogram_names) :]))
+
+    if expired:
+        pipe = conn.pipeline(transaction=False)
+        pipe.hdel(_GAUGES_KEY, *expired)
+        pipe.zrem(_GAUGE_EXPIRY_KEY, *expired)
+        pipe.execute()
+        expired = set(expired)
+
+    samples = {name: [] for name in METRICS}
+    for field, value in list(counters.items()) + [
+        item for item in gauges.items() if item[0] not in expired
+    ]:
+        name, _, labelstr = field.decode().partition("|")
+        if name in samples:
+            samples[name].append((_series(name, labelstr), value))
+    for name, series in families.items():
+        for labelstr, value in series.items():
+            samples[name].append((_series(name, labelstr.decode()), value))
+    for name, series in prometheus_samples().items():
+        for labels, value in series:
+            samples[name].append((_series(name, _labels(labels)), value))
+    for queue, length in _queue_lengths().items():
+        samples["streamlab_celery_queue_length"].append(
+            (
+                _series("streamlab_celery_queue_length", _labels({"queue": queue})),
+                length,
+            )
+        )
+
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "histogram":
+            lines.extend(_render_histogram(name, histograms[name]))
+            continue
+        for series, value in sorted(samples[name]):
+            lines.append(f"{series} {_format(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _render_histogram(name, raw):
+    by_labels = {}
+    for field, value in raw.items():
+        labelstr, _, part = field.decode().rpartition("|")
+        by_labels.setdefault(labelstr, {})[part] = value
+    lines = []
+    for labelstr, parts in sorted(by_labels.items()):
+        cumulative = 0
+        prefix = f"{labelstr}," if labelstr else ""
+        for index, bound in enumerate(LATENCY_BUCKETS + (float("inf"),)):
+            cumulative += int(parts.get(str(index), 0))
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'{name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+        lines.append(
+            f"{_series(name, labelstr, '_sum')} {_format(parts.get('sum', 0))}"
+        )
+        lines.append(
+            f"{_series(name, labelstr, '_count')} {int(parts.get('count', 0))}"
+        )
+    return lines
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.2 on 2026-10-19 17:18
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("streaming", "0005_streamingplatformaccount_is_active_and_more"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatmessage",
+            name="buffer_id",
+            field=models.CharField(
+                blank=True,
+                help_text="Redis stream entry id the message was buffered under",
+                max_length=32,
+                null=True,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="chatmessage",
+            name="created_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now,
+                help_text="Time when the message was created",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="chatmessage",
+            constraint=models.UniqueConstraint(
+                fields=("streaming_session", "buffer_id"),
+                name="unique_chat_message_buffer_id",
+            ),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.1.2 on 2026-10-19 17:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("streaming", "0006_chatmessage_buffer_id"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatmessage",
+            name="author_name",
+            field=models.CharField(
+                blank=True,
+                help_text="Display name of the author on the source platform",
+                max_length=255,
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="chatmessage",
+            name="external_id",
+            field=models.CharField(
+                blank=True,
+                help_text="Message id on the source platform",
+                max_length=255,
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="chatmessage",
+            name="platform",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("youtube", "YouTube"),
+                    ("facebook", "Facebook"),
+                    ("twitch", "Twitch"),
+                    ("instagram", "Instagram"),
+                    ("tiktok", "TikTok"),
+                    ("telegram", "Telegram"),
+                    ("custom", "Custom"),
+                ],
+                help_text="Source platform for ingested messages",
+                max_length=50,
+                null=True,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="chatmessage",
+            name="user",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="chat_messages",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="chatmessage",
+            constraint=models.UniqueConstraint(
+                fields=("streaming_session", "platform", "external_id"),
+                name="unique_chat_message_external_id",
+            ),
+        ),
+    ]
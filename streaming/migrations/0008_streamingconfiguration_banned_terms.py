@@ -0,0 +1,22 @@
+# Generated by Django 5.1.2 on 2026-10-19 17:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("streaming", "0007_chatmessage_platform_source"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="streamingconfiguration",
+            name="banned_terms",
+            field=models.TextField(
+                blank=True,
+                help_text="Chat moderation: one banned word or phrase per line",
+                null=True,
+            ),
+        ),
+    ]
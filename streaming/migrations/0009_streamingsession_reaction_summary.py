@@ -0,0 +1,22 @@
+# Generated by Django 5.1.2 on 2026-10-19 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("streaming", "0008_streamingconfiguration_banned_terms"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="streamingsession",
+            name="reaction_summary",
+            field=models.JSONField(
+                blank=True,
+                help_text="Reaction totals and coarse time series, rolled up when the session ends",
+                null=True,
+            ),
+        ),
+    ]
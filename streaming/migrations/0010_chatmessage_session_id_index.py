@@ -0,0 +1,21 @@
+# Generated by Django 5.1.2 on 2026-10-19 17:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("streaming", "0009_streamingsession_reaction_summary"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="chatmessage",
+            index=models.Index(
+                fields=["streaming_session", "id"], name="chat_message_session_id_idx"
+            ),
+        ),
+    ]
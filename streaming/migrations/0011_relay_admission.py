@@ -0,0 +1,37 @@
+# Generated by Django 5.1.2 on 2026-10-19 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("streaming", "0010_chatmessage_session_id_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="streamingrelaystatus",
+            name="host",
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="streamingrelaystatus",
+            name="transcode_kbps",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="streamingrelaystatus",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("success", "Success"),
+                    ("error", "Error"),
+                    ("rejected", "Rejected"),
+                ],
+                default="pending",
+                max_length=20,
+            ),
+        ),
+    ]
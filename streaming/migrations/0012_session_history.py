@@ -0,0 +1,48 @@
+# Generated by Django 5.1.2 on 2026-10-19 18:04
+
+from django.db import migrations, models
+from django.db.models import ExpressionWrapper, F
+
+
+def backfill_durations(apps, schema_editor):
+    StreamingSession = apps.get_model("streaming", "StreamingSession")
+    StreamingSession.objects.filter(
+        session_end__isnull=False, duration__isnull=True
+    ).update(
+        duration=ExpressionWrapper(
+            F("session_end") - F("session_start"),
+            output_field=models.DurationField(),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("streaming", "0011_relay_admission"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="streamingsession",
+            name="duration",
+            field=models.DurationField(
+                blank=True, help_text="Set when the session ends", null=True
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="streamingsession",
+            index=models.Index(
+                fields=["configuration", "status", "-session_end", "-id"],
+                name="session_config_end_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="streamingsession",
+            index=models.Index(
+                fields=["configuration", "-session_start", "-id"],
+                name="session_config_start_idx",
+            ),
+        ),
+        migrations.RunPython(backfill_durations, migrations.RunPython.noop),
+    ]
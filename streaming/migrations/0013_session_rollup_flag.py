@@ -0,0 +1,28 @@
+# Generated by Django 5.1.2 on 2026-10-19 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("streaming", "0012_session_history"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="streamingsession",
+            name="analytics_rolled_up",
+            field=models.BooleanField(
+                default=False, help_text="Counted in the dashboard's daily rollups"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="streamingsession",
+            index=models.Index(
+                condition=models.Q(("analytics_rolled_up", False)),
+                fields=["session_end"],
+                name="session_rollup_pending_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.2 on 2026-10-19 18:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("streaming", "0014_recording_upload"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recordingupload",
+            name="live",
+            field=models.BooleanField(
+                default=False,
+                help_text="Appended to while recording; finalized as is if the recorder goes away",
+            ),
+        ),
+    ]
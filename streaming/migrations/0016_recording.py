@@ -0,0 +1,77 @@
+# Generated by Django 5.1.2 on 2026-10-19 18:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("streaming", "0015_recording_upload_live"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Recording",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("recording", "Recording"),
+                            ("processing", "Processing"),
+                            ("ready", "Ready"),
+                            ("failed", "Failed"),
+                        ],
+                        default="recording",
+                        max_length=20,
+                    ),
+                ),
+                ("segments", models.JSONField(default=list)),
+                ("duration", models.DurationField(blank=True, null=True)),
+                (
+                    "size",
+                    models.PositiveBigIntegerField(
+                        default=0, help_text="Bytes of the segments, then of the VOD"
+                    ),
+                ),
+                (
+                    "codecs",
+                    models.JSONField(
+                        blank=True,
+                        help_text="Container and stream details from ffprobe",
+                        null=True,
+                    ),
+                ),
+                (
+                    "file_path",
+                    models.CharField(
+                        blank=True,
+                        help_text="Storage name of the VOD",
+                        max_length=500,
+                        null=True,
+                    ),
+                ),
+                ("error_message", models.TextField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "session",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="recording",
+                        to="streaming.streamingsession",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.1.2 on 2026-10-19 21:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_users(apps, schema_editor):
+    StreamingSession = apps.get_model("streaming", "StreamingSession")
+    StreamingConfiguration = apps.get_model("streaming", "StreamingConfiguration")
+    StreamingSession.objects.filter(user__isnull=True).update(
+        user=Subquery(
+            StreamingConfiguration.objects.filter(
+                pk=OuterRef("configuration_id")
+            ).values("user_id")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("streaming", "0017_processed_video"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="streamingsession",
+            name="user",
+            field=models.ForeignKey(
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="streaming_sessions",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.RunPython(backfill_users, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="streamingsession",
+            name="user",
+            field=models.ForeignKey(
+                editable=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="streaming_sessions",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.RemoveIndex(
+            model_name="streamingsession",
+            name="session_config_end_idx",
+        ),
+        migrations.AddIndex(
+            model_name="streamingsession",
+            index=models.Index(
+                fields=["user", "status", "-session_end", "-id"],
+                name="session_user_end_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="streamingsession",
+            index=models.Index(
+                fields=["user", "-session_start", "-id"],
+                name="session_user_start_idx",
+            ),
+        ),
+    ]
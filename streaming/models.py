@@ -2,6 +2,7 @@ from django.db import models
 from django.conf import settings
 from django.core.validators import RegexValidator
 import uuid
+from datetime import timedelta
 from django.utils import timezone
 
 # Regex to validate URLs starting with http, https, rtmp, rtmps, or ftp.
@@ -76,6 +77,11 @@ class StreamingConfiguration(models.Model):
         help_text="URL to embed multi-platform chat",
         validators=[rtmp_url_validator],
     )
+    banned_terms = models.TextField(
+        blank=True,
+        null=True,
+        help_text="Chat moderation: one banned word or phrase per line",
+    )
     resolution = models.CharField(max_length=50, default="1080p")
     bitrate = models.CharField(max_length=50, default="4500kbps")
     is_active = models.BooleanField(
@@ -100,18 +106,65 @@ class StreamingSession(models.Model):
     configuration = models.ForeignKey(
         StreamingConfiguration, on_delete=models.CASCADE, related_name="sessions"
     )
+    # The configuration's owner, copied so a user's history across all their
+    # configurations can be paged from one index.
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="streaming_sessions",
+        editable=False,
+    )
     session_uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     session_start = models.DateTimeField(auto_now_add=True)
     session_end = models.DateTimeField(blank=True, null=True)
+    duration = models.DurationField(
+        blank=True, null=True, help_text="Set when the session ends"
+    )
     status = models.CharField(max_length=50, choices=STATUS_CHOICES, default="live")
     viewers_count = models.PositiveIntegerField(default=0)
     error_message = models.TextField(
         blank=True, null=True, help_text="Error details if session encounters issues"
     )
+    reaction_summary = models.JSONField(
+        blank=True,
+        null=True,
+        help_text="Reaction totals and coarse time series, rolled up when the session ends",
+    )
+    analytics_rolled_up = models.BooleanField(
+        default=False, help_text="Counted in the dashboard's daily rollups"
+    )
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of a user's history, newest first.
+            models.Index(
+                fields=["user", "status", "-session_end", "-id"],
+                name="session_user_end_idx",
+            ),
+            models.Index(
+                fields=["user", "-session_start", "-id"],
+                name="session_user_start_idx",
+            ),
+            models.Index(
+                fields=["configuration", "-session_start", "-id"],
+                name="session_config_start_idx",
+            ),
+            # Ended sessions the analytics rollup has yet to count.
+            models.Index(
+                fields=["session_end"],
+                condition=models.Q(analytics_rolled_up=False),
+                name="session_rollup_pending_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"Session {self.session_uuid} for {self.configuration.stream_title} - {self.status}"
 
+    def save(self, *args, **kwargs):
+        if self.user_id is None:
+            self.user_id = self.configuration.user_id
+        super().save(*args, **kwargs)
+
     def end_session(self, mark_error=False, error_message=None):
         if mark_error:
             self.status = "error"
@@ -120,6 +173,9 @@ class StreamingSession(models.Model):
         else:
             self.status = "ended"
         self.session_end = timezone.now()
+        self.duration = timedelta(
+            seconds=int((self.session_end - self.session_start).total_seconds())
+        )
         self.save()
 
 
@@ -144,16 +200,67 @@ class ChatMessage(models.Model):
         blank=True,
         null=True,
     )
+    # Empty for messages ingested from an external platform chat.
     user = models.ForeignKey(
-        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="chat_messages"
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="chat_messages",
+        blank=True,
+        null=True,
+    )
+    platform = models.CharField(
+        max_length=50,
+        choices=PLATFORM_CHOICES,
+        blank=True,
+        null=True,
+        help_text="Source platform for ingested messages",
+    )
+    author_name = models.CharField(
+        max_length=255,
+        blank=True,
+        null=True,
+        help_text="Display name of the author on the source platform",
+    )
+    external_id = models.CharField(
+        max_length=255,
+        blank=True,
+        null=True,
+        help_text="Message id on the source platform",
     )
     text = models.TextField(help_text="The content of the chat message")
+    # Set explicitly by the chat buffer flusher, so this must not be auto_now_add.
     created_at = models.DateTimeField(
-        auto_now_add=True, help_text="Time when the message was created"
+        default=timezone.now, help_text="Time when the message was created"
+    )
+    buffer_id = models.CharField(
+        max_length=32,
+        blank=True,
+        null=True,
+        help_text="Redis stream entry id the message was buffered under",
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["streaming_session", "buffer_id"],
+                name="unique_chat_message_buffer_id",
+            ),
+            models.UniqueConstraint(
+                fields=["streaming_session", "platform", "external_id"],
+                name="unique_chat_message_external_id",
+            ),
+        ]
+        indexes = [
+            # Keyset pagination over a session's history (exports, backfill).
+            models.Index(
+                fields=["streaming_session", "id"],
+                name="chat_message_session_id_idx",
+            ),
+        ]
+
     def __str__(self):
-        return f"{self.user.username}: {self.text[:30]}"
+        author = self.user.username if self.user else self.author_name
+        return f"{author}: {self.text[:30]}"
 
 
 class StreamingPlatformAccount(models.Model):
@@ -195,7 +302,7 @@ class StreamingPlatformAccount(models.Model):
         return f"{self.user.username} - {self.platform} ({self.account_username or 'No Username'})"
 
 
-class StreamingRelayStatus(models.Model): 
+class StreamingRelayStatus(models.Model):
     session = models.ForeignKey(
         StreamingSession, on_delete=models.CASCADE, related_name="relay_statuses"
     )
@@ -203,11 +310,151 @@ class StreamingRelayStatus(models.Model):
     rtmp_url = models.URLField()
     status = models.CharField(
         max_length=20,
-        choices=[("pending", "Pending"), ("success", "Success"), ("error", "Error")],
+        choices=[
+            ("pending", "Pending"),
+            ("success", "Success"),
+            ("error", "Error"),
+            ("rejected", "Rejected"),
+        ],
         default="pending",
     )
     last_attempted = models.DateTimeField(auto_now=True)
     log_summary = models.TextField(blank=True, null=True)
+    # Set when the relay re-encodes video to fit the plan's bitrate cap.
+    transcode_kbps = models.PositiveIntegerField(blank=True, null=True)
+    # Host of the worker the relay was placed on.
+    host = models.CharField(max_length=255, blank=True, null=True)
 
     def __str__(self):
         return f"Relay status for {self.platform} - {self.status}"
+
+
+class RecordingUpload(models.Model):
+    """
+    A resumable upload of a studio recording. Chunks are appended in order to
+    a partial file (see streaming/uploads.py), which finalizing moves into
+    recordings/.
+    """
+
+    STATUS_CHOICES = [
+        ("open", "Open"),
+        ("complete", "Complete"),
+    ]
+    upload_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="recording_uploads",
+    )
+    session = models.ForeignKey(
+        StreamingSession,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name="recording_uploads",
+    )
+    filename = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="open")
+    live = models.BooleanField(
+        default=False,
+        help_text="Appended to while recording; finalized as is if the recorder goes away",
+    )
+    # Bytes and chunks received so far; the next chunk must be number `chunks`.
+    size = models.PositiveBigIntegerField(default=0)
+    chunks = models.PositiveIntegerField(default=0)
+    file_path = models.CharField(
+        max_length=500, blank=True, null=True, help_text="Storage name once complete"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Upload {self.upload_id} of {self.filename} - {self.status}"
+
+
+class Recording(models.Model):
+    """
+    Server-side recording of a session: the segments SRS wrote while it was
+    live (DVR or HLS, reported by its on_dvr/on_hls hooks), and once it has
+    ended, the single VOD they were remuxed into (see streaming/recordings.py).
+    """
+
+    STATUS_CHOICES = [
+        ("recording", "Recording"),
+        ("processing", "Processing"),
+        ("ready", "Ready"),
+        ("failed", "Failed"),
+    ]
+    session = models.OneToOneField(
+        StreamingSession, on_delete=models.CASCADE, related_name="recording"
+    )
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default="recording"
+    )
+    # [{"path": ..., "size": bytes, "duration": seconds or null}, ...] in order
+    segments = models.JSONField(default=list)
+    duration = models.DurationField(blank=True, null=True)
+    size = models.PositiveBigIntegerField(
+        default=0, help_text="Bytes of the segments, then of the VOD"
+    )
+    codecs = models.JSONField(
+        blank=True, null=True, help_text="Container and stream details from ffprobe"
+    )
+    file_path = models.CharField(
+        max_length=500, blank=True, null=True, help_text="Storage name of the VOD"
+    )
+    error_message = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Recording of {self.session.session_uuid} - {self.status}"
+
+
+class ProcessedVideo(models.Model):
+    """
+    Post-processing of an uploaded recording (see streaming/media_processing.py):
+    a faststart MP4, its duration and keyframe times, a poster frame and a
+    thumbnail sprite. Identical uploads, by content hash, are processed once.
+    """
+
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("processing", "Processing"),
+        ("ready", "Ready"),
+        ("duplicate", "Duplicate"),
+        ("failed", "Failed"),
+    ]
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="processed_videos",
+    )
+    source_path = models.CharField(max_length=500, help_text="Storage name")
+    sha256 = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+    # Celery priority: 0 runs first.
+    priority = models.PositiveSmallIntegerField(default=5)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="queued")
+    duplicate_of = models.ForeignKey(
+        "self",
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name="duplicates",
+    )
+    file_path = models.CharField(max_length=500, blank=True, null=True)
+    poster_path = models.CharField(max_length=500, blank=True, null=True)
+    sprite_path = models.CharField(max_length=500, blank=True, null=True)
+    # Seconds between sprite tiles; tiles run left to right, top to bottom.
+    sprite_interval = models.FloatField(blank=True, null=True)
+    duration = models.DurationField(blank=True, null=True)
+    keyframes = models.JSONField(
+        blank=True, null=True, help_text="Keyframe times in seconds, for seeking"
+    )
+    codecs = models.JSONField(blank=True, null=True)
+    error_message = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Processing of {self.source_path} - {self.status}"
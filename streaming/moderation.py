@@ -0,0 +1,195 @@
+import logging
+import time
+from collections import deque
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from .models import StreamingConfiguration
+
+logger = logging.getLogger(__name__)
+
+# "mask" replaces banned terms with asterisks, "block" drops the whole message.
+CHAT_MODERATION_ACTION = getattr(settings, "CHAT_MODERATION_ACTION", "mask")
+# Compiled matchers re-check their version stamp at most this often, which is
+# how long a changed term list takes to reach every worker.
+CHAT_MODERATION_RELOAD_INTERVAL = getattr(
+    settings, "CHAT_MODERATION_RELOAD_INTERVAL", 5
+)
+
+
+def _version_key(config_id):
+    return f"moderation:version:{config_id}"
+
+
+class TermMatcher:
+    """
+    Aho-Corasick automaton over a list of banned terms. Built once, then each
+    text is scanned in a single pass regardless of how many terms there are.
+    """
+
+    def __init__(self, terms, whole_words=True):
+        self.whole_words = whole_words
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        self.term_count = 0
+        for term in terms:
+            term = term.strip().lower()
+            if term:
+                self._add(term)
+        self._build()
+
+    def __len__(self):
+        return self.term_count
+
+    def _add(self, term):
+        state = 0
+        for ch in term:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = nxt
+        if not self._out[state]:
+            self._out[state] = (len(term),)
+            self.term_count += 1
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = fail
+                # Fold outputs of the fail chain in, so matching never walks it.
+                if self._out[fail]:
+                    self._out[nxt] = self._out[nxt] + self._out[fail]
+
+    def _is_boundary(self, text, start, end):
+        return (start == 0 or not text[start - 1].isalnum()) and (
+            end == len(text) or not text[end].isalnum()
+        )
+
+    def finditer(self, text):
+        """Yield (start, end) spans of banned terms found in `text`."""
+        lowered = text.lower()
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, ch in enumerate(lowered):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                for length in out[state]:
+                    start = i - length + 1
+                    if not self.whole_words or self._is_boundary(lowered, start, i + 1):
+                        yield start, i + 1
+
+    def search(self, text):
+        return next(self.finditer(text), None) is not None
+
+    def mask(self, text):
+        """Replace every banned term with asterisks of the same length."""
+        spans = list(self.finditer(text))
+        if not spans:
+            return text
+        if len(text.lower()) != len(text):
+            # Rare case folding that changes length; mask on the folded text.
+            text = text.lower()
+        chars = list(text)
+        for start, end in spans:
+            chars[start:end] = "*" * (end - start)
+        return "".join(chars)
+
+
+class _CompiledEntry:
+    __slots__ = ("matcher", "version", "checked_at")
+
+    def __init__(self, matcher, version, checked_at):
+        self.matcher = matcher
+        self.version = version
+        self.checked_at = checked_at
+
+
+# Per-process caches: session uuid -> configuration id (never changes) and
+# configuration id -> compiled matcher with the version it was built from.
+_session_configs = {}
+_compiled = {}
+
+
+def bump_version(config_id):
+    """Tell every worker to recompile this configuration's matcher."""
+    get_redis_connection("default").incr(_version_key(config_id))
+
+
+def _config_id_for_session(session_uuid):
+    session_uuid = str(session_uuid)
+    config_id = _session_configs.get(session_uuid)
+    if config_id is None:
+        config_id = (
+            StreamingConfiguration.objects.filter(sessions__session_uuid=session_uuid)
+            .values_list("id", flat=True)
+            .first()
+        )
+        if config_id is not None:
+            _session_configs[session_uuid] = config_id
+    return config_id
+
+
+def get_matcher(config_id):
+    """The compiled matcher for a configuration, or None if it bans nothing."""
+    now = time.monotonic()
+    entry = _compiled.get(config_id)
+    if entry and now - entry.checked_at < CHAT_MODERATION_RELOAD_INTERVAL:
+        return entry.matcher
+
+    version = get_redis_connection("default").get(_version_key(config_id))
+    if entry and entry.version == version:
+        entry.checked_at = now
+        return entry.matcher
+
+    terms = (
+        StreamingConfiguration.objects.filter(id=config_id)
+        .values_list("banned_terms", flat=True)
+        .first()
+    )
+    started = time.perf_counter()
+    matcher = TermMatcher(terms.splitlines()) if terms else None
+    if matcher is not None:
+        logger.info(
+            "Compiled %d banned terms for configuration %s in %.1f ms",
+            len(matcher),
+            config_id,
+            (time.perf_counter() - started) * 1000,
+        )
+    _compiled[config_id] = _CompiledEntry(matcher, version, now)
+    return matcher
+
+
+def moderate_messages(session_uuid, messages):
+    """
+    Apply the channel's banned-term list to chat messages about to be buffered.
+    Returns the messages to keep (masked in "mask" mode) in their original order.
+    """
+    config_id = _config_id_for_session(session_uuid)
+    matcher = get_matcher(config_id) if config_id is not None else None
+    if matcher is None:
+        return messages
+
+    kept = []
+    for message in messages:
+        if CHAT_MODERATION_ACTION == "block":
+            if matcher.search(message["text"]):
+                continue
+        else:
+            message = dict(message, text=matcher.mask(message["text"]))
+        kept.append(message)
+    return kept
@@ -0,0 +1,393 @@
+import asyncio
+import logging
+import socket
+import subprocess
+import threading
+import time
+import zlib
+
+import requests
+from aiortc import RTCPeerConnection, RTCSessionDescription, VideoStreamTrack
+from av import VideoFrame
+from django.conf import settings
+
+from .relay_watch import relay_command, watch_relay
+
+logger = logging.getLogger(__name__)
+
+# Probe frames have the size and rate the WebRTC ingest re-encodes at, so the
+# same frames can be sent down either ingest path.
+PROBE_WIDTH, PROBE_HEIGHT = 1280, 720
+PROBE_FPS = 30
+# Readers scale frames down before decoding; the code survives that easily and
+# it keeps the Python side cheap.
+DECODE_WIDTH, DECODE_HEIGHT = 160, 90
+
+# The timestamp is drawn as a grid of black and white cells: 40 bits of Unix
+# time in milliseconds (wrapping every ~35 years) and an 8-bit check so that a
+# frame smeared by the encoder is rejected rather than misread.
+GRID_COLUMNS, GRID_ROWS = 8, 6
+TIMESTAMP_BITS = 40
+_CHECK_BITS = GRID_COLUMNS * GRID_ROWS - TIMESTAMP_BITS
+_TIMESTAMP_MASK = (1 << TIMESTAMP_BITS) - 1
+# Video-range luma, so nothing is clipped on the way through YUV.
+_BLACK, _WHITE = 16, 235
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def _check(ms):
+    return zlib.crc32(ms.to_bytes(5, "big")) & ((1 << _CHECK_BITS) - 1)
+
+
+def timestamp_frame(ms, width=PROBE_WIDTH, height=PROBE_HEIGHT):
+    """A grayscale (luma-only) frame with `ms` encoded into it."""
+    ms &= _TIMESTAMP_MASK
+    value = (ms << _CHECK_BITS) | _check(ms)
+    cells = GRID_COLUMNS * GRID_ROWS
+    bits = [(value >> (cells - 1 - i)) & 1 for i in range(cells)]
+    cell_width, cell_height = width // GRID_COLUMNS, height // GRID_ROWS
+    black, white = bytes([_BLACK]), bytes([_WHITE])
+
+    rows = []
+    for row in range(GRID_ROWS):
+        line = b"".join(
+            (white if bit else black) * cell_width
+            for bit in bits[row * GRID_COLUMNS : (row + 1) * GRID_COLUMNS]
+        )
+        rows.append(line.ljust(width, black) * cell_height)
+    return b"".join(rows).ljust(width * height, black)
+
+
+def read_timestamp(plane, width=DECODE_WIDTH, height=DECODE_HEIGHT):
+    """The timestamp in a decoded grayscale frame, or None if it does not check."""
+    value = 0
+    for i in range(GRID_COLUMNS * GRID_ROWS):
+        row, column = divmod(i, GRID_COLUMNS)
+        x = int((column + 0.5) * width / GRID_COLUMNS)
+        y = int((row + 0.5) * height / GRID_ROWS)
+        # The centre pixel and its horizontal neighbours, away from cell edges.
+        level = sum(plane[y * width + x - 1 : y * width + x + 2])
+        value = (value << 1) | (level > 3 * (_BLACK + _WHITE) // 2)
+    ms = value >> _CHECK_BITS
+    if value & ((1 << _CHECK_BITS) - 1) != _check(ms):
+        return None
+    return ms
+
+
+def elapsed_ms(stamp, at):
+    """Milliseconds from a frame's (wrapped) timestamp to the wall-clock `at`."""
+    return (at - stamp) & _TIMESTAMP_MASK
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class RTMPPublisher:
+    """
+    Publishes timestamp frames to an RTMP URL, the way OBS or the local studio
+    would: frames are stamped when handed to the encoder, so encoding counts
+    towards the measured latency. A silent audio track is muxed in because
+    relays copy audio.
+    """
+
+    def __init__(self, target, preset="veryfast", tune="zerolatency", fps=PROBE_FPS):
+        self.target = target
+        self.preset = preset
+        self.tune = tune
+        self.fps = fps
+        self.frames_sent = 0
+        self._process = None
+        self._stopped = threading.Event()
+
+    def command(self):
+        return [
+            "ffmpeg",
+            "-loglevel",
+            "error",
+            "-f",
+            "rawvideo",
+            "-pix_fmt",
+            "gray",
+            "-s",
+            f"{PROBE_WIDTH}x{PROBE_HEIGHT}",
+            "-r",
+            str(self.fps),
+            "-i",
+            "-",
+            "-re",
+            "-f",
+            "lavfi",
+            "-i",
+            "anullsrc=r=44100:cl=stereo",
+            "-c:v",
+            "libx264",
+            "-preset",
+            self.preset,
+            *(["-tune", self.tune] if self.tune else []),
+            "-g",
+            str(self.fps * 2),
+            "-pix_fmt",
+            "yuv420p",
+            "-c:a",
+            "aac",
+            "-f",
+            "flv",
+            self.target,
+        ]
+
+    def start(self):
+        self._process = subprocess.Popen(
+            self.command(),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        threading.Thread(target=self._feed, name="probe-publisher", daemon=True).start()
+        return self
+
+    def _feed(self):
+        interval = 1 / self.fps
+        due = time.monotonic()
+        try:
+            while not self._stopped.is_set():
+                self._process.stdin.write(timestamp_frame(now_ms()))
+                self.frames_sent += 1
+                due += interval
+                time.sleep(max(0, due - time.monotonic()))
+        except (BrokenPipeError, ValueError):
+            logger.warning("Probe publisher to %s exited early", self.target)
+
+    def stop(self):
+        self._stopped.set()
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait()
+
+
+class _TimestampTrack(VideoStreamTrack):
+    _chroma = bytes([128]) * (PROBE_WIDTH // 2 * PROBE_HEIGHT // 2)
+
+    def __init__(self, publisher):
+        super().__init__()
+        self.publisher = publisher
+
+    async def recv(self):
+        pts, time_base = await self.next_timestamp()
+        frame = VideoFrame(PROBE_WIDTH, PROBE_HEIGHT, "yuv420p")
+        frame.planes[0].update(timestamp_frame(now_ms()))
+        frame.planes[1].update(self._chroma)
+        frame.planes[2].update(self._chroma)
+        frame.pts, frame.time_base = pts, time_base
+        self.publisher.frames_sent += 1
+        return frame
+
+
+class WebRTCPublisher:
+    """
+    Publishes timestamp frames through the WebRTC `offer` endpoint, so the
+    measurement includes the browser-side encode, the peer connection and the
+    server's re-encode into SRS.
+    """
+
+    def __init__(self, offer_url, stream_key):
+        self.offer_url = offer_url
+        self.stream_key = stream_key
+        self.frames_sent = 0
+        self.error = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=asyncio.run, args=(self._run(),), name="probe-webrtc", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    async def _run(self):
+        pc = RTCPeerConnection()
+        try:
+            pc.addTrack(_TimestampTrack(self))
+            await pc.setLocalDescription(await pc.createOffer())
+            response = await asyncio.to_thread(
+                requests.post,
+                self.offer_url,
+                params={"stream_key": self.stream_key},
+                json={"sdp": pc.localDescription.sdp, "type": pc.localDescription.type},
+                timeout=10,
+            )
+            answer = response.json()
+            if answer.get("status") != "success":
+                raise RuntimeError(answer.get("message", response.status_code))
+            await pc.setRemoteDescription(
+                RTCSessionDescription(sdp=answer["sdp"], type=answer["type"])
+            )
+            while not self._stopped.is_set():
+                await asyncio.sleep(0.2)
+        except Exception as e:
+            self.error = str(e)
+            logger.error("WebRTC probe publisher failed: %s", e)
+        finally:
+            await pc.close()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+class TimestampReader:
+    """
+    Plays an RTMP stream (or, with listen=True, accepts one pushed to it, like
+    a destination would) and records when each timestamp was first seen.
+    Every reader adds the same small decode delay, so it cancels out of the
+    difference between two hops.
+    """
+
+    def __init__(self, source, listen=False):
+        self.source = source
+        self.listen = listen
+        self.arrivals = {}
+        self.unreadable = 0
+        self._process = None
+
+    def start(self):
+        self._process = subprocess.Popen(
+            [
+                "ffmpeg",
+                "-loglevel",
+                "error",
+                "-fflags",
+                "nobuffer",
+                "-flags",
+                "low_delay",
+                *(["-listen", "1"] if self.listen else []),
+                "-i",
+                self.source,
+                "-an",
+                "-vf",
+                f"scale={DECODE_WIDTH}:{DECODE_HEIGHT}",
+                "-pix_fmt",
+                "gray",
+                "-f",
+                "rawvideo",
+                "pipe:1",
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        threading.Thread(target=self._read, name="probe-reader", daemon=True).start()
+        return self
+
+    def _read(self):
+        size = DECODE_WIDTH * DECODE_HEIGHT
+        while True:
+            plane = self._process.stdout.read(size)
+            arrived = now_ms()
+            if len(plane) < size:
+                break
+            stamp = read_timestamp(plane)
+            if stamp is None:
+                self.unreadable += 1
+            else:
+                # The output may repeat a frame; only its first arrival counts.
+                self.arrivals.setdefault(stamp, arrived)
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait()
+
+
+def start_relay(source, target, mode="copy", preset="veryfast"):
+    """Run the production relay command from `source` to `target`."""
+    video_args = ("-c:v", "copy")
+    if mode == "transcode":
+        video_args = ("-c:v", "libx264", "-preset", preset, "-tune", "zerolatency")
+    process = subprocess.Popen(
+        relay_command(source, target, video_args),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    watch_relay(process)
+    return process
+
+
+def percentiles(values, points=(50, 90, 99)):
+    """Nearest-rank percentiles plus the maximum; None for an empty sample."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    result = {
+        f"p{point}": ordered[min(len(ordered) - 1, len(ordered) * point // 100)]
+        for point in points
+    }
+    result["max"] = ordered[-1]
+    result["frames"] = len(ordered)
+    return result
+
+
+def run_probe(
+    stream_key,
+    ingest="rtmp",
+    preset="veryfast",
+    tune="zerolatency",
+    relay_mode="copy",
+    relay_preset="veryfast",
+    duration=30,
+    warmup=5,
+    offer_url=None,
+):
+    """
+    Publish timestamp frames for `warmup` + `duration` seconds and read them
+    back from SRS and from a local sink fed by a relay. Returns latency
+    percentiles in milliseconds for each hop plus frame counts; frames stamped
+    during the warm-up (connection set-up, GOP cache replay) are ignored.
+    """
+    srs_url = f"rtmp://{settings.SRS_SERVER_HOST}/live/{stream_key}"
+    sink_url = f"rtmp://127.0.0.1:{free_port()}/live/probe"
+
+    sink = TimestampReader(sink_url, listen=True).start()
+    if ingest == "webrtc":
+        publisher = WebRTCPublisher(offer_url, stream_key).start()
+    else:
+        publisher = RTMPPublisher(srs_url, preset, tune).start()
+    started = now_ms()
+    # SRS only serves a stream once it is being published.
+    time.sleep(1)
+    srs = TimestampReader(srs_url).start()
+    relay = start_relay(srs_url, sink_url, relay_mode, relay_preset)
+    try:
+        time.sleep(warmup - 1 + duration)
+    finally:
+        publisher.stop()
+        relay.terminate()
+        relay.wait()
+        srs.stop()
+        sink.stop()
+
+    cutoff = started + warmup * 1000
+    at_srs = {t: at for t, at in srs.arrivals.items() if t >= cutoff}
+    at_sink = {t: at for t, at in sink.arrivals.items() if t >= cutoff}
+    both = at_srs.keys() & at_sink.keys()
+    return {
+        "frames_sent": publisher.frames_sent,
+        "unreadable": {"srs": srs.unreadable, "destination": sink.unreadable},
+        "error": getattr(publisher, "error", None),
+        "hops": {
+            "publisher -> srs": percentiles(
+                [elapsed_ms(t, at) for t, at in at_srs.items()]
+            ),
+            "srs -> destination": percentiles([at_sink[t] - at_srs[t] for t in both]),
+            "publisher -> destination": percentiles(
+                [elapsed_ms(t, at) for t, at in at_sink.items()]
+            ),
+        },
+    }
@@ -0,0 +1,347 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+# How often each worker samples the ffmpeg children it started.
+PROC_SAMPLE_INTERVAL = getattr(settings, "PROC_SAMPLE_INTERVAL", 5)
+# Headroom is what is left below this share of the host's CPUs...
+PROC_CPU_TARGET = getattr(settings, "PROC_CPU_TARGET", 0.8)
+# ...and above this much available memory.
+PROC_MEMORY_RESERVE = getattr(settings, "PROC_MEMORY_RESERVE", 512 * 1024 * 1024)
+# Assumed (cores, resident bytes) of one relay on a host not yet running any.
+PROC_RELAY_ESTIMATE = getattr(settings, "PROC_RELAY_ESTIMATE", (0.05, 64 * 1024 * 1024))
+
+HOST = socket.gethostname()
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_HOSTS_KEY = "proc:hosts"
+
+
+def _usage_key(host):
+    return f"proc:usage:{host}"
+
+
+def _host_key(host):
+    return f"proc:host:{host}"
+
+
+def _relay_host_key(host):
+    return f"proc:relay-host:{host}"
+
+
+def relay_queue(host):
+    """The queue relays placed on `host` are sent to."""
+    return f"relay_host_{host}"
+
+
+def read_proc(pid):
+    """
+    CPU seconds, resident bytes and bytes read/written (sockets included) of
+    a process from /proc/<pid>/stat, status and io, or None once it is gone.
+    """
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+        with open(f"/proc/{pid}/status", "rb") as f:
+            status = f.read()
+        with open(f"/proc/{pid}/io", "rb") as f:
+            io = f.read()
+    except OSError:
+        return None
+    # The command name may contain spaces; fields resume after ")".
+    fields = stat.rpartition(b")")[2].split()
+    start = status.find(b"VmRSS:")
+    rss = int(status[start + 6 : status.index(b"kB", start)]) if start >= 0 else 0
+    counters = dict(line.split(b": ") for line in io.splitlines())
+    return {
+        "cpu_seconds": (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS,
+        "rss_bytes": rss * 1024,
+        "read_bytes": int(counters[b"rchar"]),
+        "write_bytes": int(counters[b"wchar"]),
+    }
+
+
+def read_host():
+    """Total and idle CPU ticks plus total and available memory of this host."""
+    with open("/proc/stat", "rb") as f:
+        ticks = [int(v) for v in f.readline().split()[1:]]
+    memory = {}
+    with open("/proc/meminfo", "rb") as f:
+        for line in f:
+            key, _, value = line.partition(b":")
+            if key in (b"MemTotal", b"MemAvailable"):
+                memory[key] = int(value.split()[0]) * 1024
+    return {
+        "ticks": sum(ticks),
+        "idle_ticks": ticks[3] + ticks[4],  # idle + iowait
+        "memory_total": memory[b"MemTotal"],
+        "memory_available": memory[b"MemAvailable"],
+    }
+
+
+class _ProcessSampler:
+    """
+    ffmpeg processes started by this worker, and the thread that samples them
+    into Redis. Each process is a field of the host's usage hash, so a read
+    costs one HGETALL per host however many workers feed it.
+    """
+
+    def __init__(self):
+        self._processes = {}
+        self._previous = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        # Whether a worker here consumes relay_queue(HOST).
+        self.takes_relays = False
+
+    def track(self, process, kind, labels):
+        with self._lock:
+            self._processes[process.pid] = (process, kind, labels)
+        self.start()
+
+    def start(self):
+        """Start sampling in this process, if it is not already."""
+        with self._lock:
+            # Threads do not survive a fork; start one per worker process.
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._previous = {}
+                self._thread = threading.Thread(
+                    target=self._run, name="proc-sampler", daemon=True
+                )
+                self._thread.start()
+
+    def take_relays(self):
+        """Offer this host to relay placement, and start sampling."""
+        self.takes_relays = True
+        self.start()
+
+    def _run(self):
+        host = read_host()
+        while True:
+            time.sleep(PROC_SAMPLE_INTERVAL)
+            try:
+                host = self.sample(host)
+            except Exception as e:
+                logger.warning("Process sampling failed: %s", e)
+
+    def sample(self, previous_host):
+        now = time.time()
+        with self._lock:
+            tracked = list(self._processes.items())
+        records, gone = {}, []
+        for pid, (process, kind, labels) in tracked:
+            usage = read_proc(pid) if process.poll() is None else None
+            if usage is None:
+                gone.append(pid)
+                continue
+            before = self._previous.get(pid)
+            self._previous[pid] = (now, usage)
+            rates = {"cpu_cores": 0.0, "read_bps": 0.0, "write_bps": 0.0}
+            if before is not None and now > before[0]:
+                elapsed = now - before[0]
+                rates = {
+                    "cpu_cores": (usage["cpu_seconds"] - before[1]["cpu_seconds"])
+                    / elapsed,
+                    "read_bps": (usage["read_bytes"] - before[1]["read_bytes"])
+                    / elapsed,
+                    "write_bps": (usage["write_bytes"] - before[1]["write_bytes"])
+                    / elapsed,
+                }
+            records[str(pid)] = json.dumps(
+                {"kind": kind, "labels": labels, "sampled_at": now, **usage, **rates}
+            )
+        if gone:
+            with self._lock:
+                for pid in gone:
+                    self._processes.pop(pid, None)
+                    self._previous.pop(pid, None)
+
+        host = read_host()
+        ticks = host["ticks"] - previous_host["ticks"]
+        idle = host["idle_ticks"] - previous_host["idle_ticks"]
+        cpu_count = os.cpu_count() or 1
+        busy_cores = cpu_count * (1 - idle / ticks) if ticks > 0 else 0.0
+
+        ttl = int(PROC_SAMPLE_INTERVAL * 6)
+        pipe = get_redis_connection("default").pipeline(transaction=False)
+        if records:
+            pipe.hset(_usage_key(HOST), mapping=records)
+        if gone:
+            pipe.hdel(_usage_key(HOST), *(str(pid) for pid in gone))
+        pipe.expire(_usage_key(HOST), ttl)
+        pipe.set(
+            _host_key(HOST),
+            json.dumps(
+                {
+                    "cpu_count": cpu_count,
+                    "busy_cores": busy_cores,
+                    "memory_total": host["memory_total"],
+                    "memory_available": host["memory_available"],
+                    "sampled_at": now,
+                }
+            ),
+            ex=ttl,
+        )
+        if self.takes_relays:
+            pipe.set(_relay_host_key(HOST), 1, ex=ttl)
+        pipe.sadd(_HOSTS_KEY, HOST)
+        pipe.execute()
+        return host
+
+
+sampler = _ProcessSampler()
+
+
+def track(process, kind, labels):
+    """
+    Account for an ffmpeg process started by this worker. `kind` is "relay"
+    or "ingest"; `labels` attribute it (session, platform, user, ...).
+    """
+    sampler.track(process, kind, {k: str(v) for k, v in labels.items()})
+
+
+def read_usage():
+    """
+    The latest sample of every tracked process on every host, as
+    (host, record) pairs, plus each host's own figures keyed by host name;
+    "takes_relays" says whether a worker there consumes the host's relay
+    queue. Records of workers that stopped sampling are dropped.
+    """
+    conn = get_redis_connection("default")
+    hosts = sorted(h.decode() for h in conn.smembers(_HOSTS_KEY))
+    if not hosts:
+        return [], {}
+    pipe = conn.pipeline(transaction=False)
+    for host in hosts:
+        pipe.hgetall(_usage_key(host))
+        pipe.get(_host_key(host))
+        pipe.exists(_relay_host_key(host))
+    results = pipe.execute()
+
+    cutoff = time.time() - PROC_SAMPLE_INTERVAL * 3
+    records, host_info, stale = [], {}, []
+    for host, usage, info, takes_relays in zip(
+        hosts, results[::3], results[1::3], results[2::3]
+    ):
+        if info is None and not usage:
+            stale.append((host, None))
+            continue
+        if info is not None:
+            host_info[host] = {**json.loads(info), "takes_relays": bool(takes_relays)}
+        for field, raw in usage.items():
+            record = json.loads(raw)
+            if record["sampled_at"] < cutoff:
+                stale.append((host, field))
+            else:
+                records.append((host, record))
+    if stale:
+        pipe = conn.pipeline(transaction=False)
+        for host, field in stale:
+            if field is None:
+                pipe.srem(_HOSTS_KEY, host)
+            else:
+                pipe.hdel(_usage_key(host), field)
+        pipe.execute()
+    return records, host_info
+
+
+def usage_by(records, label):
+    """Sum CPU, memory and I/O rates of (host, record) pairs by one label."""
+    totals = {}
+    for _, record in records:
+        key = record["labels"].get(label)
+        if key is None:
+            continue
+        total = totals.setdefault(
+            key,
+            {
+                "processes": 0,
+                "cpu_cores": 0.0,
+                "rss_bytes": 0,
+                "read_bps": 0.0,
+                "write_bps": 0.0,
+            },
+        )
+        total["processes"] += 1
+        for field in ("cpu_cores", "rss_bytes", "read_bps", "write_bps"):
+            total[field] += record[field]
+    return totals
+
+
+def host_headroom(records=None, host_info=None):
+    """
+    Per host: the relays and ingests running, what they use, and how many more
+    relays of the current average cost fit below PROC_CPU_TARGET of the CPUs
+    and above PROC_MEMORY_RESERVE of free memory. A host running no relays yet
+    is judged by PROC_RELAY_ESTIMATE. Only hosts with "takes_relays" set may
+    be given relays; the others merely report what they run.
+    """
+    if records is None:
+        records, host_info = read_usage()
+    report = {}
+    for host, info in host_info.items():
+        mine = [record for h, record in records if h == host]
+        relays = [record for record in mine if record["kind"] == "relay"]
+        cpu_each, rss_each = PROC_RELAY_ESTIMATE
+        if relays:
+            cpu_each = sum(r["cpu_cores"] for r in relays) / len(relays)
+            rss_each = sum(r["rss_bytes"] for r in relays) / len(relays)
+        cpu_left = info["cpu_count"] * PROC_CPU_TARGET - info["busy_cores"]
+        memory_left = info["memory_available"] - PROC_MEMORY_RESERVE
+        report[host] = {
+            "takes_relays": info.get("takes_relays", False),
+            "relays": len(relays),
+            "ingests": sum(1 for record in mine if record["kind"] == "ingest"),
+            "cpu_count": info["cpu_count"],
+            "busy_cores": info["busy_cores"],
+            "ffmpeg_cores": sum(record["cpu_cores"] for record in mine),
+            "ffmpeg_rss_bytes": sum(record["rss_bytes"] for record in mine),
+            "memory_available": info["memory_available"],
+            "relay_cores": cpu_each,
+            "relays_left": max(
+                0,
+                int(
+                    min(cpu_left / max(cpu_each, 1e-3), memory_left / max(rss_each, 1))
+                ),
+            ),
+        }
+    return report
+
+
+def prometheus_samples():
+    """Per-process and per-host series for the /metrics endpoint."""
+    records, host_info = read_usage()
+    samples = {
+        "streamlab_ffmpeg_cpu_seconds_total": [],
+        "streamlab_ffmpeg_rss_bytes": [],
+        "streamlab_ffmpeg_io_bytes_total": [],
+        "streamlab_host_relay_headroom": [],
+    }
+    for host, record in records:
+        labels = {"host": host, "kind": record["kind"], **record["labels"]}
+        samples["streamlab_ffmpeg_cpu_seconds_total"].append(
+            (labels, record["cpu_seconds"])
+        )
+        samples["streamlab_ffmpeg_rss_bytes"].append((labels, record["rss_bytes"]))
+        samples["streamlab_ffmpeg_io_bytes_total"].append(
+            ({**labels, "direction": "read"}, record["read_bytes"])
+        )
+        samples["streamlab_ffmpeg_io_bytes_total"].append(
+            ({**labels, "direction": "write"}, record["write_bytes"])
+        )
+    for host, entry in host_headroom(records, host_info).items():
+        if entry["takes_relays"]:
+            samples["streamlab_host_relay_headroom"].append(
+                ({"host": host}, entry["relays_left"])
+            )
+    return samples
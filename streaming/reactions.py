@@ -0,0 +1,203 @@
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict
+
+import redis.asyncio as aioredis
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from .models import StreamingSession
+
+logger = logging.getLogger(__name__)
+
+REACTION_CHOICES = ["heart", "like", "laugh", "wow", "clap", "fire"]
+
+# Width of a live counter bucket, in seconds.
+REACTION_BUCKET_SECONDS = getattr(settings, "REACTION_BUCKET_SECONDS", 1)
+# How often each worker pushes aggregates to its connected clients.
+REACTION_PUSH_INTERVAL = getattr(settings, "REACTION_PUSH_INTERVAL", 0.25)
+# Resolution of the history kept once a session has ended.
+REACTION_HISTORY_BUCKET_SECONDS = getattr(
+    settings, "REACTION_HISTORY_BUCKET_SECONDS", 10
+)
+REACTION_TTL = getattr(settings, "REACTION_TTL", 24 * 3600)
+# Above this many buckets in one read the whole counter hash is scanned instead.
+REACTION_MAX_READ_BUCKETS = 60
+
+
+def _counter_key(session_uuid):
+    return f"reactions:{session_uuid}"
+
+
+def _bucket(ts=None):
+    return int((ts or time.time()) // REACTION_BUCKET_SECONDS)
+
+
+def add_reaction(session_uuid, reaction):
+    """Count one reaction: a single HINCRBY on the session's live counter hash."""
+    get_redis_connection("default").hincrby(
+        _counter_key(session_uuid), f"{_bucket()}:{reaction}", 1
+    )
+
+
+def rollup_session(session_uuid):
+    """
+    Fold a session's live counters into a compact history stored on the session
+    and drop the Redis hash. Returns the summary, or None if there was nothing.
+    """
+    conn = get_redis_connection("default")
+    key = _counter_key(session_uuid)
+    raw = conn.hgetall(key)
+    if not raw:
+        return None
+
+    step = REACTION_HISTORY_BUCKET_SECONDS
+    totals = defaultdict(int)
+    series = defaultdict(lambda: defaultdict(int))
+    for field, count in raw.items():
+        bucket, _, reaction = field.decode().partition(":")
+        count = int(count)
+        start = int(bucket) * REACTION_BUCKET_SECONDS // step * step
+        totals[reaction] += count
+        series[reaction][start] += count
+
+    summary = {
+        "bucket_seconds": step,
+        "totals": dict(totals),
+        "series": {
+            reaction: sorted(points.items()) for reaction, points in series.items()
+        },
+    }
+    updated = StreamingSession.objects.filter(session_uuid=session_uuid).update(
+        reaction_summary=summary
+    )
+    if updated:
+        conn.delete(key)
+    return summary
+
+
+class ReactionHub:
+    """
+    Per-worker aggregator. For every session with local listeners it reads the
+    current and previous bucket a few times per second and pushes one shared
+    SSE frame to all of that session's clients.
+    """
+
+    def __init__(self):
+        self.listeners = defaultdict(set)
+        self.pollers = {}
+        self._redis = None
+
+    def _redis_url(self):
+        return getattr(
+            settings,
+            "CHAT_BROADCAST_REDIS_URL",
+            settings.CACHES["default"]["LOCATION"],
+        )
+
+    def subscribe(self, session_uuid):
+        session_uuid = str(session_uuid)
+        queue = asyncio.Queue(maxsize=20)
+        self.listeners[session_uuid].add(queue)
+        poller = self.pollers.get(session_uuid)
+        if poller is None or poller.done():
+            if self._redis is None:
+                self._redis = aioredis.from_url(self._redis_url())
+            self.pollers[session_uuid] = asyncio.create_task(self._poll(session_uuid))
+        return queue
+
+    def unsubscribe(self, session_uuid, queue):
+        session_uuid = str(session_uuid)
+        queues = self.listeners.get(session_uuid)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.listeners[session_uuid]
+            poller = self.pollers.pop(session_uuid, None)
+            if poller:
+                poller.cancel()
+
+    async def _poll(self, session_uuid):
+        key = _counter_key(session_uuid)
+        # Seed the running totals once; afterwards only recent buckets are read.
+        totals = defaultdict(int)
+        current_bucket = _bucket()
+        for field, count in (await self._redis.hgetall(key)).items():
+            bucket, _, reaction = field.decode().partition(":")
+            if int(bucket) < current_bucket:
+                totals[reaction] += int(count)
+        await self._redis.expire(key, REACTION_TTL)
+
+        last_frame = None
+        while True:
+            await asyncio.sleep(REACTION_PUSH_INTERVAL)
+            try:
+                frame, current_bucket = await self._tick(key, totals, current_bucket)
+            except Exception as e:
+                logger.warning("Reaction poll failed for %s: %s", session_uuid, e)
+                continue
+            if frame == last_frame:
+                continue
+            last_frame = frame
+            for queue in list(self.listeners.get(session_uuid, ())):
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(frame)
+
+    async def _tick(self, key, totals, watched_bucket):
+        """Build the next frame; returns it with the bucket now being watched."""
+        bucket = _bucket()
+        completed = {}
+        if bucket != watched_bucket:
+            # Every bucket since the one we were watching is complete; a slow
+            # tick can skip several.
+            completed = await self._read(key, watched_bucket, bucket - 1)
+            await self._redis.expire(key, REACTION_TTL)
+
+        current = await self._read(key, bucket)
+        previous = await self._read(key, bucket - 1)
+        # Fold only once every read has succeeded: a failed tick is retried
+        # from the same watched bucket and must not count it twice.
+        for reaction, count in completed.items():
+            totals[reaction] += count
+        payload = {
+            "bucket_seconds": REACTION_BUCKET_SECONDS,
+            "current": current,
+            "previous": previous,
+            "totals": {
+                reaction: totals[reaction] + current.get(reaction, 0)
+                for reaction in set(totals) | set(current)
+            },
+        }
+        return b"data: " + json.dumps(payload).encode() + b"\n\n", bucket
+
+    async def _read(self, key, first, last=None):
+        """Counts per reaction, summed over buckets `first` to `last` inclusive."""
+        last = first if last is None else last
+        if last - first >= REACTION_MAX_READ_BUCKETS:
+            # A long stall; scanning the hash is cheaper than naming every field.
+            counts = defaultdict(int)
+            for field, count in (await self._redis.hgetall(key)).items():
+                bucket, _, reaction = field.decode().partition(":")
+                if first <= int(bucket) <= last:
+                    counts[reaction] += int(count)
+            return dict(counts)
+
+        fields = [
+            f"{bucket}:{reaction}"
+            for bucket in range(first, last + 1)
+            for reaction in REACTION_CHOICES
+        ]
+        if not fields:
+            return {}
+        counts = defaultdict(int)
+        for field, value in zip(fields, await self._redis.hmget(key, fields)):
+            if value:
+                counts[field.partition(":")[2]] += int(value)
+        return dict(counts)
+
+
+hub = ReactionHub()
@@ -0,0 +1,335 @@
+"""
+Server-side recording of every live session from SRS's own segments.
+
+SRS writes the segments and reports each one to a hook; this module indexes
+them per session and, once the session has ended, remuxes them (stream copy,
+no re-encode) into one faststart MP4 in storage. The SRS vhost needs DVR in
+segment mode (or HLS) and the hooks pointed at this app, e.g.:
+
+    dvr {
+        enabled on;
+        dvr_apply all;
+        dvr_plan segment;
+        dvr_path ./objs/nginx/html/[app]/[stream].[timestamp].flv;
+        dvr_duration 60;
+        dvr_wait_keyframe on;
+    }
+    http_hooks {
+        on_dvr http://web:8000/streaming/api/srs/on_dvr/;
+    }
+
+or, recording from HLS instead, SRS must keep every fragment until the VOD is
+made (by default it deletes those that leave the playlist window):
+
+    hls {
+        enabled on;
+        hls_fragment 10;
+        hls_dispose 0;
+        hls_cleanup off;
+    }
+    http_hooks {
+        on_hls http://web:8000/streaming/api/srs/on_hls/;
+    }
+
+with SRS_DVR_SRS_ROOT/SRS_DVR_ROOT mapping the directory SRS writes to onto
+where this app sees it (a shared volume). A recording with a segment missing
+from disk fails rather than silently losing that footage; its segments are
+kept for an operator to look at.
+"""
+
+import json
+import logging
+import os
+import subprocess
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Recording
+
+logger = logging.getLogger(__name__)
+
+# The directory SRS writes recordings under, as SRS sees it and as this app
+# sees it.
+SRS_DVR_SRS_ROOT = getattr(
+    settings, "SRS_DVR_SRS_ROOT", "/usr/local/srs/objs/nginx/html"
+)
+SRS_DVR_ROOT = getattr(settings, "SRS_DVR_ROOT", SRS_DVR_SRS_ROOT)
+# How long after a session ends its recording is remuxed: SRS reports the last
+# segment when it closes it, which can be after on_unpublish.
+RECORDING_FINALIZE_DELAY = getattr(settings, "RECORDING_FINALIZE_DELAY", 30)
+# A recording that has had no segment for this long is finalized even if its
+# session never ended (a session that failed or only partly started its
+# relays is not ended by on_unpublish). Well over dvr_duration/hls_fragment.
+RECORDING_IDLE_TIMEOUT = getattr(settings, "RECORDING_IDLE_TIMEOUT", 600)
+# Keep SRS's segments once the VOD is made.
+RECORDING_KEEP_SEGMENTS = getattr(settings, "RECORDING_KEEP_SEGMENTS", False)
+RECORDING_VOD_DIR = getattr(settings, "RECORDING_VOD_DIR", "recordings/vod")
+# Seconds a remux may take before it is given up.
+RECORDING_REMUX_TIMEOUT = getattr(settings, "RECORDING_REMUX_TIMEOUT", 3600)
+# A recording still "processing" this long after it was claimed lost its worker
+# mid-remux and is taken up again. The remux itself is killed at
+# RECORDING_REMUX_TIMEOUT; the rest is headroom for probing the segments.
+RECORDING_PROCESSING_TIMEOUT = getattr(
+    settings, "RECORDING_PROCESSING_TIMEOUT", RECORDING_REMUX_TIMEOUT + 600
+)
+
+
+class RecordingError(Exception):
+    pass
+
+
+def local_segment_path(cwd, file):
+    """Where this app finds a segment SRS reported as `file` (relative to `cwd`)."""
+    path = os.path.normpath(os.path.join(cwd or "", file))
+    relative = os.path.relpath(path, SRS_DVR_SRS_ROOT)
+    if relative.startswith(os.pardir):
+        raise RecordingError(f"Segment {path} is outside {SRS_DVR_SRS_ROOT}")
+    return os.path.join(SRS_DVR_ROOT, relative)
+
+
+def add_segment(session, path, duration=None):
+    """
+    Append a closed segment to the session's recording, creating the
+    recording for its first segment. Returns the recording, or None if it was
+    already remuxed and the segment comes too late to be part of it.
+    """
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = 0
+    with transaction.atomic():
+        recording, _ = Recording.objects.select_for_update().get_or_create(
+            session=session
+        )
+        if recording.status != "recording":
+            logger.warning(
+                "Segment %s arrived after recording %s was finalized",
+                path,
+                recording.pk,
+            )
+            return None
+        recording.segments.append({"path": path, "size": size, "duration": duration})
+        recording.size += size
+        recording.save(update_fields=["segments", "size", "updated_at"])
+    return recording
+
+
+def probe(path):
+    """The container and stream details ffprobe reports for `path`."""
+    result = subprocess.run(
+        [
+            "ffprobe",
+            "-v",
+            "error",
+            "-print_format",
+            "json",
+            "-show_format",
+            "-show_streams",
+            path,
+        ],
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    if result.returncode != 0:
+        raise RecordingError(f"ffprobe {path}: {result.stderr.strip()[-500:]}")
+    info = json.loads(result.stdout)
+    streams = [
+        {
+            key: stream[key]
+            for key in (
+                "codec_type",
+                "codec_name",
+                "profile",
+                "width",
+                "height",
+                "r_frame_rate",
+                "sample_rate",
+                "channels",
+            )
+            if key in stream
+        }
+        for stream in info.get("streams", [])
+    ]
+    fmt = info.get("format", {})
+    return {
+        "format": fmt.get("format_name"),
+        "duration": float(fmt.get("duration") or 0),
+        "bit_rate": int(fmt.get("bit_rate") or 0),
+        "streams": streams,
+    }
+
+
+def _codec_key(details):
+    return [
+        (s.get("codec_type"), s.get("codec_name"), s.get("width"), s.get("height"))
+        for s in details["streams"]
+    ]
+
+
+def _remux(paths, output):
+    """Concatenate `paths` into the MP4 `output` without re-encoding."""
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as listing:
+        for path in paths:
+            escaped = path.replace("'", "'\\''")
+            listing.write(f"file '{escaped}'\n")
+    try:
+        result = subprocess.run(
+            [
+                "ffmpeg",
+                "-hide_banner",
+                "-loglevel",
+                "error",
+                "-y",
+                "-f",
+                "concat",
+                "-safe",
+                "0",
+                "-i",
+                listing.name,
+                "-map",
+                "0",
+                "-c",
+                "copy",
+                "-movflags",
+                "+faststart",
+                output,
+            ],
+            capture_output=True,
+            text=True,
+            timeout=RECORDING_REMUX_TIMEOUT,
+        )
+    finally:
+        os.remove(listing.name)
+    if result.returncode != 0:
+        raise RecordingError(f"ffmpeg concat: {result.stderr.strip()[-500:]}")
+
+
+def _vod_name(recording):
+    session = recording.session
+    stamp = int(session.session_start.timestamp())
+    return f"{RECORDING_VOD_DIR}/{stamp}_{session.session_uuid}.mp4"
+
+
+def _local():
+    try:
+        default_storage.path("")
+    except NotImplementedError:
+        return False
+    return True
+
+
+def _remux_into_storage(paths, name):
+    """Remux straight to its place in storage when it is local, else via a temp file."""
+    try:
+        target = default_storage.path(default_storage.get_available_name(name))
+    except NotImplementedError:
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, os.path.basename(name))
+            _remux(paths, output)
+            with open(output, "rb") as f:
+                return default_storage.save(name, File(f))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        _remux(paths, target)
+    except Exception:
+        if os.path.exists(target):
+            os.remove(target)
+        raise
+    return os.path.relpath(target, default_storage.location).replace(os.sep, "/")
+
+
+def _abandoned():
+    """Recordings whose finalizer went away in the middle of the remux."""
+    stale = timezone.now() - timedelta(seconds=RECORDING_PROCESSING_TIMEOUT)
+    return Q(status="processing", updated_at__lte=stale)
+
+
+def finalize_recording(recording_id):
+    """
+    Remux an ended session's segments into one VOD and record its duration,
+    size and codecs. Safe to call again: only a recording still "recording",
+    or one whose remux was abandoned, is processed.
+    """
+    with transaction.atomic():
+        recording = (
+            Recording.objects.select_for_update(skip_locked=True, of=("self",))
+            .filter(Q(status="recording") | _abandoned(), pk=recording_id)
+            .select_related("session")
+            .first()
+        )
+        if recording is None:
+            return None
+        recording.status = "processing"
+        recording.save(update_fields=["status", "updated_at"])
+
+    paths = [s["path"] for s in recording.segments]
+    try:
+        if not paths:
+            raise RecordingError("No segments were recorded")
+        missing = [path for path in paths if not os.path.exists(path)]
+        if missing:
+            # e.g. SRS disposed of HLS fragments that left its window.
+            raise RecordingError(
+                f"{len(missing)} of {len(paths)} segments are missing, "
+                f"first {missing[0]}"
+            )
+        details = [probe(path) for path in paths]
+        if any(_codec_key(d) != _codec_key(details[0]) for d in details[1:]):
+            # A republish with other settings; concat would need a re-encode.
+            raise RecordingError("Segments differ in codecs or resolution")
+        recording.file_path = _remux_into_storage(paths, _vod_name(recording))
+        vod = probe(default_storage.path(recording.file_path)) if _local() else None
+    except Exception as e:
+        logger.error("Recording %s could not be finalized: %s", recording.pk, e)
+        recording.status = "failed"
+        recording.error_message = str(e)
+        recording.save(
+            update_fields=["status", "error_message", "file_path", "updated_at"]
+        )
+        return recording
+
+    recording.codecs = vod or details[0]
+    recording.duration = timedelta(
+        seconds=round(vod["duration"] if vod else sum(d["duration"] for d in details))
+    )
+    recording.size = default_storage.size(recording.file_path)
+    recording.status = "ready"
+    recording.error_message = None
+    recording.save()
+
+    if not RECORDING_KEEP_SEGMENTS:
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning("Could not remove segment %s: %s", path, e)
+    logger.info(
+        "Recording %s remuxed from %d segments into %s",
+        recording.pk,
+        len(paths),
+        recording.file_path,
+    )
+    return recording
+
+
+def pending_recordings():
+    """
+    Recordings never remuxed although their session ended long enough ago, or
+    that have had no new segment for RECORDING_IDLE_TIMEOUT, and those left
+    "processing" for RECORDING_PROCESSING_TIMEOUT by a worker that went away.
+    """
+    now = timezone.now()
+    ended = now - timedelta(seconds=RECORDING_FINALIZE_DELAY)
+    idle = now - timedelta(seconds=RECORDING_IDLE_TIMEOUT)
+    waiting = Q(status="recording") & (
+        Q(session__session_end__lte=ended) | Q(updated_at__lte=idle)
+    )
+    return Recording.objects.filter(waiting | _abandoned()).values_list("pk", flat=True)
@@ -0,0 +1,205 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from django_redis import get_redis_connection
+
+from .proc_accounting import track
+
+logger = logging.getLogger(__name__)
+
+# ffmpeg options that make a relay report progress blocks on stdout.
+PROGRESS_ARGS = ["-progress", "pipe:1", "-nostats"]
+STDERR_TAIL_LINES = 50
+# How often each worker checks for stop requests addressed to its relays.
+RELAY_CONTROL_INTERVAL = 2
+
+
+def relay_command(source_rtmp, target_rtmp, video_args=("-c:v", "copy")):
+    """
+    The ffmpeg command line relaying one RTMP source to one destination. By
+    default video is stream-copied; pass encoder options to transcode instead.
+    """
+    return [
+        "ffmpeg",
+        "-loglevel",
+        "info",
+        "-re",  # Read input at native frame rate
+        "-i",
+        source_rtmp,
+        *video_args,
+        "-c:a",
+        "copy",
+        "-f",
+        "flv",
+        "-flvflags",
+        "no_duration_filesize",
+        *PROGRESS_ARGS,  # Bitrate, fps and speed for the metrics series
+        target_rtmp,
+    ]
+
+
+def transcode_args(kbps, preset="veryfast"):
+    """Video options for a relay that re-encodes to at most `kbps`."""
+    return (
+        "-c:v",
+        "libx264",
+        "-preset",
+        preset,
+        "-tune",
+        "zerolatency",
+        "-b:v",
+        f"{kbps}k",
+        "-maxrate",
+        f"{kbps}k",
+        "-bufsize",
+        f"{kbps * 2}k",
+        "-g",
+        "60",
+    )
+
+
+def relay_id(session_uuid, platform):
+    return f"{session_uuid}:{platform}"
+
+
+def _stop_key(relay):
+    return f"relay:stop:{relay}"
+
+
+def request_stop(relay):
+    """
+    Ask whichever worker runs a relay to stop it. Every process for that relay
+    started before now is terminated within RELAY_CONTROL_INTERVAL; a relay
+    started afterwards (the restart) is left alone.
+    """
+    get_redis_connection("default").set(
+        _stop_key(relay), time.time(), ex=int(RELAY_CONTROL_INTERVAL * 30)
+    )
+
+
+class _RelayRegistry:
+    """Relay processes running in this worker, and the thread that stops them."""
+
+    def __init__(self):
+        self._relays = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def add(self, relay, process):
+        with self._lock:
+            self._relays.setdefault(relay, []).append((process, time.time()))
+            # Threads do not survive a fork; start one per worker process.
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._run, name="relay-control", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(RELAY_CONTROL_INTERVAL)
+            with self._lock:
+                for relay, processes in list(self._relays.items()):
+                    processes[:] = [p for p in processes if p[0].poll() is None]
+                    if not processes:
+                        del self._relays[relay]
+                relays = list(self._relays)
+            if not relays:
+                continue
+            try:
+                requested = get_redis_connection("default").mget(
+                    [_stop_key(relay) for relay in relays]
+                )
+            except Exception as e:
+                logger.warning("Could not check relay stop requests: %s", e)
+                continue
+            for relay, requested_at in zip(relays, requested):
+                if requested_at is None:
+                    continue
+                with self._lock:
+                    processes = list(self._relays.get(relay, ()))
+                for process, started_at in processes:
+                    if started_at < float(requested_at):
+                        logger.info("Stopping relay %s (pid %d)", relay, process.pid)
+                        process.terminate()
+
+
+registry = _RelayRegistry()
+
+
+def _number(value, suffix=""):
+    value = value.strip()
+    if suffix and value.endswith(suffix):
+        value = value[: -len(suffix)]
+    try:
+        return float(value)
+    except ValueError:
+        return None  # "N/A" until ffmpeg has output
+
+
+def parse_progress_block(fields):
+    """Turn one ffmpeg -progress block (key -> raw value) into relay metrics."""
+    return {
+        "bitrate": _number(fields.get("bitrate", ""), "kbits/s"),
+        "fps": _number(fields.get("fps", "")),
+        "speed": _number(fields.get("speed", ""), "x"),
+    }
+
+
+def _follow_progress(stream, series):
+    fields = {}
+    for line in stream:
+        key, _, value = line.strip().partition("=")
+        if key != "progress":
+            fields[key] = value
+            continue
+        sample = parse_progress_block(fields)
+        # Blocks before the first output packet are all "N/A"; skip them.
+        if series is not None and any(v is not None for v in sample.values()):
+            try:
+                series.record(sample, ts=time.time())
+            except Exception as e:
+                logger.warning("Failed to record relay metrics: %s", e)
+        fields = {}
+        if value == "end":
+            break
+
+
+def _follow_stderr(stream, tail):
+    for line in stream:
+        tail.append(line)
+
+
+def watch_relay(process, series=None, labels=None, relay=None):
+    """
+    Follow a relay ffmpeg process started with PROGRESS_ARGS and piped
+    stdout/stderr. Progress blocks are recorded into `series`, and with
+    `labels` the process's CPU, memory and network use is accounted to them
+    (see proc_accounting). With
+    a `relay` id the process can be stopped through request_stop(). The
+    returned deque holds the last lines of stderr for error reporting. Both
+    pipes are drained for the life of the process so ffmpeg never blocks.
+    """
+    if relay is not None:
+        registry.add(relay, process)
+    if labels is not None:
+        track(process, "relay", labels)
+    tail = deque(maxlen=STDERR_TAIL_LINES)
+    threading.Thread(
+        target=_follow_progress,
+        args=(process.stdout, series),
+        name=f"relay-progress-{process.pid}",
+        daemon=True,
+    ).start()
+    threading.Thread(
+        target=_follow_stderr,
+        args=(process.stderr, tail),
+        name=f"relay-stderr-{process.pid}",
+        daemon=True,
+    ).start()
+    return tail
@@ -3,9 +3,17 @@ import requests
 from urllib.parse import urlparse
 from django.dispatch import receiver
 from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save
 
 from allauth.socialaccount.signals import social_account_added, social_account_updated
-from streaming.models import StreamingPlatformAccount
+from streaming.models import (
+    Recording,
+    StreamingConfiguration,
+    StreamingPlatformAccount,
+    StreamingSession,
+)
+from streaming.moderation import bump_version
 
 logger = logging.getLogger(__name__)
 
@@ -94,6 +102,62 @@ def handle_social_account_updated(request, sociallogin, **kwargs):
         )
 
 
+@receiver(post_save, sender=StreamingConfiguration)
+def reload_moderation_terms(sender, instance, **kwargs):
+    """
+    Bump the moderation version stamp so every worker recompiles the channel's
+    banned-term matcher on its next check.
+    """
+    try:
+        bump_version(instance.pk)
+    except Exception as e:
+        logger.warning(
+            "Could not bump moderation version for configuration %s: %s",
+            instance.pk,
+            e,
+        )
+
+
+@receiver(post_save, sender=StreamingSession)
+def rollup_reactions_on_end(sender, instance, **kwargs):
+    """
+    Once a session has ended (or failed), roll its live reaction counters up
+    into the session's reaction_summary.
+    """
+    if instance.status not in ("ended", "error"):
+        return
+    from streaming.tasks import rollup_session_reactions
+
+    transaction.on_commit(
+        lambda: rollup_session_reactions.delay(str(instance.session_uuid))
+    )
+
+
+@receiver(post_save, sender=StreamingSession)
+def finalize_recording_on_end(sender, instance, **kwargs):
+    """
+    Once a session has ended (or failed), remux its server-side recording,
+    after giving SRS time to report the last segment.
+    """
+    if instance.status not in ("ended", "error"):
+        return
+    recording_id = (
+        Recording.objects.filter(session=instance, status="recording")
+        .values_list("pk", flat=True)
+        .first()
+    )
+    if recording_id is None:
+        return
+    from streaming.recordings import RECORDING_FINALIZE_DELAY
+    from streaming.tasks import finalize_recording_task
+
+    transaction.on_commit(
+        lambda: finalize_recording_task.apply_async(
+            args=[recording_id], countdown=RECORDING_FINALIZE_DELAY
+        )
+    )
+
+
 # Helper functions for signals (similar to the ones in the adapter)
 def _fetch_youtube_streamkey(access_token, account):
     youtube_api_url = "https://www.googleapis.com/youtube/v3/liveStreams"
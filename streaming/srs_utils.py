@@ -2,8 +2,12 @@ import requests
 import logging
 from django.conf import settings
 
+from .metrics import timed
+
 logger = logging.getLogger(__name__)
 
+_SRS_LATENCY = "streamlab_srs_api_request_duration_seconds"
+
 
 def start_streaming_via_srs(app, stream_name, retries=3):
     """
@@ -13,7 +17,8 @@ def start_streaming_via_srs(app, stream_name, retries=3):
     url = f"http://{settings.SRS_SERVER_HOST}:{settings.SRS_API_PORT}/api/v1/streams/{app}/{stream_name}/start"
     for attempt in range(1, retries + 1):
         try:
-            response = requests.post(url, timeout=5)
+            with timed(_SRS_LATENCY, {"endpoint": "start"}):
+                response = requests.post(url, timeout=5)
             if response.status_code == 200:
                 logger.info(
                     "SRS streaming started for %s/%s on attempt %d",
@@ -42,7 +47,8 @@ def stop_streaming_via_srs(app, stream_name, retries=3):
     url = f"http://{settings.SRS_SERVER_HOST}:{settings.SRS_API_PORT}/api/v1/streams/{app}/{stream_name}/stop"
     for attempt in range(1, retries + 1):
         try:
-            response = requests.post(url, timeout=5)
+            with timed(_SRS_LATENCY, {"endpoint": "stop"}):
+                response = requests.post(url, timeout=5)
             if response.status_code == 200:
                 logger.info(
                     "SRS streaming stopped for %s/%s on attempt %d",
@@ -71,7 +77,8 @@ def get_stream_stats(app, stream_name, retries=3):
     url = f"http://{settings.SRS_SERVER_HOST}:{settings.SRS_API_PORT}/api/v1/streams/{app}/{stream_name}/stat"
     for attempt in range(1, retries + 1):
         try:
-            response = requests.get(url, timeout=5)
+            with timed(_SRS_LATENCY, {"endpoint": "stat"}):
+                response = requests.get(url, timeout=5)
             if response.status_code == 200:
                 logger.info(
                     "SRS stats retrieved for %s/%s on attempt %d",
@@ -92,3 +99,26 @@ def get_stream_stats(app, stream_name, retries=3):
             )
     logger.error("All attempts to get SRS stats for %s/%s failed.", app, stream_name)
     return None
+
+
+def list_streams(count=1000, retries=1):
+    """
+    Call the SRS REST API once for the state of every stream on the server.
+    Returns the list of stream objects, or None if SRS could not be reached.
+    """
+    url = f"http://{settings.SRS_SERVER_HOST}:{settings.SRS_API_PORT}/api/v1/streams/"
+    for attempt in range(1, retries + 1):
+        try:
+            with timed(_SRS_LATENCY, {"endpoint": "streams"}):
+                response = requests.get(url, params={"count": count}, timeout=5)
+            if response.status_code == 200:
+                return response.json().get("streams", [])
+            else:
+                logger.error(
+                    "SRS list_streams error (attempt %d): %s", attempt, response.text
+                )
+        except Exception as e:
+            logger.exception(
+                "Exception listing SRS streams on attempt %d: %s", attempt, e
+            )
+    return None
@@ -0,0 +1,141 @@
+import logging
+import math
+import time
+from statistics import fmean, median
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from . import metrics
+from .models import StreamingRelayStatus
+from .timeseries import read_many, relay_series
+
+logger = logging.getLogger(__name__)
+
+# Seconds of 1 s relay history examined per sweep.
+RELAY_STALL_WINDOW = getattr(settings, "RELAY_STALL_WINDOW", 60)
+# A relay sending (almost) nothing for this many seconds has stalled.
+RELAY_STALL_SECONDS = getattr(settings, "RELAY_STALL_SECONDS", 10)
+RELAY_STALL_KBPS = getattr(settings, "RELAY_STALL_KBPS", 1.0)
+# ffmpeg below this speed for this many seconds cannot keep up with the input.
+RELAY_MIN_SPEED = getattr(settings, "RELAY_MIN_SPEED", 0.9)
+RELAY_SLOW_SECONDS = getattr(settings, "RELAY_SLOW_SECONDS", 15)
+# Recent bitrate this many standard deviations below the window's baseline.
+RELAY_DRIFT_ZSCORE = getattr(settings, "RELAY_DRIFT_ZSCORE", 4.0)
+# A relay restarted for an anomaly is not restarted again for this long.
+RELAY_RESTART_COOLDOWN = getattr(settings, "RELAY_RESTART_COOLDOWN", 120)
+
+# Anomalies that warrant restarting the relay; "drift" is only reported.
+RESTART_KINDS = ("stall", "silent", "throttled")
+
+
+def _cooldown_key(session_uuid, platform):
+    return f"relay:restart-cooldown:{session_uuid}:{platform}"
+
+
+def classify(bitrate, speed, age):
+    """
+    Classify one relay from its recent per-second bitrate and speed series
+    (oldest first, NaN where nothing was reported) and the seconds since it
+    was started. Returns (kind, detail) or None if the relay looks healthy.
+    """
+    # The newest bucket is still filling up; judge complete seconds only.
+    bitrate, speed = bitrate[:-1], speed[:-1]
+    recent = bitrate[-RELAY_STALL_SECONDS:]
+    reported = [v for v in bitrate if not math.isnan(v)]
+
+    if not reported:
+        if age > RELAY_STALL_WINDOW:
+            return "silent", "no progress reported for the whole window"
+        return None
+
+    if len(recent) == RELAY_STALL_SECONDS and all(
+        math.isnan(v) or v <= RELAY_STALL_KBPS for v in recent
+    ):
+        if age > RELAY_STALL_SECONDS:
+            return "stall", f"bitrate at or near zero for {RELAY_STALL_SECONDS}s"
+
+    slow = speed[-RELAY_SLOW_SECONDS:]
+    if len(slow) == RELAY_SLOW_SECONDS and all(
+        not math.isnan(v) and v < RELAY_MIN_SPEED for v in slow
+    ):
+        return "throttled", f"speed {fmean(slow):.2f}x for {RELAY_SLOW_SECONDS}s"
+
+    baseline = [v for v in bitrate[:-RELAY_STALL_SECONDS] if not math.isnan(v)]
+    current = [v for v in recent if not math.isnan(v)]
+    if len(baseline) >= RELAY_STALL_SECONDS and current:
+        # Median and MAD, so the start of a drop does not drag the baseline.
+        center = median(baseline)
+        spread = 1.4826 * median(abs(v - center) for v in baseline)
+        level = fmean(current)
+        # A floor on the spread keeps a perfectly flat baseline from turning
+        # every small dip into an outlier.
+        zscore = (level - center) / max(spread, center * 0.05, 1.0)
+        if zscore <= -RELAY_DRIFT_ZSCORE and level < center / 2:
+            return (
+                "drift",
+                f"bitrate {level:.0f} kbps vs {center:.0f} kbps (z={zscore:.1f})",
+            )
+    return None
+
+
+def find_relay_anomalies(now=None):
+    """
+    Check every relay currently marked running. Returns (relay, kind, detail)
+    triples, where relay is a dict with id, session_id, session uuid and
+    platform. Relays still in their restart cool-down are left out.
+    """
+    now = now or time.time()
+    relays = list(
+        StreamingRelayStatus.objects.filter(
+            session__status__in=["live", "partial"], status="success"
+        ).values(
+            "id", "session_id", "session__session_uuid", "platform", "last_attempted"
+        )
+    )
+    if not relays:
+        return []
+
+    windows = read_many(
+        [
+            relay_series(relay["session__session_uuid"], relay["platform"])
+            for relay in relays
+        ],
+        now - RELAY_STALL_WINDOW,
+        now,
+        step=1,
+    )
+
+    anomalies = []
+    for relay, window in zip(relays, windows):
+        age = now - relay["last_attempted"].timestamp()
+        verdict = classify(window["bitrate"], window["speed"], age)
+        if verdict is None:
+            continue
+        kind, detail = verdict
+        metrics.inc(
+            "streamlab_relay_anomalies_total",
+            {"platform": relay["platform"], "kind": kind},
+        )
+        anomalies.append((relay, kind, detail))
+
+    if not any(kind in RESTART_KINDS for _, kind, _ in anomalies):
+        return anomalies
+
+    # Claim a cool-down per relay so repeated sweeps do not restart it again
+    # while the replacement is still connecting.
+    conn = get_redis_connection("default")
+    pipe = conn.pipeline(transaction=False)
+    restartable = [a for a in anomalies if a[1] in RESTART_KINDS]
+    for relay, _, _ in restartable:
+        pipe.set(
+            _cooldown_key(relay["session__session_uuid"], relay["platform"]),
+            1,
+            nx=True,
+            ex=RELAY_RESTART_COOLDOWN,
+        )
+    claimed = pipe.execute()
+    cooling = {
+        relay["id"] for (relay, _, _), won in zip(restartable, claimed) if not won
+    }
+    return [a for a in anomalies if a[0]["id"] not in cooling]
@@ -0,0 +1,350 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+import redis.asyncio as aioredis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from .models import StreamingPlatformAccount, StreamingRelayStatus, StreamingSession
+from .srs_utils import list_streams
+from .timeseries import session_series
+
+logger = logging.getLogger(__name__)
+
+# How often a watched session's health is refreshed from SRS and the database.
+# Whatever the number of watchers, each session costs one refresh per interval.
+STREAM_HEALTH_INTERVAL = getattr(settings, "STREAM_HEALTH_INTERVAL", 2.0)
+STREAM_HEALTH_TTL = getattr(settings, "STREAM_HEALTH_TTL", 60)
+# Seconds a relay may stay pending (or unrecorded) before the sweep restarts it.
+RELAY_RESTART_GRACE = getattr(settings, "RELAY_RESTART_GRACE", 60)
+
+_SRS_STREAMS_KEY = "health:srs-streams"
+_SRS_FRAMES_KEY = "metrics:srs-frames"
+
+
+def _snapshot_key(session_uuid):
+    return f"health:snapshot:{session_uuid}"
+
+
+def _poll_lock_key(session_uuid):
+    return f"health:poll-lock:{session_uuid}"
+
+
+def get_srs_streams(refresh=False):
+    """
+    The SRS stream list, shared by every session refreshed within one interval:
+    a single /api/v1/streams/ call covers all of them. None if SRS is down.
+    """
+    conn = get_redis_connection("default")
+    cached = None if refresh else conn.get(_SRS_STREAMS_KEY)
+    if cached is not None:
+        return json.loads(cached)
+    streams = list_streams()
+    if streams is not None:
+        conn.set(
+            _SRS_STREAMS_KEY,
+            json.dumps(streams),
+            px=int(STREAM_HEALTH_INTERVAL * 1000),
+        )
+    return streams
+
+
+def build_snapshot(session_id, stream_key, previous=None):
+    """
+    Read a session's current health: its status, the relay states and the
+    publisher's bitrate and frame rate from SRS. `previous` is the last
+    snapshot, used to turn SRS frame counters into frames per second.
+    """
+    now = time.time()
+    session_status = (
+        StreamingSession.objects.filter(id=session_id)
+        .values_list("status", flat=True)
+        .first()
+    )
+    relays = list(
+        StreamingRelayStatus.objects.filter(session_id=session_id)
+        .order_by("platform")
+        .values("platform", "rtmp_url", "status", "last_attempted", "log_summary")
+    )
+
+    streams = get_srs_streams()
+    stream = None
+    if streams:
+        stream = next((s for s in streams if s.get("name") == stream_key), None)
+
+    health = {
+        "session_status": session_status,
+        "srs_reachable": streams is not None,
+        "publishing": bool(stream and (stream.get("publish") or {}).get("active")),
+        "kbps_in": None,
+        "kbps_out": None,
+        "fps": None,
+        "clients": None,
+        "relays": relays,
+    }
+    frames = None
+    if stream:
+        kbps = stream.get("kbps") or {}
+        health["kbps_in"] = kbps.get("recv_30s")
+        health["kbps_out"] = kbps.get("send_30s")
+        health["clients"] = stream.get("clients")
+        frames = stream.get("frames")
+        if (
+            frames is not None
+            and previous
+            and previous.get("frames") is not None
+            and now > previous["sampled_at"]
+        ):
+            delta = frames - previous["frames"]
+            if delta >= 0:
+                health["fps"] = round(delta / (now - previous["sampled_at"]), 1)
+
+    return {"health": health, "frames": frames, "sampled_at": now}
+
+
+class HealthHub:
+    """
+    Per-worker fan-out of session health. Each worker runs one poller per
+    session with local watchers; across workers, a Redis lock lets only one of
+    them refresh the snapshot per interval while the rest read it back.
+    """
+
+    def __init__(self):
+        self.listeners = defaultdict(set)
+        self.pollers = {}
+        # Last frame pushed per session, replayed to clients that join later.
+        self._last_frames = {}
+        self._redis = None
+        self._token = f"{os.getpid()}:{id(self)}"
+
+    def _redis_url(self):
+        return getattr(
+            settings,
+            "CHAT_BROADCAST_REDIS_URL",
+            settings.CACHES["default"]["LOCATION"],
+        )
+
+    def subscribe(self, session_uuid, session_id, stream_key):
+        session_uuid = str(session_uuid)
+        queue = asyncio.Queue(maxsize=10)
+        self.listeners[session_uuid].add(queue)
+        poller = self.pollers.get(session_uuid)
+        if poller is None or poller.done():
+            if self._redis is None:
+                self._redis = aioredis.from_url(self._redis_url())
+            self.pollers[session_uuid] = asyncio.create_task(
+                self._poll(session_uuid, session_id, stream_key)
+            )
+        elif self._last_frames.get(session_uuid):
+            # Late joiners get the current state straight away.
+            queue.put_nowait(self._last_frames[session_uuid])
+        return queue
+
+    def unsubscribe(self, session_uuid, queue):
+        session_uuid = str(session_uuid)
+        queues = self.listeners.get(session_uuid)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.listeners[session_uuid]
+            self._last_frames.pop(session_uuid, None)
+            poller = self.pollers.pop(session_uuid, None)
+            if poller:
+                poller.cancel()
+
+    async def _poll(self, session_uuid, session_id, stream_key):
+        interval_ms = int(STREAM_HEALTH_INTERVAL * 1000)
+        while True:
+            try:
+                snapshot = await self._refresh(
+                    session_uuid, session_id, stream_key, interval_ms
+                )
+            except Exception as e:
+                logger.warning("Health poll failed for %s: %s", session_uuid, e)
+                snapshot = None
+
+            if snapshot is not None:
+                frame = (
+                    b"data: "
+                    + json.dumps(snapshot["health"], cls=DjangoJSONEncoder).encode()
+                    + b"\n\n"
+                )
+                if frame != self._last_frames.get(session_uuid):
+                    self._last_frames[session_uuid] = frame
+                    for queue in list(self.listeners.get(session_uuid, ())):
+                        if queue.full():
+                            queue.get_nowait()
+                        queue.put_nowait(frame)
+            await asyncio.sleep(STREAM_HEALTH_INTERVAL)
+
+    async def _refresh(self, session_uuid, session_id, stream_key, interval_ms):
+        """Refresh the shared snapshot if this worker wins the lock, else read it."""
+        key = _snapshot_key(session_uuid)
+        won = await self._redis.set(
+            _poll_lock_key(session_uuid), self._token, nx=True, px=interval_ms
+        )
+        raw = await self._redis.get(key)
+        previous = json.loads(raw) if raw else None
+        if not won:
+            return previous
+
+        snapshot = await sync_to_async(build_snapshot)(session_id, stream_key, previous)
+        await self._redis.set(
+            key, json.dumps(snapshot, cls=DjangoJSONEncoder), ex=STREAM_HEALTH_TTL
+        )
+        return snapshot
+
+
+hub = HealthHub()
+
+
+def relay_state_counts():
+    """(labels, count) pairs of relays of live sessions by platform and state."""
+    rows = (
+        StreamingRelayStatus.objects.filter(session__status__in=["live", "partial"])
+        .values("platform", "status")
+        .annotate(count=Count("id"))
+    )
+    return [
+        ({"platform": row["platform"], "state": row["status"]}, row["count"])
+        for row in rows
+    ]
+
+
+def plan_relay_restarts(streams, now=None):
+    """
+    Diff the relays every live session should have against their recorded
+    state and return the (session, account) pairs to restart. Only sessions
+    whose ingest SRS reports as publishing are considered. A relay needs a
+    restart when its last attempt failed, or when it has been pending (or
+    never recorded) for longer than RELAY_RESTART_GRACE. Planned relays are
+    marked pending so the next sweep leaves them alone while they start.
+    """
+    now = now or timezone.now()
+    publishing = {
+        stream.get("name")
+        for stream in streams
+        if (stream.get("publish") or {}).get("active")
+    }
+    if not publishing:
+        return []
+
+    sessions = list(
+        StreamingSession.objects.filter(
+            status__in=["live", "partial"],
+            configuration__stream_key__in=publishing,
+        ).select_related("configuration")
+    )
+    if not sessions:
+        return []
+
+    accounts = defaultdict(list)
+    for account in StreamingPlatformAccount.objects.filter(
+        user_id__in={session.configuration.user_id for session in sessions},
+        is_active=True,
+        rtmp_url__isnull=False,
+        stream_key__isnull=False,
+    ):
+        accounts[account.user_id].append(account)
+
+    recorded = {
+        (row["session_id"], row["platform"]): row
+        for row in StreamingRelayStatus.objects.filter(session__in=sessions).values(
+            "id", "session_id", "platform", "status", "last_attempted"
+        )
+    }
+
+    cutoff = now - timedelta(seconds=RELAY_RESTART_GRACE)
+    restarts, retry_ids, new_rows = [], [], []
+    for session in sessions:
+        for account in accounts[session.configuration.user_id]:
+            row = recorded.get((session.id, account.platform))
+            if row is None:
+                if session.session_start >= cutoff:
+                    continue  # The initial relay start may still be running.
+                new_rows.append(
+                    StreamingRelayStatus(
+                        session=session,
+                        platform=account.platform,
+                        rtmp_url=account.rtmp_url,
+                        status="pending",
+                    )
+                )
+            elif row["status"] == "error" or (
+                row["status"] == "pending" and row["last_attempted"] < cutoff
+            ):
+                retry_ids.append(row["id"])
+            else:
+                continue
+            restarts.append((session, account))
+
+    if retry_ids:
+        StreamingRelayStatus.objects.filter(id__in=retry_ids).update(
+            status="pending", last_attempted=now
+        )
+    if new_rows:
+        StreamingRelayStatus.objects.bulk_create(new_rows)
+    return restarts
+
+
+def record_session_metrics(streams, now=None):
+    """
+    Append one sample per publishing live session to its metrics series:
+    ingest and egress bitrate, frame rate and SRS client count. Frame rate
+    comes from the SRS frame counter since the previous sample. Returns the
+    number of sessions sampled.
+    """
+    now = now or time.time()
+    by_name = {
+        stream.get("name"): stream
+        for stream in streams
+        if (stream.get("publish") or {}).get("active")
+    }
+    if not by_name:
+        return 0
+    sessions = list(
+        StreamingSession.objects.filter(
+            status__in=["live", "partial"],
+            configuration__stream_key__in=by_name,
+        ).values_list("session_uuid", "configuration__stream_key")
+    )
+    if not sessions:
+        return 0
+
+    conn = get_redis_connection("default")
+    names = [stream_key for _, stream_key in sessions]
+    previous = dict(zip(names, conn.hmget(_SRS_FRAMES_KEY, names)))
+    pipe = conn.pipeline(transaction=False)
+    frames_now = {}
+    for session_uuid, stream_key in sessions:
+        stream = by_name[stream_key]
+        kbps = stream.get("kbps") or {}
+        sample = {
+            "kbps_in": kbps.get("recv_30s"),
+            "kbps_out": kbps.get("send_30s"),
+            "clients": stream.get("clients"),
+        }
+        frames = stream.get("frames")
+        if frames is not None:
+            frames_now[stream_key] = f"{frames}:{now}"
+            if previous.get(stream_key):
+                last_frames, last_ts = previous[stream_key].decode().split(":")
+                elapsed = now - float(last_ts)
+                if elapsed > 0 and frames >= int(last_frames):
+                    sample["fps"] = (frames - int(last_frames)) / elapsed
+        session_series(session_uuid).record(sample, ts=now, pipe=pipe)
+    if frames_now:
+        pipe.hset(_SRS_FRAMES_KEY, mapping=frames_now)
+        pipe.expire(_SRS_FRAMES_KEY, STREAM_HEALTH_TTL)
+    pipe.execute()
+    return len(sessions)
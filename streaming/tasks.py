@@ -1,13 +1,26 @@
 import subprocess
 import logging
+from urllib.parse import urlparse
 from celery import shared_task, group, chain
 from django.db import transaction
 from django.utils import timezone
 from django.conf import settings
 import requests
 
-from .models import StreamingSession, StreamingPlatformAccount, ScheduledVideo
-from .srs_utils import start_streaming_via_srs, stop_streaming_via_srs, get_stream_stats
+from .models import (
+    StreamingSession,
+    StreamingPlatformAccount,
+    StreamingRelayStatus,
+    ScheduledVideo,
+)
+from celery.signals import worker_ready
+
+from . import metrics
+from .admission import admit_relays
+from .proc_accounting import HOST, relay_queue, sampler
+from .relay_watch import relay_command, relay_id, transcode_args, watch_relay
+from .srs_utils import start_streaming_via_srs, stop_streaming_via_srs
+from .timeseries import relay_series
 
 logger = logging.getLogger(__name__)
 
@@ -18,12 +31,71 @@ class StreamingError(Exception):
     pass
 
 
+@worker_ready.connect
+def _start_proc_sampler(sender, **kwargs):
+    """
+    Report this host's resources for relay placement before it runs any, if
+    this worker consumes the host's relay queue: admission sends relays placed
+    here to that queue, and they would wait forever on any other worker.
+    """
+    queues = {queue.name for queue in sender.task_consumer.queues}
+    if relay_queue(HOST) in queues:
+        sampler.take_relays()
+
+
+def _record_relay_status(session_id, account, status, log_summary=None, **fields):
+    """Record the observed state of one relay; read by the health sweep."""
+    StreamingRelayStatus.objects.update_or_create(
+        session_id=session_id,
+        platform=account.platform,
+        defaults={
+            "rtmp_url": account.rtmp_url,
+            "status": status,
+            "log_summary": log_summary,
+            **fields,
+        },
+    )
+
+
+def _source_rtmp(session, streams=None):
+    """
+    The ingest URL a session is published on, for relays restarted without the
+    one on_publish reported: the app SRS lists the stream under, or else the
+    app in the configuration's RTMP endpoint.
+    """
+    stream_key = session.configuration.stream_key
+    app = next(
+        (
+            stream.get("app")
+            for stream in streams or ()
+            if stream.get("name") == stream_key and stream.get("app")
+        ),
+        None,
+    )
+    if app is None:
+        app = urlparse(session.configuration.rtmp_url or "").path.strip("/") or "live"
+    return f"rtmp://{settings.SRS_SERVER_HOST}/{app}/{stream_key}"
+
+
+def _relay_signature(session, admitted, source_rtmp):
+    """A relay_to_single_social call for one admitted relay, on its queue."""
+    account = admitted["account"]
+    return relay_to_single_social.s(
+        session.id,
+        f"{account.rtmp_url.rstrip('/')}/{account.stream_key}",
+        source_rtmp,
+        account.id,
+        admitted["transcode_kbps"],
+    ).set(queue=admitted["queue"])
+
+
 @shared_task(bind=True, max_retries=3)
 def relay_to_single_social(
-    self, session_id, platform_rtmp, source_rtmp, account_id=None
+    self, session_id, platform_rtmp, source_rtmp, account_id=None, transcode_kbps=None
 ):
     """
-    Relay the central RTMP stream to one external social endpoint with robust error handling
+    Relay the central RTMP stream to one external social endpoint with robust error handling.
+    With transcode_kbps the video is re-encoded to that bitrate instead of copied.
     """
     try:
         with transaction.atomic():
@@ -36,24 +108,13 @@ def relay_to_single_social(
                     id=account_id, user=session.configuration.user
                 )
 
-            # Build the FFmpeg command
-            command = [
-                "ffmpeg",
-                "-loglevel",
-                "info",
-                "-re",  # Read input at native frame rate
-                "-i",
-                source_rtmp,
-                "-c:v",
-                "copy",  # Stream copy (no re-encoding)
-                "-c:a",
-                "copy",
-                "-f",
-                "flv",
-                "-flvflags",
-                "no_duration_filesize",
-                platform_rtmp,
-            ]
+            if transcode_kbps:
+                command = relay_command(
+                    source_rtmp, platform_rtmp, transcode_args(transcode_kbps)
+                )
+            else:
+                # Stream copy (no re-encoding)
+                command = relay_command(source_rtmp, platform_rtmp)
 
             logger.info(
                 "Starting relay for session %s to %s (Account: %s)",
@@ -70,22 +131,41 @@ def relay_to_single_social(
                 universal_newlines=True,
             )
 
-            # Update status
-            if account:
-                account.relay_status = "active"
-                account.relay_last_updated = timezone.now()
-                account.save()
+            # Keep following the relay after this task returns.
+            stderr_tail = watch_relay(
+                process,
+                (
+                    relay_series(session.session_uuid, account.platform)
+                    if account
+                    else None
+                ),
+                {
+                    "session": str(session.session_uuid),
+                    "platform": account.platform if account else "unknown",
+                    "user": session.configuration.user_id,
+                },
+                relay_id(session.session_uuid, account.platform) if account else None,
+            )
 
             # Wait for process to complete (with timeout)
             try:
-                stdout, stderr = process.communicate(timeout=10)
+                process.wait(timeout=10)
                 if process.returncode != 0:
                     raise StreamingError(
-                        f"FFmpeg failed with code {process.returncode}: {stderr}"
+                        f"FFmpeg failed with code {process.returncode}: "
+                        f"{''.join(stderr_tail)}"
                     )
             except subprocess.TimeoutExpired:
                 # If we get here, the process is running successfully
                 logger.info("Relay to %s established successfully", platform_rtmp)
+                if account:
+                    _record_relay_status(
+                        session_id,
+                        account,
+                        "success",
+                        transcode_kbps=transcode_kbps,
+                        host=HOST,
+                    )
                 return {
                     "status": "success",
                     "platform_rtmp": platform_rtmp,
@@ -102,10 +182,7 @@ def relay_to_single_social(
         logger.error("Error in relay_to_single_social: %s", str(e))
 
         if account:
-            account.relay_status = "failed"
-            account.relay_log = str(e)
-            account.relay_last_updated = timezone.now()
-            account.save()
+            _record_relay_status(session_id, account, "error", str(e))
 
         raise self.retry(exc=e, countdown=60)
 
@@ -136,22 +213,30 @@ def relay_to_social_task(self, session_id, source_rtmp):
                     "No active social accounts with valid RTMP settings"
                 )
 
-            # Prepare tasks for each platform
-            tasks = []
-            for account in social_accounts:
-                endpoint = f"{account.rtmp_url.rstrip('/')}/{account.stream_key}"
-                tasks.append(
-                    relay_to_single_social.s(
-                        session_id, endpoint, source_rtmp, account.id
-                    ).set(queue=f"relay_{account.platform}")
+            # Admit each destination against the user's plan and place it on
+            # the relay host with the most headroom.
+            admitted, refused = admit_relays(session, list(social_accounts))
+            if not admitted:
+                session.status = "failed"
+                session.save()
+                raise StreamingError(
+                    "No relays admitted: "
+                    + "; ".join(f"{a.platform}: {reason}" for a, reason in refused)
                 )
+            tasks = [
+                _relay_signature(session, relay, source_rtmp) for relay in admitted
+            ]
 
             # Execute tasks in parallel
             job = group(tasks)
             results = job.apply_async().get(disable_sync_subtasks=False)
 
-            # Check results
+            # Check results; refused destinations count as failed.
             failed_relays = [r for r in results if r.get("status") != "success"]
+            failed_relays += [
+                {"status": "refused", "platform": account.platform, "reason": reason}
+                for account, reason in refused
+            ]
 
             if failed_relays:
                 session.status = "partial"
@@ -159,7 +244,7 @@ def relay_to_social_task(self, session_id, source_rtmp):
                 logger.error("Some relays failed: %s", failed_relays)
                 return {
                     "status": "partial",
-                    "success_count": len(results) - len(failed_relays),
+                    "success_count": len(results) + len(refused) - len(failed_relays),
                     "failed_count": len(failed_relays),
                     "failed_relays": failed_relays,
                 }
@@ -249,41 +334,230 @@ def unpublish_scheduled_video_task(self, scheduled_id):
         raise self.retry(exc=e, countdown=60)
 
 
-@shared_task
-def monitor_stream_health(session_id):
+def queue_relay_restarts(restarts, reason, countdown=None):
     """
-    Periodic task to monitor stream health and restart failed relays
+    Queue relay_to_single_social for (session, account) pairs as one group,
+    through admission and placement like any relay start. Returns the
+    (account, reason) pairs that were refused.
     """
-    try:
-        session = StreamingSession.objects.get(id=session_id)
-        if session.status not in ["live", "partial"]:
-            return  # Only monitor active sessions
-
-        # Check SRS stream status
-        stats = get_stream_stats("live", session.configuration.stream_key)
-        if not stats or stats.get("code") != 0:
-            logger.warning(
-                "Stream %s not found in SRS", session.configuration.stream_key
+    from .stream_health import get_srs_streams
+
+    by_session = {}
+    for session, account in restarts:
+        by_session.setdefault(session.id, (session, []))[1].append(account)
+
+    streams = get_srs_streams()
+    signatures, refused = [], []
+    for session, accounts in by_session.values():
+        admitted, session_refused = admit_relays(session, accounts)
+        refused.extend(session_refused)
+        source_rtmp = _source_rtmp(session, streams)
+        for relay in admitted:
+            signatures.append(
+                _relay_signature(session, relay, source_rtmp).set(countdown=countdown)
+            )
+            metrics.inc(
+                "streamlab_relay_restarts_total",
+                {"platform": relay["account"].platform, "reason": reason},
             )
-            return
+    if signatures:
+        group(signatures).apply_async()
+    return refused
 
-        # Check and restart failed relays
-        failed_accounts = StreamingPlatformAccount.objects.filter(
-            user=session.configuration.user, relay_status="failed"
+
+@shared_task(ignore_result=True)
+def monitor_stream_health():
+    """
+    Periodic sweep (Celery beat) over all live and partial sessions. SRS is
+    asked once for every stream, relay state is diffed against what each
+    session should be relaying, and only the relays that need it are
+    restarted, in one batch.
+    """
+    from .stream_health import (
+        get_srs_streams,
+        plan_relay_restarts,
+        relay_state_counts,
+    )
+
+    metrics.set_family("streamlab_relays", relay_state_counts())
+
+    streams = get_srs_streams()
+    if streams is None:
+        logger.warning("SRS unreachable, skipping stream health sweep")
+        return 0
+
+    restarts = plan_relay_restarts(streams)
+    if not restarts:
+        return 0
+
+    queue_relay_restarts(restarts, "sweep")
+    logger.info("Stream health sweep restarting %d relays", len(restarts))
+    return len(restarts)
+
+
+@shared_task(ignore_result=True)
+def detect_relay_stalls():
+    """
+    Periodic task (Celery beat, every few seconds) that checks each running
+    relay's recent bitrate and speed for stalls, throttling and drift. Only
+    the affected destination is restarted: its ffmpeg is asked to stop and a
+    fresh relay is queued for that one account.
+    """
+    from .relay_watch import RELAY_CONTROL_INTERVAL, request_stop
+    from .stall_detection import RESTART_KINDS, find_relay_anomalies
+
+    anomalies = find_relay_anomalies()
+    for relay, kind, detail in anomalies:
+        logger.warning(
+            "Relay %s of session %s: %s (%s)",
+            relay["platform"],
+            relay["session__session_uuid"],
+            kind,
+            detail,
+        )
+    to_restart = [(r, kind) for r, kind, _ in anomalies if kind in RESTART_KINDS]
+    if not to_restart:
+        return 0
+
+    sessions = {
+        session.id: session
+        for session in StreamingSession.objects.filter(
+            id__in={relay["session_id"] for relay, _ in to_restart}
+        ).select_related("configuration")
+    }
+    accounts = {}
+    for account in StreamingPlatformAccount.objects.filter(
+        user_id__in={s.configuration.user_id for s in sessions.values()},
+        platform__in={relay["platform"] for relay, _ in to_restart},
+        is_active=True,
+        rtmp_url__isnull=False,
+        stream_key__isnull=False,
+    ):
+        accounts.setdefault((account.user_id, account.platform), account)
+
+    restarts = []
+    for relay, kind in to_restart:
+        session = sessions[relay["session_id"]]
+        account = accounts.get((session.configuration.user_id, relay["platform"]))
+        request_stop(relay_id(relay["session__session_uuid"], relay["platform"]))
+        if account is not None:
+            restarts.append((session, account, kind))
+
+    StreamingRelayStatus.objects.filter(
+        id__in=[relay["id"] for relay, _ in to_restart]
+    ).update(status="pending", last_attempted=timezone.now())
+    # Give the old ffmpeg time to receive its stop request before the new
+    # one connects to the same destination.
+    for kind in {kind for _, _, kind in restarts}:
+        queue_relay_restarts(
+            [(s, a) for s, a, k in restarts if k == kind],
+            kind,
+            countdown=RELAY_CONTROL_INTERVAL * 2,
         )
+    return len(restarts)
 
-        if failed_accounts.exists():
-            logger.info(
-                "Found %d failed relays, attempting to restart", failed_accounts.count()
-            )
-            source_rtmp = session.configuration.get_full_rtmp_url()
-            for account in failed_accounts:
-                relay_to_single_social.delay(
-                    session_id,
-                    f"{account.rtmp_url.rstrip('/')}/{account.stream_key}",
-                    source_rtmp,
-                    account.id,
-                )
 
-    except Exception as e:
-        logger.error("Error in monitor_stream_health: %s", str(e))
+@shared_task(ignore_result=True)
+def sample_stream_metrics():
+    """
+    Periodic task (Celery beat, every second) that appends a sample to the
+    metrics series of every publishing session. It also refreshes the shared
+    SRS stream list that the health streams read.
+    """
+    from .stream_health import get_srs_streams, record_session_metrics
+
+    streams = get_srs_streams(refresh=True)
+    if streams is None:
+        return 0
+    return record_session_metrics(streams)
+
+
+@shared_task(ignore_result=True)
+def flush_chat_buffers():
+    """
+    Periodic task (Celery beat) that persists buffered chat messages for every
+    session with pending entries. The beat interval is the durability bound:
+    an acknowledged message reaches the database within one tick.
+    """
+    from .chat_buffer import flush_all
+
+    written = flush_all()
+    if written:
+        logger.debug("Flushed %d buffered chat messages", written)
+    return written
+
+
+@shared_task(ignore_result=True)
+def flush_chat_buffer(session_uuid):
+    """
+    Flush a single session's chat buffer, requested by the writer when the
+    backlog grows past CHAT_BUFFER_MAX_PENDING.
+    """
+    from .chat_buffer import flush_session
+
+    return flush_session(session_uuid)
+
+
+@shared_task(ignore_result=True)
+def rollup_session_reactions(session_uuid):
+    """
+    Fold a finished session's live reaction counters into its compact
+    reaction_summary and free the Redis hash.
+    """
+    from .reactions import rollup_session
+
+    summary = rollup_session(session_uuid)
+    if summary:
+        logger.info(
+            "Rolled up reactions for session %s: %s", session_uuid, summary["totals"]
+        )
+
+
+@shared_task(ignore_result=True)
+def expire_recording_uploads():
+    """
+    Periodic task (Celery beat) that finalizes live recording uploads whose
+    recorder went away and deletes other resumable uploads abandoned before
+    they were finalized, with their partial files.
+    """
+    from .uploads import expire_uploads
+
+    return expire_uploads()
+
+
+@shared_task(ignore_result=True)
+def finalize_recording_task(recording_id):
+    """
+    Remux a finished session's SRS segments into its VOD. Failures are kept on
+    the recording; one abandoned mid-remux is picked up again by
+    finalize_pending_recordings.
+    """
+    from .recordings import finalize_recording
+
+    finalize_recording(recording_id)
+
+
+@shared_task(ignore_result=True)
+def finalize_pending_recordings():
+    """
+    Periodic task (Celery beat) that finalizes recordings of ended sessions
+    whose end was never seen, e.g. a missed on_unpublish, and of sessions
+    that stopped sending segments without ever ending (failed or partial).
+    """
+    from .recordings import pending_recordings
+
+    pending = list(pending_recordings())
+    for recording_id in pending:
+        finalize_recording_task.delay(recording_id)
+    return len(pending)
+
+
+@shared_task(ignore_result=True)
+def process_video_task(job_id):
+    """
+    Post-process an uploaded recording (see media_processing.py). Routed to
+    the "media" queue, which its own CPU-bounded worker consumes.
+    """
+    from .media_processing import process_video
+
+    process_video(job_id)
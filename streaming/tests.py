@@ -0,0 +1,861 @@
+import asyncio
+import hashlib
+import io
+import json
+import math
+import os
+import shutil
+import struct
+import tempfile
+import time
+from collections import defaultdict
+from datetime import timedelta
+from unittest import mock
+
+import fakeredis
+import fakeredis.aioredis
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+
+from streaming import (
+    chat_buffer,
+    moderation,
+    recordings,
+    stall_detection,
+    stream_health,
+    tasks,
+    uploads,
+)
+from streaming.admission import admit_relays
+from streaming.chat_ingest import (
+    ChatIngestService,
+    FakeChatProvider,
+    RateLimiter,
+    load_sources,
+)
+from streaming.media_serving import RangeFile, byte_range
+from streaming.models import (
+    ChatMessage,
+    Recording,
+    StreamingConfiguration,
+    StreamingPlatformAccount,
+    StreamingRelayStatus,
+    StreamingSession,
+)
+from streaming.moderation import TermMatcher
+from streaming.proc_accounting import HOST, relay_queue
+from streaming.reactions import ReactionHub
+from streaming.timeseries import TimeSeries, read_many
+from streaming.upload_handlers import RequestBodyLimit, upload_limit
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class RedisTestCase(TestCase):
+    """
+    A test case whose `redis_modules` get an in-memory Redis from
+    get_redis_connection(), plus a user with a session to write to.
+    """
+
+    redis_modules = ()
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        for module in self.redis_modules:
+            patcher = mock.patch(
+                f"{module}.get_redis_connection", return_value=self.redis
+            )
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.user = get_user_model().objects.create_user(
+            username="streamer", email="streamer@example.com", password="pw"
+        )
+        self.configuration = StreamingConfiguration.objects.create(
+            user=self.user,
+            stream_title="Test stream",
+            rtmp_url="rtmp://localhost/live",
+            is_active=True,
+        )
+        self.session = StreamingSession.objects.create(configuration=self.configuration)
+
+
+class ChatBufferTests(RedisTestCase):
+    redis_modules = ("streaming.chat_buffer", "streaming.moderation")
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch("streaming.chat_buffer.publish")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _append(self, *texts, created_at=None):
+        return chat_buffer.append_messages(
+            self.session.session_uuid,
+            [
+                {
+                    "user_id": self.user.pk,
+                    "username": self.user.username,
+                    "text": text,
+                    "created_at": (created_at or timezone.now()).isoformat(),
+                }
+                for text in texts
+            ],
+        )
+
+    def _flush(self, at=None):
+        with mock.patch(
+            "streaming.chat_buffer.timezone.now", return_value=at or timezone.now()
+        ):
+            return chat_buffer.flush_session(str(self.session.session_uuid))
+
+    def _trim_everything(self):
+        # Redis trims approximately; make the trim the flush asked for exact.
+        key = chat_buffer._stream_key(self.session.session_uuid)
+        trimmed = chat_buffer._decode(
+            self.redis.get(chat_buffer._trimmed_key(self.session.session_uuid))
+        )
+        ms, seq = chat_buffer._parse_id(trimmed)
+        self.redis.xtrim(key, minid=f"{ms}-{seq + 1}", approximate=False)
+
+    def test_first_read_returns_history_and_tail(self):
+        self._append("one", "two")
+        self._flush()
+        self._append("three")
+        messages, cursor, reset = chat_buffer.read_messages(self.session)
+        self.assertEqual([m["text"] for m in messages], ["one", "two", "three"])
+        self.assertTrue(reset)
+        self.assertEqual(ChatMessage.objects.count(), 2)
+
+        self._append("four")
+        messages, _, reset = chat_buffer.read_messages(self.session, after=cursor)
+        self.assertEqual([m["text"] for m in messages], ["four"])
+        self.assertFalse(reset)
+
+    def test_history_follows_stream_order_not_worker_clocks(self):
+        now = timezone.now()
+        self._append("first", created_at=now)
+        self._append("second", created_at=now - timedelta(seconds=5))
+        self._flush()
+        messages, _, _ = chat_buffer.read_messages(self.session)
+        self.assertEqual([m["text"] for m in messages], ["first", "second"])
+
+    def test_caught_up_cursor_survives_a_trim(self):
+        self._append("one", "two")
+        _, cursor, _ = chat_buffer.read_messages(self.session)
+        later = timezone.now() + timedelta(
+            seconds=chat_buffer.CHAT_BUFFER_RETENTION + 60
+        )
+        self._flush(at=later)
+        self._trim_everything()
+
+        self._append("three")
+        messages, _, reset = chat_buffer.read_messages(self.session, after=cursor)
+        self.assertEqual([m["text"] for m in messages], ["three"])
+        self.assertFalse(reset)
+
+    def test_cursor_behind_the_trim_resets(self):
+        ids = self._append("one", "two", "three")
+        later = timezone.now() + timedelta(
+            seconds=chat_buffer.CHAT_BUFFER_RETENTION + 60
+        )
+        self._flush(at=later)
+        # "two" is gone; only the last flushed entry is kept.
+        self._trim_everything()
+        self._append("four")
+
+        messages, _, reset = chat_buffer.read_messages(self.session, after=ids[0])
+        self.assertTrue(reset)
+        self.assertEqual([m["text"] for m in messages], ["one", "two", "three", "four"])
+
+
+class TermMatcherTests(TestCase):
+    def test_finds_every_term_in_one_pass(self):
+        matcher = TermMatcher(["spam", "scam", "am"], whole_words=False)
+        self.assertEqual(len(matcher), 3)
+        self.assertEqual(
+            sorted(matcher.finditer("a spam scam")), [(2, 6), (4, 6), (7, 11), (9, 11)]
+        )
+
+    def test_terms_are_case_insensitive_and_blank_lines_ignored(self):
+        matcher = TermMatcher(["  Spam ", "", "spam"])
+        self.assertEqual(len(matcher), 1)
+        self.assertTrue(matcher.search("SPAM!"))
+
+    def test_whole_words_only_by_default(self):
+        matcher = TermMatcher(["ass"])
+        self.assertFalse(matcher.search("a classic pass"))
+        self.assertTrue(matcher.search("you ass."))
+        self.assertTrue(TermMatcher(["ass"], whole_words=False).search("classic"))
+
+    def test_phrases_and_overlapping_terms(self):
+        matcher = TermMatcher(["buy now", "now"])
+        self.assertEqual(matcher.mask("Buy now, now!"), "*******, ***!")
+
+    def test_mask_keeps_clean_text(self):
+        self.assertEqual(TermMatcher(["spam"]).mask("all good"), "all good")
+
+
+class ModerationTests(RedisTestCase):
+    redis_modules = ("streaming.moderation",)
+
+    def setUp(self):
+        for patcher in (
+            mock.patch.dict("streaming.moderation._session_configs", clear=True),
+            mock.patch.dict("streaming.moderation._compiled", clear=True),
+            mock.patch("streaming.moderation.CHAT_MODERATION_RELOAD_INTERVAL", 0),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        super().setUp()
+
+    def _moderate(self, *texts):
+        messages = [{"text": text} for text in texts]
+        return [
+            m["text"]
+            for m in moderation.moderate_messages(self.session.session_uuid, messages)
+        ]
+
+    def test_messages_pass_untouched_without_banned_terms(self):
+        self.assertEqual(self._moderate("hello"), ["hello"])
+
+    def test_banned_terms_are_masked(self):
+        self.configuration.banned_terms = "spam\nscam"
+        self.configuration.save()
+        self.assertEqual(self._moderate("no spam here", "hi"), ["no **** here", "hi"])
+
+    def test_block_mode_drops_messages(self):
+        self.configuration.banned_terms = "spam"
+        self.configuration.save()
+        with mock.patch("streaming.moderation.CHAT_MODERATION_ACTION", "block"):
+            self.assertEqual(self._moderate("spam", "fine"), ["fine"])
+
+    def test_saving_the_configuration_recompiles_the_matcher(self):
+        self.configuration.banned_terms = "spam"
+        self.configuration.save()
+        self.assertEqual(self._moderate("spam scam"), ["**** scam"])
+        self.configuration.banned_terms = "scam"
+        self.configuration.save()
+        self.assertEqual(self._moderate("spam scam"), ["spam ****"])
+
+
+class ChatIngestTests(RedisTestCase):
+    redis_modules = ("streaming.chat_buffer", "streaming.moderation")
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch("streaming.chat_buffer.publish")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        StreamingPlatformAccount.objects.create(
+            user=self.user,
+            platform="youtube",
+            account_username="channel",
+            access_token="token",
+            is_active=True,
+        )
+        self.service = ChatIngestService(use_fake=True)
+        self.provider = FakeChatProvider(None, self.service.emit)
+        (self.source,) = load_sources(["youtube"]).values()
+
+    def _poll(self, times=1):
+        async def poll():
+            for _ in range(times):
+                messages, _ = await self.provider.poll(self.source)
+                # Overlapping polls hand back the same messages again.
+                fresh = self.source.unseen(messages + messages)
+                if fresh:
+                    self.service.emit(self.source, fresh)
+            await self.service.flush()
+
+        with mock.patch("streaming.chat_ingest.random.randint", return_value=2):
+            async_to_sync(poll)()
+
+    def test_fake_source_follows_the_account_platform(self):
+        self.assertEqual(self.source.platform, "youtube")
+        self.assertEqual(self.source.session_uuid, self.session.session_uuid)
+
+    def test_messages_are_normalized_into_the_buffer(self):
+        self._poll()
+        pending = chat_buffer.pending_messages(self.session.session_uuid)
+        self.assertEqual(len(pending), 2)
+        for message in pending:
+            self.assertEqual(message["platform"], "youtube")
+            self.assertEqual(message["user__username"], "viewer2")
+            self.assertEqual(message["text"], "hello from youtube")
+        self.assertFalse(self.service.pending)
+
+    def test_flush_persists_ingested_messages(self):
+        self._poll(times=2)
+        chat_buffer.flush_session(str(self.session.session_uuid))
+        rows = list(self.session.chat_messages.order_by("id"))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(len({row.external_id for row in rows}), 4)
+        self.assertTrue(all(row.user_id is None for row in rows))
+        self.assertEqual({row.author_name for row in rows}, {"viewer2"})
+        self.assertEqual({row.platform for row in rows}, {"youtube"})
+
+    def test_rate_limiter_waits_once_the_burst_is_spent(self):
+        limiter = RateLimiter(rate=2, burst=2)
+        clock, sleeps = [0.0], []
+
+        async def sleep(seconds):
+            sleeps.append(seconds)
+            clock[0] += seconds
+
+        async def acquire(times):
+            loop = asyncio.get_running_loop()
+            with mock.patch.object(loop, "time", lambda: clock[0]), mock.patch(
+                "streaming.chat_ingest.asyncio.sleep", sleep
+            ):
+                for _ in range(times):
+                    await limiter.acquire()
+
+        async_to_sync(acquire)(3)
+        self.assertEqual(sleeps, [0.5])
+        clock[0] += 10
+        sleeps.clear()
+        async_to_sync(acquire)(2)
+        self.assertEqual(sleeps, [])
+
+
+class ReactionHubTests(TestCase):
+    key = "reactions:test"
+
+    def _run(self, steps):
+        """Run `steps(hub, tick)` against an in-memory Redis."""
+        hub = ReactionHub()
+
+        async def run():
+            hub._redis = fakeredis.aioredis.FakeRedis()
+            totals = defaultdict(int)
+
+            async def tick(watched, now):
+                with mock.patch("streaming.reactions._bucket", return_value=now):
+                    frame, bucket = await hub._tick(self.key, totals, watched)
+                return json.loads(frame[len(b"data: ") :]), bucket
+
+            await steps(hub, tick)
+            return totals
+
+        return async_to_sync(run)()
+
+    def test_slow_tick_folds_every_completed_bucket(self):
+        async def steps(hub, tick):
+            for bucket in (100, 101, 102, 103):
+                await hub._redis.hincrby(self.key, f"{bucket}:heart", 1)
+            payload, bucket = await tick(100, 103)
+            self.assertEqual(bucket, 103)
+            self.assertEqual(payload["current"], {"heart": 1})
+            self.assertEqual(payload["previous"], {"heart": 1})
+            self.assertEqual(payload["totals"], {"heart": 4})
+
+        self.assertEqual(self._run(steps), {"heart": 3})
+
+    def test_failed_tick_does_not_fold_twice(self):
+        async def steps(hub, tick):
+            await hub._redis.hincrby(self.key, "100:like", 2)
+            hmget = hub._redis.hmget
+            calls = []
+
+            async def flaky_hmget(key, fields):
+                # The completed bucket is read, then reading the current fails.
+                calls.append(fields)
+                if len(calls) > 1:
+                    raise ConnectionError
+                return await hmget(key, fields)
+
+            with mock.patch.object(hub._redis, "hmget", flaky_hmget):
+                with self.assertRaises(ConnectionError):
+                    await tick(100, 101)
+            payload, _ = await tick(100, 101)
+            self.assertEqual(payload["totals"], {"like": 2})
+
+        self.assertEqual(self._run(steps), {"like": 2})
+
+    def test_long_stall_scans_the_hash(self):
+        async def steps(hub, tick):
+            await hub._redis.hincrby(self.key, "5:wow", 1)
+            await hub._redis.hincrby(self.key, "500:wow", 3)
+            await hub._redis.hincrby(self.key, "1000:wow", 5)
+            await tick(10, 1000)
+
+        self.assertEqual(self._run(steps), {"wow": 3})
+
+
+class TimeSeriesTests(TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        for patcher in (
+            mock.patch(
+                "streaming.timeseries.get_redis_connection", return_value=self.redis
+            ),
+            mock.patch("streaming.timeseries._record_script", None),
+            # Four 1 s slots per string, so a few samples cross strings.
+            mock.patch("streaming.timeseries.STREAM_METRICS_CHUNK", 4),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.series = TimeSeries("test", ("kbps", "fps"), [(1, 10), (10, 6)])
+        # On every chunk boundary, and ahead of the clock so nothing expires.
+        self.base = (int(time.time()) // 100 + 1) * 100
+
+    def test_samples_in_one_bucket_are_averaged(self):
+        self.series.record({"kbps": 1000, "fps": 30}, ts=self.base)
+        self.series.record({"kbps": 2000}, ts=self.base)
+        result = self.series.read(self.base, self.base, step=1)
+        self.assertEqual(list(result["timestamps"]), [self.base])
+        self.assertEqual(list(result["kbps"]), [1500])
+        self.assertEqual(list(result["fps"]), [15])
+
+    def test_window_spans_chunk_strings(self):
+        for offset in range(10):
+            self.series.record({"kbps": offset}, ts=self.base + offset)
+        keys = sorted(key.decode() for key in self.redis.keys("metrics:test:1:*"))
+        chunk = self.base // 4
+        self.assertEqual(keys, [f"metrics:test:1:{chunk + i}" for i in range(3)])
+        # A string holds only its own span of slots.
+        slot_size = struct.calcsize(">II2i")
+        self.assertLessEqual(max(self.redis.strlen(key) for key in keys), 4 * slot_size)
+        self.assertGreater(self.redis.ttl(keys[0]), 0)
+
+        result = self.series.read(self.base + 2, self.base + 9, step=1)
+        self.assertEqual(list(result["kbps"]), list(range(2, 10)))
+        self.assertEqual(result["timestamps"][0], self.base + 2)
+
+    def test_gaps_read_as_nan(self):
+        self.series.record({"kbps": 5}, ts=self.base + 1)
+        result = self.series.read(self.base, self.base + 5, step=1)
+        self.assertEqual(result["kbps"][1], 5)
+        self.assertTrue(
+            all(math.isnan(v) for i, v in enumerate(result["kbps"]) if i != 1)
+        )
+
+    def test_long_ranges_use_the_coarser_resolution(self):
+        for offset in range(0, 40, 5):
+            self.series.record({"kbps": offset}, ts=self.base + offset)
+        result = self.series.read(self.base, self.base + 39)
+        self.assertEqual(result["step"], 10)
+        self.assertEqual(list(result["kbps"]), [2.5, 12.5, 22.5, 32.5])
+
+    def test_read_many_returns_each_series(self):
+        other = TimeSeries("other", ("kbps",), [(1, 10)])
+        self.series.record({"kbps": 1}, ts=self.base)
+        other.record({"kbps": 2}, ts=self.base)
+        first, second = read_many([self.series, other], self.base, self.base, step=1)
+        self.assertEqual(list(first["kbps"]), [1])
+        self.assertEqual(list(second["kbps"]), [2])
+
+
+class StallClassificationTests(TestCase):
+    healthy_speed = [1.0] * 61
+
+    def _classify(self, bitrate, speed=None, age=300):
+        verdict = stall_detection.classify(bitrate, speed or self.healthy_speed, age)
+        return verdict and verdict[0]
+
+    def test_steady_relay_is_healthy(self):
+        self.assertIsNone(self._classify([3000] * 61))
+
+    def test_silent_only_once_the_window_has_passed(self):
+        self.assertEqual(self._classify([math.nan] * 61), "silent")
+        self.assertIsNone(self._classify([math.nan] * 61, age=30))
+
+    def test_zero_bitrate_is_a_stall(self):
+        bitrate = [3000] * 45 + [0] * 10 + [math.nan] + [0] * 5
+        self.assertEqual(self._classify(bitrate), "stall")
+
+    def test_young_relay_is_not_stalled(self):
+        self.assertIsNone(self._classify([math.nan] * 50 + [0] * 11, age=5))
+
+    def test_slow_encoder_is_throttled(self):
+        self.assertEqual(self._classify([3000] * 61, [0.5] * 61), "throttled")
+        self.assertIsNone(self._classify([3000] * 61, [1.0] * 50 + [0.5] * 11))
+
+    def test_bitrate_collapse_is_drift(self):
+        self.assertEqual(self._classify([3000] * 45 + [1000] * 16), "drift")
+
+    def test_small_dip_is_not_drift(self):
+        self.assertIsNone(self._classify([3000] * 45 + [2000] * 16))
+
+    def test_newest_bucket_is_ignored(self):
+        self.assertIsNone(self._classify([3000] * 60 + [0]))
+
+
+class RelayAnomalyTests(RedisTestCase):
+    redis_modules = (
+        "streaming.metrics",
+        "streaming.stall_detection",
+        "streaming.timeseries",
+    )
+
+    def test_restart_is_claimed_once_per_cooldown(self):
+        StreamingRelayStatus.objects.create(
+            session=self.session,
+            platform="youtube",
+            rtmp_url="rtmp://a.rtmp.youtube.com/live2/key",
+            status="success",
+        )
+        later = time.time() + stall_detection.RELAY_STALL_WINDOW * 2
+        (anomaly,) = stall_detection.find_relay_anomalies(now=later)
+        self.assertEqual(anomaly[0]["platform"], "youtube")
+        self.assertEqual(anomaly[1], "silent")
+        self.assertEqual(stall_detection.find_relay_anomalies(now=later + 1), [])
+
+
+@override_settings(SRS_SERVER_HOST="srs")
+class RelaySourceTests(RedisTestCase):
+    redis_modules = ("streaming.moderation",)
+
+    def setUp(self):
+        super().setUp()
+        self.account = StreamingPlatformAccount.objects.create(
+            user=self.user,
+            platform="youtube",
+            rtmp_url="rtmp://a.rtmp.youtube.com/live2",
+            stream_key="yt-key",
+            is_active=True,
+        )
+
+    def _restart(self, streams):
+        admitted = [{"account": self.account, "transcode_kbps": None, "queue": "q"}]
+        with mock.patch(
+            "streaming.stream_health.get_srs_streams", return_value=streams
+        ), mock.patch(
+            "streaming.tasks.admit_relays", return_value=(admitted, [])
+        ), mock.patch(
+            "streaming.tasks.group"
+        ) as group, mock.patch(
+            "streaming.tasks.metrics.inc"
+        ):
+            tasks.queue_relay_restarts([(self.session, self.account)], "manual")
+        (signature,) = group.call_args.args[0]
+        return signature.args[2]
+
+    def test_restart_uses_the_app_srs_reports(self):
+        key = self.configuration.stream_key
+        streams = [{"name": "other", "app": "live"}, {"name": key, "app": "studio"}]
+        self.assertEqual(self._restart(streams), f"rtmp://srs/studio/{key}")
+
+    def test_restart_falls_back_to_the_configured_app(self):
+        self.configuration.rtmp_url = "rtmp://ingest.example.com/show/"
+        self.configuration.save()
+        self.session.configuration = self.configuration
+        key = self.configuration.stream_key
+        self.assertEqual(self._restart(None), f"rtmp://srs/show/{key}")
+
+
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        for patcher in (
+            mock.patch(
+                "streaming.uploads.RECORDING_UPLOAD_DIR",
+                os.path.join(media_root, "uploads"),
+            ),
+            mock.patch("streaming.media_processing.enqueue"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.user = get_user_model().objects.create_user(
+            username="recorder", email="recorder@example.com", password="pw"
+        )
+        self.upload = uploads.start_upload(self.user, "take.webm")
+
+    def _append(self, index, data, sha256=None, length=None):
+        return uploads.append_chunk(
+            self.upload.upload_id,
+            self.user,
+            index,
+            io.BytesIO(data),
+            len(data) if length is None else length,
+            sha256 or hashlib.sha256(data).hexdigest(),
+        )
+
+    def _partial(self):
+        with open(uploads.partial_path(self.upload), "rb") as f:
+            return f.read()
+
+    def test_chunks_are_appended_in_order(self):
+        self._append(0, b"first ")
+        upload = self._append(1, b"second")
+        self.assertEqual((upload.chunks, upload.size), (2, 12))
+        self.assertEqual(self._partial(), b"first second")
+
+    def test_resent_chunk_is_acknowledged_without_reading(self):
+        self._append(0, b"first")
+        stream = mock.Mock()
+        upload = uploads.append_chunk(
+            self.upload.upload_id,
+            self.user,
+            0,
+            stream,
+            5,
+            hashlib.sha256(b"first").hexdigest(),
+        )
+        stream.read.assert_not_called()
+        self.assertEqual(upload.chunks, 1)
+        self.assertEqual(self._partial(), b"first")
+
+    def test_bad_checksum_cuts_the_file_back(self):
+        self._append(0, b"first")
+        with self.assertRaises(uploads.UploadError):
+            self._append(1, b"second", sha256="0" * 64)
+        self.assertEqual(self._partial(), b"first")
+        self.assertEqual(self._append(1, b"second").chunks, 2)
+
+    def test_short_body_is_rejected(self):
+        with self.assertRaises(uploads.UploadError):
+            self._append(0, b"short", length=10)
+        self.assertEqual(self._partial(), b"")
+
+    def test_leftovers_of_an_interrupted_attempt_are_dropped(self):
+        self._append(0, b"first")
+        with open(uploads.partial_path(self.upload), "ab") as f:
+            f.write(b"half a chu")
+        self._append(1, b"second")
+        self.assertEqual(self._partial(), b"firstsecond")
+
+    def test_skipped_chunk_is_refused(self):
+        with self.assertRaises(uploads.UploadError) as raised:
+            self._append(1, b"second")
+        self.assertEqual(raised.exception.status, 409)
+
+    def test_finalized_upload_takes_no_more_chunks(self):
+        self._append(0, b"whole")
+        upload = uploads.finalize_upload(self.upload.upload_id, self.user)
+        self.assertEqual(upload.status, "complete")
+        with open(os.path.join(settings.MEDIA_ROOT, upload.file_path), "rb") as f:
+            self.assertEqual(f.read(), b"whole")
+        again = uploads.finalize_upload(self.upload.upload_id, self.user)
+        self.assertEqual(again.file_path, upload.file_path)
+        with self.assertRaises(uploads.UploadError) as raised:
+            self._append(1, b"late")
+        self.assertEqual(raised.exception.status, 409)
+
+
+class PendingRecordingTests(RedisTestCase):
+    redis_modules = ("streaming.moderation",)
+
+    def _recording(self, status, age):
+        session = StreamingSession.objects.create(configuration=self.configuration)
+        recording = Recording.objects.create(session=session, status=status)
+        Recording.objects.filter(pk=recording.pk).update(
+            updated_at=timezone.now() - timedelta(seconds=age)
+        )
+        return recording.pk
+
+    def test_abandoned_remux_is_picked_up_again(self):
+        timeout = recordings.RECORDING_PROCESSING_TIMEOUT
+        abandoned = self._recording("processing", timeout + 60)
+        running = self._recording("processing", 60)
+        idle = self._recording("recording", recordings.RECORDING_IDLE_TIMEOUT + 60)
+        self._recording("recording", 60)
+        self._recording("failed", timeout + 60)
+        self.assertEqual(
+            sorted(recordings.pending_recordings()), sorted([abandoned, idle])
+        )
+
+        self.assertIsNone(recordings.finalize_recording(running))
+        # Claimed again; with no segments it fails instead of staying stuck.
+        recording = recordings.finalize_recording(abandoned)
+        self.assertEqual(recording.status, "failed")
+
+
+class RelayPlacementTests(RedisTestCase):
+    redis_modules = (
+        "streaming.metrics",
+        "streaming.moderation",
+        "streaming.proc_accounting",
+        "streaming.stream_health",
+    )
+
+    def setUp(self):
+        super().setUp()
+        # SRS lists no streams; the declared bitrate is used.
+        self.redis.set(stream_health._SRS_STREAMS_KEY, "[]")
+
+    def _report(self, host, takes_relays):
+        self.redis.sadd("proc:hosts", host)
+        self.redis.set(
+            f"proc:host:{host}",
+            json.dumps(
+                {
+                    "cpu_count": 8,
+                    "busy_cores": 0.0,
+                    "memory_total": 16 << 30,
+                    "memory_available": 8 << 30,
+                    "sampled_at": time.time(),
+                }
+            ),
+        )
+        if takes_relays:
+            self.redis.set(f"proc:relay-host:{host}", 1)
+
+    def _admit(self):
+        account = StreamingPlatformAccount.objects.create(
+            user=self.user,
+            platform="youtube",
+            rtmp_url="rtmp://a.rtmp.youtube.com/live2",
+            stream_key="yt-key",
+            is_active=True,
+        )
+        (relay,), _ = admit_relays(self.session, [account])
+        return relay["queue"]
+
+    def test_relays_go_only_to_hosts_consuming_their_queue(self):
+        self._report("web", takes_relays=False)
+        self._report("media", takes_relays=False)
+        self._report("relays", takes_relays=True)
+        self.assertEqual(self._admit(), "relay_host_relays")
+
+    def test_platform_queue_without_a_relay_host(self):
+        self._report("media", takes_relays=False)
+        self.assertEqual(self._admit(), "relay_youtube")
+
+    def _worker_ready(self, *queues):
+        sender = mock.Mock()
+        sender.task_consumer.queues = [mock.Mock() for _ in queues]
+        for queue, name in zip(sender.task_consumer.queues, queues):
+            queue.name = name
+        with mock.patch.object(tasks.sampler, "take_relays") as take_relays:
+            tasks._start_proc_sampler(sender=sender)
+        return take_relays.called
+
+    def test_only_relay_workers_offer_their_host(self):
+        self.assertTrue(self._worker_ready("celery", relay_queue(HOST)))
+        self.assertFalse(self._worker_ready("media"))
+
+
+class OversizedUploadTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="uploader", email="uploader@example.com", password="pw"
+        )
+        self.client = Client(enforce_csrf_checks=True)
+        self.client.force_login(self.user)
+
+    def test_over_plan_limit_is_refused_before_the_csrf_check(self):
+        # The token is in the body, which is never read: the refusal must not
+        # turn into a CSRF failure.
+        response = self.client.post(
+            reverse("streaming:scheduled_video_create"),
+            {"title": "Too big"},
+            CONTENT_LENGTH=str(upload_limit(self.user) + 1),
+        )
+        self.assertEqual(response.status_code, 413)
+        self.assertIn("free plan", json.loads(response.content)["message"])
+
+    def test_anonymous_upload_is_refused(self):
+        response = Client().post(reverse("streaming:upload_recorded"), {})
+        self.assertEqual(response.status_code, 403)
+
+
+class RequestBodyLimitTests(TestCase):
+    def _call(self, headers, bodies, max_bytes=10):
+        sent, seen = [], []
+        messages = [
+            {"type": "http.request", "body": body, "more_body": i < len(bodies) - 1}
+            for i, body in enumerate(bodies)
+        ]
+
+        async def app(scope, receive, send):
+            while True:
+                message = await receive()
+                seen.append(message)
+                if message["type"] == "http.disconnect" or not message["more_body"]:
+                    return
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "headers": headers}
+        async_to_sync(RequestBodyLimit(app, max_bytes))(scope, receive, send)
+        return sent, seen
+
+    def test_content_length_over_limit_never_reaches_the_app(self):
+        sent, seen = self._call([(b"content-length", b"11")], [b"x" * 11])
+        self.assertEqual(sent[0]["status"], 413)
+        self.assertEqual(seen, [])
+
+    def test_body_without_length_is_cut_off_at_the_limit(self):
+        sent, seen = self._call([], [b"x" * 6, b"x" * 6, b"x" * 6])
+        self.assertEqual(sent[0]["status"], 413)
+        self.assertEqual(seen[-1], {"type": "http.disconnect"})
+        self.assertEqual(len(seen), 2)
+
+    def test_body_within_limit_passes(self):
+        sent, seen = self._call([(b"content-length", b"10")], [b"x" * 10])
+        self.assertEqual(sent, [])
+        self.assertEqual(seen[0]["body"], b"x" * 10)
+
+
+class ByteRangeTests(TestCase):
+    SIZE = 1000
+    ETAG = '"abc-3e8"'
+    MODIFIED = 1_700_000_000
+
+    def _range(self, header=None, if_range=None):
+        headers = {}
+        if header is not None:
+            headers["Range"] = header
+        if if_range is not None:
+            headers["If-Range"] = if_range
+        request = RequestFactory().get("/", headers=headers)
+        return byte_range(request, self.SIZE, self.ETAG, self.MODIFIED)
+
+    def test_whole_file_without_a_usable_range(self):
+        for header in (None, "", "bytes=-", "items=0-9", "bytes=0-9,20-29"):
+            self.assertIsNone(self._range(header), header)
+
+    def test_single_ranges(self):
+        self.assertEqual(self._range("bytes=0-99"), (0, 99))
+        self.assertEqual(self._range("bytes = 10 - 19"), (10, 19))
+        self.assertEqual(self._range("bytes=900-"), (900, 999))
+        # Past the end is clamped; a suffix longer than the file is all of it.
+        self.assertEqual(self._range("bytes=990-5000"), (990, 999))
+        self.assertEqual(self._range("bytes=-100"), (900, 999))
+        self.assertEqual(self._range("bytes=-5000"), (0, 999))
+
+    def test_unsatisfiable_ranges(self):
+        for header in ("bytes=1000-", "bytes=1000-1200", "bytes=50-10", "bytes=-0"):
+            self.assertIs(self._range(header), False, header)
+
+    def test_if_range(self):
+        self.assertEqual(self._range("bytes=0-9", self.ETAG), (0, 9))
+        self.assertEqual(self._range("bytes=0-9", http_date(self.MODIFIED)), (0, 9))
+        self.assertIsNone(self._range("bytes=0-9", '"stale"'))
+
+    def test_range_file_stops_at_the_end_of_the_range(self):
+        path = os.path.join(tempfile.mkdtemp(), "clip.bin")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        with open(path, "wb") as f:
+            f.write(bytes(range(256)))
+
+        ranged = RangeFile(open(path, "rb"), 10, 20)
+        self.addCleanup(ranged.close)
+        self.assertEqual(ranged.read(5), bytes(range(10, 15)))
+        self.assertEqual(ranged.read(), bytes(range(15, 30)))
+        self.assertEqual(ranged.read(), b"")
+
+        async def collect():
+            blocks = RangeFile(open(path, "rb"), 250, 100)
+            try:
+                return b"".join([block async for block in blocks])
+            finally:
+                blocks.close()
+
+        with mock.patch("streaming.media_serving.MEDIA_BLOCK_SIZE", 4):
+            self.assertEqual(async_to_sync(collect)(), bytes(range(250, 256)))
@@ -0,0 +1,215 @@
+import math
+import struct
+import time
+from array import array
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+# (step seconds, slots) per resolution: how far back each step is kept.
+# Defaults: 1 s for 10 min, 10 s for 6 h and 1 min for 7 days.
+STREAM_METRICS_RESOLUTIONS = getattr(
+    settings,
+    "STREAM_METRICS_RESOLUTIONS",
+    [(1, 600), (10, 2160), (60, 10080)],
+)
+# Each resolution is stored as a run of Redis strings of fixed-size slots, one
+# string per this many seconds (or per ring, if shorter). A string holds only
+# the slots from the start of its own span, so a short session costs a few KB,
+# and expires once its span has fallen out of the resolution's window.
+STREAM_METRICS_CHUNK = getattr(settings, "STREAM_METRICS_CHUNK", 3600)
+# Values are kept as fixed-point integers with this many steps per unit.
+STREAM_METRICS_SCALE = 100
+
+SESSION_FIELDS = ("kbps_in", "kbps_out", "fps", "clients")
+RELAY_FIELDS = ("bitrate", "fps", "speed")
+
+# Slot layout: u32 bucket number, u32 sample count, then one i32 sum per field.
+# A slot whose bucket number is not the one being written is stale and reset.
+_RECORD_SCRIPT = """
+local ts = tonumber(ARGV[1])
+local n = tonumber(ARGV[2])
+local nres = #KEYS
+local bits = 64 + 32 * n
+for r = 1, nres do
+    local step = tonumber(ARGV[2 + 3 * r - 2])
+    local chunk = tonumber(ARGV[2 + 3 * r - 1])
+    local expire_at = tonumber(ARGV[2 + 3 * r])
+    local bucket = math.floor(ts / step)
+    local base = (bucket % chunk) * bits
+    local key = KEYS[r]
+    local current = redis.call('BITFIELD', key, 'GET', 'u32', base)[1]
+    local args = {key, 'OVERFLOW', 'SAT'}
+    local op = 'INCRBY'
+    if current ~= bucket then
+        op = 'SET'
+        for _, v in ipairs({'SET', 'u32', base, bucket}) do table.insert(args, v) end
+    end
+    for _, v in ipairs({op, 'u32', base + 32, 1}) do table.insert(args, v) end
+    for i = 1, n do
+        local value = ARGV[2 + 3 * nres + i]
+        for _, v in ipairs({op, 'i32', base + 32 + 32 * i, value}) do
+            table.insert(args, v)
+        end
+    end
+    redis.call('BITFIELD', unpack(args))
+    redis.call('EXPIREAT', key, expire_at)
+end
+return nres
+"""
+
+_record_script = None
+
+
+def _get_record_script(conn):
+    global _record_script
+    if _record_script is None:
+        _record_script = conn.register_script(_RECORD_SCRIPT)
+    return _record_script
+
+
+def _chunk_slots(step, slots):
+    """How many slots of a resolution one Redis string holds."""
+    return max(1, min(slots, STREAM_METRICS_CHUNK // step))
+
+
+class TimeSeries:
+    """
+    Multi-resolution metric history for one session or relay, stored in Redis
+    strings of fixed-size slots. Every sample is folded into each resolution's
+    current slot, so reading an hour of data at 10 s steps costs a GETRANGE
+    or two, not a scan.
+    """
+
+    def __init__(self, name, fields, resolutions=None):
+        self.name = name
+        self.fields = tuple(fields)
+        self.resolutions = sorted(resolutions or STREAM_METRICS_RESOLUTIONS)
+        self._slot = struct.Struct(f">II{len(self.fields)}i")
+
+    def _key(self, step, chunk):
+        return f"metrics:{self.name}:{step}:{chunk}"
+
+    def record(self, values, ts=None, pipe=None):
+        """
+        Add one sample (a dict keyed by field; missing fields count as 0).
+        Pass a pipeline to batch many series into one round trip.
+        """
+        conn = get_redis_connection("default")
+        ts = int(ts if ts is not None else time.time())
+        args, keys = [ts, len(self.fields)], []
+        for step, slots in self.resolutions:
+            chunk_slots = _chunk_slots(step, slots)
+            chunk = ts // step // chunk_slots
+            keys.append(self._key(step, chunk))
+            # Kept until the last slot of the string leaves the window.
+            args.extend((step, chunk_slots, ((chunk + 1) * chunk_slots + slots) * step))
+        for field in self.fields:
+            value = values.get(field)
+            args.append(int(round((value or 0) * STREAM_METRICS_SCALE)))
+        _get_record_script(conn)(
+            keys=keys,
+            args=args,
+            client=pipe or conn,
+        )
+
+    def resolution_for(self, start, end=None):
+        """The finest (step, slots) whose window still reaches back to `start`."""
+        end = end or time.time()
+        for step, slots in self.resolutions:
+            if end - start <= step * slots:
+                return step, slots
+        return self.resolutions[-1]
+
+    def read(self, start, end=None, step=None):
+        """
+        Return the samples between two Unix timestamps as arrays: a
+        "timestamps" array('d') of bucket start times plus one array('d') of
+        per-bucket means for each field, with NaN where nothing was recorded.
+        """
+        return read_many([self], start, end, step)[0]
+
+    def _window(self, start, end, step):
+        if step is None:
+            step, slots = self.resolution_for(start, end)
+        else:
+            slots = dict(self.resolutions)[step]
+        last = int(end // step)
+        first = max(int(start // step), last - slots + 1)
+        return step, slots, first, last - first + 1
+
+    def _chunks(self, window):
+        """(key, first slot, slot count) of each string a window spans."""
+        step, slots, first, count = window
+        chunk_slots = _chunk_slots(step, slots)
+        bucket, end = first, first + count
+        while bucket < end:
+            chunk, offset = divmod(bucket, chunk_slots)
+            length = min(end - bucket, chunk_slots - offset)
+            yield self._key(step, chunk), offset, length
+            bucket += length
+
+    def _queue_reads(self, pipe, window):
+        """Queue the GETRANGEs for a window; returns how many were queued."""
+        size = self._slot.size
+        queued = 0
+        for key, offset, length in self._chunks(window):
+            pipe.getrange(key, offset * size, (offset + length) * size - 1)
+            queued += 1
+        return queued
+
+    def _decode(self, pieces, window):
+        step, slots, first, count = window
+        result = {"timestamps": array("d"), "step": step}
+        for field in self.fields:
+            result[field] = array("d")
+        if count <= 0:
+            return result
+
+        size = self._slot.size
+        # Slots past the end of a string were never written; pad them out.
+        raw = b"".join(
+            piece.ljust(length * size, b"\0")
+            for piece, (_, _, length) in zip(pieces, self._chunks(window))
+        )
+
+        nan = math.nan
+        scale = STREAM_METRICS_SCALE
+        for offset, (bucket, samples, *sums) in zip(
+            range(count), self._slot.iter_unpack(raw)
+        ):
+            expected = first + offset
+            result["timestamps"].append(expected * step)
+            fresh = bucket == expected and samples
+            for field, total in zip(self.fields, sums):
+                result[field].append(total / samples / scale if fresh else nan)
+        return result
+
+
+def read_many(series_list, start, end=None, step=None):
+    """
+    Read the same time range from many series in one Redis round trip.
+    Returns one result per series, in the same shape as TimeSeries.read().
+    """
+    end = end or time.time()
+    windows = [series._window(start, end, step) for series in series_list]
+    pipe = get_redis_connection("default").pipeline(transaction=False)
+    counts = [
+        series._queue_reads(pipe, window)
+        for series, window in zip(series_list, windows)
+    ]
+    pieces = pipe.execute() if any(counts) else []
+
+    results, position = [], 0
+    for series, window, count in zip(series_list, windows, counts):
+        results.append(series._decode(pieces[position : position + count], window))
+        position += count
+    return results
+
+
+def session_series(session_uuid):
+    return TimeSeries(f"session:{session_uuid}", SESSION_FIELDS)
+
+
+def relay_series(session_uuid, platform):
+    return TimeSeries(f"relay:{session_uuid}:{platform}", RELAY_FIELDS)
@@ -0,0 +1,265 @@
+import hashlib
+import os
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import (
+    FileUploadHandler,
+    StopFutureHandlers,
+    StopUpload,
+)
+from django.http import JsonResponse
+
+from .admission import plan_limits
+
+
+def upload_limit(user):
+    """The largest file the user's plan may upload, in bytes; None if unlimited."""
+    megabytes = plan_limits(user).get("upload_mb")
+    return megabytes * 1024 * 1024 if megabytes else None
+
+
+def _too_large(user, max_bytes):
+    return (
+        f"The {user.subscription_plan} plan allows uploads of "
+        f"at most {max_bytes // (1024 * 1024)} MB"
+    )
+
+
+class StoredUploadedFile(UploadedFile):
+    """
+    A file StorageUploadHandler has already written to default storage as
+    `stored_name`; save that name rather than the file, which is closed.
+    """
+
+    def __init__(self, stored_name, size, sha256, content_type, charset, extra):
+        super().__init__(
+            None, os.path.basename(stored_name), content_type, size, charset, extra
+        )
+        self.stored_name = stored_name
+        self.sha256 = sha256
+
+    def discard(self):
+        default_storage.delete(self.stored_name)
+
+
+class StorageUploadHandler(FileUploadHandler):
+    """
+    Write each uploaded file straight to its final place in default storage,
+    computing its size and SHA-256 as the chunks go by, instead of spooling it
+    to a temporary file for the view to copy into storage afterwards.
+
+    `upload_to(filename)` returns the storage name to use. Requests whose
+    Content-Length is already over the owner's plan limit are refused by
+    StreamingUploadMiddleware before anything parses them; a file that grows
+    past the limit (a body sent without a length) is deleted and the rest of
+    the request is not read, and upload_rejection() says why.
+    """
+
+    def __init__(self, request, upload_to):
+        super().__init__(request)
+        self.upload_to = upload_to
+        self.max_bytes = None
+        self.error = None
+        # Not `file`: Django closes a handler's `file` when an upload stops.
+        self.destination = None
+        self.stored = []
+
+    def handle_raw_input(
+        self, input_data, META, content_length, boundary, encoding=None
+    ):
+        # StreamingUploadMiddleware has already refused anonymous uploads and
+        # ones whose Content-Length is over the limit.
+        self.max_bytes = upload_limit(self.request.user)
+        return None
+
+    def _open(self, name):
+        """Create `name` in storage for writing, never over an existing file."""
+        try:
+            default_storage.path(name)
+        except NotImplementedError:
+            name = default_storage.get_available_name(name)
+            return name, default_storage.open(name, "wb")
+        while True:
+            name = default_storage.get_available_name(name)
+            path = default_storage.path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                return name, open(path, "xb")
+            except FileExistsError:
+                # Taken between the check and the open; pick another.
+                continue
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.stored_name, self.destination = self._open(self.upload_to(self.file_name))
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.max_bytes and self.size > self.max_bytes:
+            self.error = _too_large(self.request.user, self.max_bytes)
+            self._discard_partial()
+            raise StopUpload(connection_reset=True)
+        self.sha256.update(raw_data)
+        self.destination.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        self.destination.close()
+        self.destination = None
+        uploaded = StoredUploadedFile(
+            self.stored_name,
+            file_size,
+            self.sha256.hexdigest(),
+            self.content_type,
+            self.charset,
+            self.content_type_extra,
+        )
+        self.stored.append(uploaded)
+        return uploaded
+
+    def upload_interrupted(self):
+        self._discard_partial()
+
+    def _discard_partial(self):
+        if self.destination is None:
+            return
+        self.destination.close()
+        self.destination = None
+        default_storage.delete(self.stored_name)
+
+    def cleanup(self, keep):
+        """
+        Delete a file the request left half written and, unless `keep`, the
+        files it stored completely too.
+        """
+        self._discard_partial()
+        if not keep:
+            for uploaded in self.stored:
+                uploaded.discard()
+            self.stored = []
+
+
+def stream_uploads_to(upload_to):
+    """
+    Mark a view whose uploaded files StreamingUploadMiddleware should write
+    straight to storage, named by `upload_to(filename)`. Uploaded files then
+    arrive as StoredUploadedFile.
+    """
+
+    def decorator(view_func):
+        view_func.stream_uploads_to = upload_to
+        return view_func
+
+    return decorator
+
+
+def upload_rejection(request):
+    """Why the request's upload was refused, or None."""
+    request.FILES  # The handlers only know once the body has been parsed.
+    for handler in request.upload_handlers:
+        if isinstance(handler, StorageUploadHandler) and handler.error:
+            return handler.error
+    return None
+
+
+def _early_rejection(request):
+    """
+    (reason, status) if an upload can be refused from its headers alone,
+    else None.
+    """
+    if not request.user.is_authenticated:
+        return "Log in to upload", 403
+    max_bytes = upload_limit(request.user)
+    try:
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        return None
+    if max_bytes and length > max_bytes:
+        return _too_large(request.user, max_bytes), 413
+    return None
+
+
+class StreamingUploadMiddleware:
+    """
+    Install StorageUploadHandler for views marked with stream_uploads_to().
+    Must come before CsrfViewMiddleware, which reads the body to check the
+    token: an upload refused from its headers is answered with 413 here,
+    before the body (and the CSRF token in it) is parsed. After the response,
+    files are kept only if it succeeded.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        for handler in getattr(request, "_upload_handlers", ()):
+            if isinstance(handler, StorageUploadHandler):
+                handler.cleanup(keep=response.status_code < 400)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        upload_to = getattr(view_func, "stream_uploads_to", None)
+        if upload_to is None or request.method not in ("POST", "PUT"):
+            return None
+        rejected = _early_rejection(request)
+        if rejected:
+            message, status = rejected
+            return JsonResponse({"status": "error", "message": message}, status=status)
+        request.upload_handlers.insert(0, StorageUploadHandler(request, upload_to))
+        return None
+
+
+class RequestBodyLimit:
+    """
+    ASGI middleware answering 413 to request bodies over `max_bytes` before
+    the application reads them. Django's ASGI handler spools the whole body
+    before any middleware, view or upload handler runs, so per-plan limits
+    only apply once it has arrived; this bounds what a client can make the
+    server spool. Bodies sent without a Content-Length are cut off once they
+    pass the limit.
+    """
+
+    def __init__(self, app, max_bytes):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.max_bytes:
+            return await self.app(scope, receive, send)
+        length = dict(scope["headers"]).get(b"content-length")
+        if length and length.isdigit() and int(length) > self.max_bytes:
+            await self._reject(send)
+            return None
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    await self._reject(send)
+                    # Django stops reading and sends nothing on a disconnect.
+                    return {"type": "http.disconnect"}
+            return message
+
+        return await self.app(scope, limited_receive, send)
+
+    async def _reject(self, send):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 413,
+                "headers": [
+                    (b"content-type", b"text/plain; charset=utf-8"),
+                    (b"connection", b"close"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": b"Request body too large"})
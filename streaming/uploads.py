@@ -0,0 +1,195 @@
+import hashlib
+import logging
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from .models import RecordingUpload
+from .upload_handlers import upload_limit
+
+logger = logging.getLogger(__name__)
+
+# Partial uploads live here until finalized; keep it on the same filesystem as
+# MEDIA_ROOT so finalizing is a rename.
+RECORDING_UPLOAD_DIR = getattr(
+    settings, "RECORDING_UPLOAD_DIR", os.path.join(settings.MEDIA_ROOT, "uploads")
+)
+RECORDING_UPLOAD_MAX_CHUNK = getattr(
+    settings, "RECORDING_UPLOAD_MAX_CHUNK", 16 * 1024 * 1024
+)
+# Open uploads untouched for this long are deleted.
+RECORDING_UPLOAD_EXPIRY = getattr(settings, "RECORDING_UPLOAD_EXPIRY", 24 * 3600)
+# A live upload (appended to while recording) that stops receiving chunks for
+# this long is taken to be a recorder that went away, and finalized with what
+# arrived.
+RECORDING_UPLOAD_LIVE_IDLE = getattr(settings, "RECORDING_UPLOAD_LIVE_IDLE", 600)
+
+_COPY_BLOCK = 64 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def partial_path(upload):
+    return os.path.join(RECORDING_UPLOAD_DIR, f"{upload.upload_id}.part")
+
+
+def start_upload(user, filename, session=None, live=False):
+    name = get_valid_filename(os.path.basename(filename or "")) or "recording.webm"
+    upload = RecordingUpload.objects.create(
+        user=user, session=session, filename=name[:255], live=live
+    )
+    os.makedirs(RECORDING_UPLOAD_DIR, exist_ok=True)
+    open(partial_path(upload), "wb").close()
+    return upload
+
+
+def _locked(upload_id, user):
+    upload = (
+        RecordingUpload.objects.select_for_update()
+        .filter(upload_id=upload_id, user=user)
+        .first()
+    )
+    if upload is None:
+        raise UploadError("Upload not found", status=404)
+    return upload
+
+
+def append_chunk(upload_id, user, index, stream, length, sha256):
+    """
+    Append chunk number `index` of `length` bytes, read from `stream` a block
+    at a time, to the upload's partial file. The chunk is kept only if its
+    SHA-256 matches `sha256` (hex); otherwise the file is cut back to where it
+    was. A chunk already received is acknowledged without being read again,
+    so a client that lost the response can simply resend it.
+    """
+    if length is None or length <= 0:
+        raise UploadError("Chunk needs a Content-Length")
+    if length > RECORDING_UPLOAD_MAX_CHUNK:
+        raise UploadError(
+            f"Chunks may be at most {RECORDING_UPLOAD_MAX_CHUNK} bytes", status=413
+        )
+    if not sha256:
+        raise UploadError("Chunk needs an X-Chunk-SHA256 checksum")
+
+    with transaction.atomic():
+        upload = _locked(upload_id, user)
+        if upload.status != "open":
+            raise UploadError("Upload already finalized", status=409)
+        if index < upload.chunks:
+            return upload
+        if index > upload.chunks:
+            raise UploadError(f"Expected chunk {upload.chunks}", status=409)
+        limit = upload_limit(user)
+        if limit and upload.size + length > limit:
+            raise UploadError(
+                f"The {user.subscription_plan} plan allows uploads of at most "
+                f"{limit // (1024 * 1024)} MB",
+                status=413,
+            )
+
+        digest = hashlib.sha256()
+        received = 0
+        with open(partial_path(upload), "r+b") as f:
+            # Drop whatever an interrupted earlier attempt left past the end.
+            f.truncate(upload.size)
+            f.seek(upload.size)
+            while received < length:
+                block = stream.read(min(_COPY_BLOCK, length - received))
+                if not block:
+                    break
+                digest.update(block)
+                f.write(block)
+                received += len(block)
+            if received != length or digest.hexdigest() != sha256.lower():
+                f.truncate(upload.size)
+                raise UploadError("Chunk is incomplete or fails its checksum")
+
+        upload.size += length
+        upload.chunks += 1
+        upload.save(update_fields=["size", "chunks", "updated_at"])
+    return upload
+
+
+def store_file(source, name):
+    """
+    Move the finished file at `source` into storage as `name`: a rename when
+    storage is the local filesystem, a block-by-block copy otherwise.
+    """
+    try:
+        target = default_storage.path(default_storage.get_available_name(name))
+    except NotImplementedError:
+        with open(source, "rb") as f:
+            stored = default_storage.save(name, File(f))
+        os.remove(source)
+        return stored
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(source, target)
+    return os.path.relpath(target, default_storage.location).replace(os.sep, "/")
+
+
+def finalize_upload(upload_id, user):
+    """Move the upload into recordings/. Finalizing twice is harmless."""
+    with transaction.atomic():
+        upload = _locked(upload_id, user)
+        if upload.status == "complete":
+            return upload
+        if not upload.size:
+            raise UploadError("Nothing was uploaded")
+        timestamp = int(upload.created_at.timestamp())
+        upload.file_path = store_file(
+            partial_path(upload), f"recordings/{timestamp}_{upload.filename}"
+        )
+        upload.status = "complete"
+        upload.save(update_fields=["file_path", "status", "updated_at"])
+        from .media_processing import enqueue
+
+        enqueue(upload.user, upload.file_path, size=upload.size)
+    return upload
+
+
+def finalize_idle_live_uploads():
+    """
+    Finalize live uploads that have had no chunk for RECORDING_UPLOAD_LIVE_IDLE,
+    so a recording whose tab was closed mid-stream keeps what was sent.
+    """
+    cutoff = timezone.now() - timedelta(seconds=RECORDING_UPLOAD_LIVE_IDLE)
+    idle = RecordingUpload.objects.filter(
+        status="open", live=True, size__gt=0, updated_at__lt=cutoff
+    ).select_related("user")
+    finalized = 0
+    for upload in idle:
+        try:
+            finalize_upload(upload.upload_id, upload.user)
+        except (UploadError, OSError) as e:
+            logger.warning("Could not finalize live upload %s: %s", upload.upload_id, e)
+            continue
+        finalized += 1
+    if finalized:
+        logger.info("Finalized %d idle live recording uploads", finalized)
+    return finalized
+
+
+def expire_uploads():
+    """Delete open uploads nobody has added to for RECORDING_UPLOAD_EXPIRY."""
+    finalize_idle_live_uploads()
+    cutoff = timezone.now() - timedelta(seconds=RECORDING_UPLOAD_EXPIRY)
+    stale = list(RecordingUpload.objects.filter(status="open", updated_at__lt=cutoff))
+    for upload in stale:
+        try:
+            os.remove(partial_path(upload))
+        except FileNotFoundError:
+            pass
+    RecordingUpload.objects.filter(pk__in=[u.pk for u in stale]).delete()
+    if stale:
+        logger.info("Expired %d abandoned recording uploads", len(stale))
+    return len(stale)
@@ -2,7 +2,13 @@ from django.urls import path
 from django.views.generic import TemplateView
 
 from streaming.views.local_studio import list_local_recordings, studio_local
-from streaming.views.srs_hooks import srs_on_publish, srs_on_unpublish
+from streaming.views.media_views import serve_media
+from streaming.views.srs_hooks import (
+    srs_on_dvr,
+    srs_on_hls,
+    srs_on_publish,
+    srs_on_unpublish,
+)
 from streaming.views.streaming_views import (
     StreamingConfigurationListView,
     StreamingConfigurationCreateView,
@@ -34,7 +40,15 @@ from streaming.views.scheduling_views import (
     ScheduledVideoDeleteView,
     publish_scheduled_video,
 )
-from streaming.views.chat_views import chat_room
+from streaming.views.chat_views import chat_events, chat_room, export_chat
+from streaming.views.health_views import health_events, session_metrics
+from streaming.views.reaction_views import reaction_events, send_reaction
+from streaming.views.upload_views import (
+    upload_chunk,
+    upload_finalize,
+    upload_start,
+    upload_status,
+)
 
 app_name = "streaming"
 
@@ -113,6 +127,38 @@ urlpatterns = [
     ),
     # Chat endpoints
     path("session/<int:session_id>/chat/", chat_room, name="session_chat"),
+    path(
+        "session/<uuid:session_uuid>/chat/events/",
+        chat_events,
+        name="chat_events",
+    ),
+    path(
+        "session/<uuid:session_uuid>/chat/export/",
+        export_chat,
+        name="export_chat",
+    ),
+    # Relay and stream health
+    path(
+        "session/<uuid:session_uuid>/health/events/",
+        health_events,
+        name="health_events",
+    ),
+    path(
+        "session/<uuid:session_uuid>/metrics/",
+        session_metrics,
+        name="session_metrics",
+    ),
+    # Live reactions
+    path(
+        "session/<uuid:session_uuid>/reactions/",
+        send_reaction,
+        name="send_reaction",
+    ),
+    path(
+        "session/<uuid:session_uuid>/reactions/events/",
+        reaction_events,
+        name="reaction_events",
+    ),
     path(
         "session/<int:session_id>/chat/send/",
         send_chat_message,
@@ -131,6 +177,21 @@ urlpatterns = [
     # Recording and additional live control endpoints
     path("record/local/", local_record_session, name="local_record_session"),
     path("record/upload/", upload_recorded, name="upload_recorded"),
+    # Access-checked media: recordings, their posters and sprites, videos
+    path("media/<path:path>", serve_media, name="serve_media"),
+    # Resumable uploads: start, then ordered chunk PUTs, then finalize
+    path("record/uploads/", upload_start, name="upload_start"),
+    path("record/uploads/<uuid:upload_id>/", upload_status, name="upload_status"),
+    path(
+        "record/uploads/<uuid:upload_id>/chunks/<int:index>/",
+        upload_chunk,
+        name="upload_chunk",
+    ),
+    path(
+        "record/uploads/<uuid:upload_id>/finalize/",
+        upload_finalize,
+        name="upload_finalize",
+    ),
     # path("session/<int:session_id>/stop_live/", stop_live, name="stop_live"),
     # path("session/<int:session_id>/stats/", stream_stats, name="stream_stats"),
     path(
@@ -146,6 +207,8 @@ urlpatterns = [
     path("stop-live/<int:session_id>/", end_streaming_session, name="stop_live"),
     path("api/srs/on_publish/", srs_on_publish, name="srs_on_publish"),
     path("api/srs/on_unpublish/", srs_on_unpublish, name="srs_on_unpublish"),
+    path("api/srs/on_dvr/", srs_on_dvr, name="srs_on_dvr"),
+    path("api/srs/on_hls/", srs_on_hls, name="srs_on_hls"),
     # **New Studio Endpoint:**
     path("studio/", studio_enter, name="studio"),
     path("console/", srs_console, name="srs_console"),
@@ -1,10 +1,19 @@
+import asyncio
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseForbidden
+from django.http import (
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    Http404,
+    StreamingHttpResponse,
+)
 from django.urls import reverse
-from django.utils import timezone
 from django import forms
 
+from streaming.chat_broadcast import hub
+from streaming.chat_buffer import append_message, read_messages
+from streaming.chat_export import EXPORT_FORMATS, export_chunks
 from streaming.forms import ChatMessageForm
 from streaming.models import ChatMessage, StreamingSession
 
@@ -19,24 +28,84 @@ def chat_room(request, session_id):
         StreamingSession, id=session_id, configuration__user=request.user
     )
 
-    # Get chat messages ordered by creation time.
-    chat_messages = session.chat_messages.all().order_by("created_at")
-
     form = ChatMessageForm()
     if request.method == "POST":
         form = ChatMessageForm(request.POST)
         if form.is_valid():
-            chat = form.save(commit=False)
-            chat.user = request.user
-            chat.streaming_session = session
-            chat.created_at = timezone.now()
-            chat.save()
+            # Buffered in Redis; persisted in batches by flush_chat_buffers.
+            append_message(session, request.user, form.cleaned_data["text"])
             # After posting, redirect to the same chat room to clear the form.
             return redirect(reverse("streaming:session_chat", args=[session_id]))
 
+    # Persisted history followed by the not-yet-flushed tail, in order.
+    chat_messages, _, _ = read_messages(session)
+
     context = {
         "session": session,
         "chat_messages": chat_messages,
         "form": form,
     }
     return render(request, "streaming/chat_room.html", context)
+
+
+@login_required
+async def chat_events(request, session_uuid):
+    """
+    Server-Sent Events stream of new chat messages for a session. Each event
+    carries a JSON list of messages published within one broadcast window.
+    Requires the ASGI server (streamlab.asgi).
+    """
+    user = await request.auser()
+    exists = await StreamingSession.objects.filter(
+        session_uuid=session_uuid, configuration__user=user
+    ).aexists()
+    if not exists:
+        raise Http404("Session not found")
+
+    async def event_stream():
+        queue = await hub.subscribe(session_uuid)
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+        finally:
+            await hub.unsubscribe(session_uuid, queue)
+
+    response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@login_required
+async def export_chat(request, session_uuid):
+    """
+    Download a session's full chat history as CSV (default) or NDJSON with
+    ?format=ndjson; add ?gzip=1 for a compressed file. Rows are streamed in
+    keyset pages, so memory stays flat however long the history is.
+    """
+    fmt = request.GET.get("format", "csv")
+    if fmt not in EXPORT_FORMATS:
+        return HttpResponseBadRequest("Unsupported export format")
+    compress = request.GET.get("gzip") in ("1", "true")
+
+    user = await request.auser()
+    session = await StreamingSession.objects.filter(
+        session_uuid=session_uuid, configuration__user=user
+    ).afirst()
+    if session is None:
+        raise Http404("Session not found")
+
+    filename = f"chat-{session.session_uuid}.{fmt}"
+    if compress:
+        filename += ".gz"
+    response = StreamingHttpResponse(
+        export_chunks(session, fmt, compress),
+        content_type="application/gzip" if compress else EXPORT_FORMATS[fmt],
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,115 @@
+import asyncio
+import hmac
+import math
+import time
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseForbidden,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET
+
+from streaming import metrics
+from streaming.models import StreamingSession
+from streaming.stream_health import hub
+from streaming.timeseries import relay_series, session_series
+
+
+@login_required
+async def health_events(request, session_uuid):
+    """
+    Server-Sent Events stream of a session's health: session status, relay
+    states, bitrate and frame rate. An event is sent whenever any of them
+    changes. Requires the ASGI server (streamlab.asgi).
+    """
+    user = await request.auser()
+    session = (
+        await StreamingSession.objects.filter(
+            session_uuid=session_uuid, configuration__user=user
+        )
+        .values("id", "configuration__stream_key")
+        .afirst()
+    )
+    if session is None:
+        raise Http404("Session not found")
+
+    async def event_stream():
+        queue = hub.subscribe(
+            session_uuid, session["id"], session["configuration__stream_key"]
+        )
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+        finally:
+            hub.unsubscribe(session_uuid, queue)
+
+    response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@login_required
+def session_metrics(request, session_uuid):
+    """
+    Metric history for a session, or one of its relays with ?platform=. The
+    window is ?seconds= back from now (default 600); the resolution is the
+    finest one that covers it.
+    """
+    session = get_object_or_404(
+        StreamingSession, session_uuid=session_uuid, configuration__user=request.user
+    )
+    try:
+        seconds = max(1, int(request.GET.get("seconds", 600)))
+    except ValueError:
+        return JsonResponse(
+            {"status": "error", "message": "Invalid seconds"}, status=400
+        )
+
+    platform = request.GET.get("platform")
+    if platform:
+        series = relay_series(session.session_uuid, platform)
+    else:
+        series = session_series(session.session_uuid)
+    now = time.time()
+    data = series.read(now - seconds, now)
+    return JsonResponse(
+        {
+            "status": "success",
+            "step": data["step"],
+            "timestamps": list(data["timestamps"]),
+            "series": {
+                field: [None if math.isnan(v) else round(v, 2) for v in data[field]]
+                for field in series.fields
+            },
+        }
+    )
+
+
+@require_GET
+def prometheus_metrics(request):
+    """
+    Prometheus scrape endpoint. Everything is read from Redis, so a scrape
+    never touches the database. Scrapers must send METRICS_TOKEN as a bearer
+    token; without one configured, only staff users can read the metrics.
+    """
+    token = getattr(settings, "METRICS_TOKEN", None)
+    supplied = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    allowed = (token and hmac.compare_digest(supplied.encode(), token.encode())) or (
+        request.user.is_authenticated and request.user.is_staff
+    )
+    if not allowed:
+        return HttpResponseForbidden("Invalid metrics token")
+    return HttpResponse(
+        metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
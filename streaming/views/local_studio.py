@@ -1,15 +1,19 @@
 # streaming/views/local_studio.py
 
 import uuid
-import os
-from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
 from django.http import JsonResponse, HttpResponseBadRequest 
 from django.utils import timezone
 from django.shortcuts import render, redirect, get_object_or_404
-from streaming.models import StreamingConfiguration, StreamingSession
+from streaming import media_processing
+from streaming.media_serving import media_url
+from streaming.models import (
+    ProcessedVideo,
+    RecordingUpload,
+    StreamingConfiguration,
+    StreamingSession,
+)
+from streaming.upload_handlers import stream_uploads_to, upload_rejection
 
 
 
@@ -41,44 +45,61 @@ def studio_local(request):
 @login_required
 def list_local_recordings(request):
     """
-    Returns JSON list of all files saved under MEDIA_ROOT/recordings/,
+    Returns JSON list of the user's files under MEDIA_ROOT/recordings/,
     so you can list previously recorded clips.
     """
     prefix = "recordings/"
-    try:
-        # default_storage.listdir returns (dirs, files)
-        _, files = default_storage.listdir(prefix)
-    except Exception:
-        files = []
+    # Only the user's own uploads; MEDIA_ROOT is not served publicly.
+    names = sorted(
+        set(
+            ProcessedVideo.objects.filter(
+                user=request.user, source_path__startswith=prefix
+            ).values_list("source_path", flat=True)
+        )
+        | set(
+            RecordingUpload.objects.filter(
+                user=request.user, status="complete"
+            ).values_list("file_path", flat=True)
+        )
+    )
 
     recordings = []
-    for fname in files:
-        # build a public URL: MEDIA_URL + recordings/<fname>
-        url = os.path.join(settings.MEDIA_URL, prefix, fname)
-        recordings.append({"name": fname, "url": url})
+    for name in names:
+        # served through the access-checked media view
+        recordings.append({"name": name[len(prefix):], "url": media_url(name)})
     return JsonResponse({"recordings": recordings})
 
 
+def _recording_name(filename):
+    return f"recordings/{int(timezone.now().timestamp())}_{filename}"
+
+
 @login_required
+@stream_uploads_to(_recording_name)
 def upload_recorded(request):
     """
     Called by the client after stopRecording() to POST the .webm blob.
-    Saves under MEDIA_ROOT/recordings/<timestamp>_<orig>.webm
+    Saved under MEDIA_ROOT/recordings/<timestamp>_<orig>.webm as the request
+    is read (see streaming/upload_handlers.py).
     """
     if request.method != "POST":
         return HttpResponseBadRequest("Only POST allowed")
 
+    rejected = upload_rejection(request)
+    if rejected:
+        return JsonResponse({"status": "error", "message": rejected}, status=413)
+
     video = request.FILES.get("video_file")
     if not video:
         return HttpResponseBadRequest("Missing 'video_file' upload")
 
-    timestamp = int(timezone.now().timestamp())
-    filename = f"recordings/{timestamp}_{video.name}"
-    file_path = default_storage.save(filename, ContentFile(video.read()))
-    url = default_storage.url(file_path)
+    file_path = video.stored_name
+    url = media_url(file_path)
+    media_processing.enqueue(request.user, file_path, video.sha256, video.size)
 
     return JsonResponse({
         "status": "success",
         "file_path": file_path,
         "url": url,
+        "sha256": video.sha256,
     })
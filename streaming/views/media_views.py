@@ -0,0 +1,86 @@
+import mimetypes
+import os
+
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import require_http_methods
+
+from streaming.media_serving import (
+    MEDIA_ACCEL_REDIRECT,
+    MEDIA_CACHE_MAX_AGE,
+    RangeFile,
+    accel_path,
+    byte_range,
+    file_validators,
+    may_read,
+)
+
+
+@login_required
+@require_http_methods(["GET", "HEAD"])
+def serve_media(request, path):
+    """
+    Serve a stored recording, poster or video the user owns. Conditional and
+    Range requests are answered; the bytes themselves are left to the proxy
+    (X-Accel-Redirect) when there is one, else streamed in blocks.
+    """
+    # Not found rather than forbidden, so others' file names cannot be probed.
+    if not may_read(request.user, path):
+        raise Http404("No such file")
+    try:
+        full_path = default_storage.path(path)
+        stat = os.stat(full_path)
+    except (SuspiciousFileOperation, NotImplementedError, FileNotFoundError):
+        raise Http404("No such file")
+
+    etag, last_modified = file_validators(stat)
+    content_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+
+    def headers(response):
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        response["Accept-Ranges"] = "bytes"
+        patch_cache_control(response, private=True, max_age=MEDIA_CACHE_MAX_AGE)
+        return response
+
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if not_modified is not None:
+        return headers(not_modified)
+
+    if MEDIA_ACCEL_REDIRECT:
+        # The proxy sends the file and answers Range requests itself.
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = accel_path(path)
+        return headers(response)
+
+    size = stat.st_size
+    selected = byte_range(request, size, etag, last_modified)
+    if selected is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return headers(response)
+    start, end = selected or (0, size - 1)
+    length = end - start + 1 if size else 0
+
+    if request.method == "HEAD":
+        response = HttpResponse(content_type=content_type)
+    else:
+        content = RangeFile(open(full_path, "rb"), start, length)
+        if isinstance(request, ASGIRequest):
+            # A FileResponse would be read whole into memory under ASGI.
+            response = StreamingHttpResponse(content, content_type=content_type)
+        else:
+            response = FileResponse(content, content_type=content_type)
+    if selected:
+        response.status_code = 206
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    # FileResponse guesses the length from the whole file.
+    response["Content-Length"] = length
+    return headers(response)
@@ -0,0 +1,57 @@
+import asyncio
+
+from django.contrib.auth.decorators import login_required
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_POST
+
+from streaming.models import StreamingSession
+from streaming.reactions import REACTION_CHOICES, add_reaction, hub
+
+
+@login_required
+@require_POST
+def send_reaction(request, session_uuid):
+    """
+    Count a live reaction (heart, clap, ...) for a session. Reactions only
+    touch a Redis counter; they are never stored as chat messages.
+    """
+    reaction = request.POST.get("reaction")
+    if reaction not in REACTION_CHOICES:
+        return JsonResponse(
+            {"status": "error", "message": "Unknown reaction"}, status=400
+        )
+
+    session = get_object_or_404(
+        StreamingSession, session_uuid=session_uuid, status__in=["live", "partial"]
+    )
+    add_reaction(session.session_uuid, reaction)
+    return JsonResponse({"status": "success"})
+
+
+@login_required
+async def reaction_events(request, session_uuid):
+    """
+    Server-Sent Events stream of aggregated reaction counts for a session,
+    pushed a few times per second. Requires the ASGI server (streamlab.asgi).
+    """
+    exists = await StreamingSession.objects.filter(session_uuid=session_uuid).aexists()
+    if not exists:
+        raise Http404("Session not found")
+
+    async def event_stream():
+        queue = hub.subscribe(session_uuid)
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+        finally:
+            hub.unsubscribe(session_uuid, queue)
+
+    response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
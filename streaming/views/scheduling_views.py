@@ -3,9 +3,42 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.shortcuts import redirect, get_object_or_404
 from django.urls import reverse_lazy
 from django.http import HttpResponseForbidden
+from django.utils.decorators import method_decorator
 
 from streaming.forms import ScheduledVideoForm
 from streaming.models import ScheduledVideo
+from streaming.upload_handlers import (
+    StoredUploadedFile,
+    stream_uploads_to,
+    upload_rejection,
+)
+
+
+def _scheduled_video_name(filename):
+    # Named as ScheduledVideo.video_file's upload_to would name it.
+    return ScheduledVideo._meta.get_field("video_file").generate_filename(
+        None, filename
+    )
+
+
+# The video is written to storage while the form is read, not copied there
+# from a temporary file on save. Views using this also need
+# stream_uploads_to(_scheduled_video_name) on dispatch.
+class StreamedVideoFormMixin:
+    def form_valid(self, form):
+        video = self.request.FILES.get("video_file")
+        if isinstance(video, StoredUploadedFile):
+            form.instance.video_file = video.stored_name
+        return super().form_valid(form)
+
+    def form_invalid(self, form):
+        rejected = upload_rejection(self.request)
+        if rejected:
+            form.add_error(None, rejected)
+        for video in self.request.FILES.getlist("video_file"):
+            if isinstance(video, StoredUploadedFile):
+                video.discard()
+        return super().form_invalid(form)
 
 
 # List all scheduled videos for the logged-in user.
@@ -19,7 +52,8 @@ class ScheduledVideoListView(LoginRequiredMixin, ListView):
 
 
 # Create a new scheduled video.
-class ScheduledVideoCreateView(LoginRequiredMixin, CreateView):
+@method_decorator(stream_uploads_to(_scheduled_video_name), name="dispatch")
+class ScheduledVideoCreateView(LoginRequiredMixin, StreamedVideoFormMixin, CreateView):
     model = ScheduledVideo
     form_class = ScheduledVideoForm
     template_name = "streaming/create_scheduled_video.html"
@@ -31,7 +65,8 @@ class ScheduledVideoCreateView(LoginRequiredMixin, CreateView):
 
 
 # Update an existing scheduled video.
-class ScheduledVideoUpdateView(LoginRequiredMixin, UpdateView):
+@method_decorator(stream_uploads_to(_scheduled_video_name), name="dispatch")
+class ScheduledVideoUpdateView(LoginRequiredMixin, StreamedVideoFormMixin, UpdateView):
     model = ScheduledVideo
     form_class = ScheduledVideoForm
     template_name = "streaming/update_scheduled_video.html"
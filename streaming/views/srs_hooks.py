@@ -1,9 +1,15 @@
 # streaming/views/srs_hooks.py
 import json
 import logging
+from datetime import timedelta
+
+from django.conf import settings
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import get_object_or_404, redirect
+from django.utils import timezone
+from streaming.metrics import timed
+from streaming.recordings import RecordingError, add_segment, local_segment_path
 from streaming.models import (
     StreamingConfiguration,
     StreamingSession,
@@ -14,16 +20,20 @@ from django.contrib.auth.decorators import login_required
 
 logger = logging.getLogger(__name__)
 
+# How long after go_live a publish is taken to belong to the session it made.
+GO_LIVE_PUBLISH_WINDOW = getattr(settings, "GO_LIVE_PUBLISH_WINDOW", 120)
+
 
 @csrf_exempt
+@timed("streamlab_srs_hook_duration_seconds", {"hook": "on_publish"})
 def srs_on_publish(request):
     """
     This view is called by SRS when a stream is published.
     It should:
       - Parse the incoming JSON (which includes the stream key and app)
       - Look up the active streaming configuration by stream key
-      - Create a new streaming session
-      - Trigger a background task to relay the stream to all connected social platforms
+      - Reuse the session go_live just created, or create a new one
+      - For a new session, trigger a background task to relay the stream to all connected social platforms
     """
     try:
         data = json.loads(request.body)
@@ -42,23 +52,35 @@ def srs_on_publish(request):
         logger.error("Stream key not found: %s", stream_key)
         return JsonResponse({"error": "Stream key not found."}, status=404)
 
-    # Create a new streaming session
-    session = StreamingSession.objects.create(configuration=config, status="live")
-
-    # Retrieve connected social accounts for the user
-    social_accounts = StreamingPlatformAccount.objects.filter(user=config.user)
+    # A studio that called go_live already has a session with its relays
+    # queued; publishing is just the second half of that start.
+    session = (
+        config.sessions.filter(
+            status__in=["starting", "live", "partial"],
+            session_end__isnull=True,
+            session_start__gte=timezone.now()
+            - timedelta(seconds=GO_LIVE_PUBLISH_WINDOW),
+        )
+        .order_by("-session_start")
+        .first()
+    )
+    if session is None:
+        session = StreamingSession.objects.create(configuration=config, status="live")
 
-    # For each connected social account with valid RTMP details, trigger a relay task
-    for account in social_accounts:
-        if account.rtmp_url and account.stream_key:
-            rtmp_target = f"{account.rtmp_url.rstrip('/')}/{account.stream_key}"
-            relay_to_social_task.delay(session.id, rtmp_target)
+        # One task relays to every connected account with valid RTMP details.
+        if StreamingPlatformAccount.objects.filter(
+            user=config.user, rtmp_url__isnull=False, stream_key__isnull=False
+        ).exists():
+            relay_to_social_task.delay(
+                session.id, f"rtmp://{settings.SRS_SERVER_HOST}/{app}/{stream_key}"
+            )
 
     logger.info("SRS on_publish processed for stream key: %s", stream_key)
     return JsonResponse({"status": "ok", "session_uuid": str(session.session_uuid)})
 
 
 @csrf_exempt
+@timed("streamlab_srs_hook_duration_seconds", {"hook": "on_unpublish"})
 def srs_on_unpublish(request):
     """
     This view is called by SRS when a stream ends.
@@ -79,11 +101,53 @@ def srs_on_unpublish(request):
         logger.error("Stream key not found on unpublish: %s", stream_key)
         return JsonResponse({"error": "Stream key not found."}, status=404)
 
-    # Mark the last live session for this config as ended
-    session = config.sessions.filter(status="live").last()
+    # Mark the last live (or partly relayed) session for this config as ended
+    session = config.sessions.filter(status__in=["live", "partial"]).last()
     if session:
-        session.status = "ended"
-        session.session_end = timezone.now()
-        session.save()
+        session.end_session()
         logger.info("Session %s marked as ended on unpublish.", session.session_uuid)
     return JsonResponse({"status": "ok"})
+
+
+def _record_segment(request, duration_key=None):
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Invalid JSON."}, status=400)
+
+    stream_key = data.get("stream")
+    # The segment may close after the session ended, so not only live ones.
+    session = (
+        StreamingSession.objects.filter(configuration__stream_key=stream_key)
+        .order_by("-session_start")
+        .first()
+    )
+    if session is None:
+        logger.error("No session for recorded stream key: %s", stream_key)
+        return JsonResponse({"error": "Stream key not found."}, status=404)
+
+    try:
+        path = local_segment_path(data.get("cwd"), data.get("file", ""))
+    except RecordingError as e:
+        logger.error("Recording segment rejected: %s", e)
+        return JsonResponse({"error": str(e)}, status=400)
+    duration = data.get(duration_key) if duration_key else None
+    add_segment(session, path, duration)
+    return JsonResponse({"status": "ok"})
+
+
+@csrf_exempt
+@timed("streamlab_srs_hook_duration_seconds", {"hook": "on_dvr"})
+def srs_on_dvr(request):
+    """
+    Called by SRS each time it closes a DVR segment; the segment is added to
+    the session's server-side recording.
+    """
+    return _record_segment(request)
+
+
+@csrf_exempt
+@timed("streamlab_srs_hook_duration_seconds", {"hook": "on_hls"})
+def srs_on_hls(request):
+    """Called by SRS for each HLS segment it writes, when recording from HLS."""
+    return _record_segment(request, duration_key="duration")
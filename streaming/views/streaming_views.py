@@ -1,6 +1,8 @@
+import asyncio
 import json
 import logging
 import subprocess
+import time
 from django.utils import timezone
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import JsonResponse
@@ -34,13 +36,15 @@ from streaming.forms import (
     SocialAccountForm,
     ChatMessageForm,
 )
+from streaming import media_processing, metrics, proc_accounting
+from streaming.chat_buffer import append_message, read_messages
 from streaming.srs_utils import (
     get_stream_stats,
     start_streaming_via_srs,
     stop_streaming_via_srs,
 )
+from streaming.upload_handlers import stream_uploads_to, upload_rejection
 from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
 
 logger = logging.getLogger(__name__)
 
@@ -124,12 +128,41 @@ async def offer(request):
                         ffmpeg_cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE
                     )
 
+                    # Label the ingest by configuration, not by the (secret)
+                    # stream key.
+                    config = (
+                        await StreamingConfiguration.objects.filter(
+                            stream_key=stream_key
+                        )
+                        .values("id", "user_id")
+                        .afirst()
+                    ) or {"id": None, "user_id": None}
+                    fps_labels = {"configuration": config["id"]}
+                    proc_accounting.track(
+                        ffmpeg_process,
+                        "ingest",
+                        {"configuration": config["id"], "user": config["user_id"]},
+                    )
+                    frames, window_start = 0, time.monotonic()
+
                     # Process video frames
                     while True:
                         try:
                             frame = await track.recv()
                             img = frame.to_ndarray(format="yuv420p")
                             ffmpeg_process.stdin.write(img.tobytes())
+
+                            frames += 1
+                            elapsed = time.monotonic() - window_start
+                            if elapsed >= 1:
+                                await asyncio.to_thread(
+                                    metrics.set_gauge,
+                                    "streamlab_webrtc_ingest_fps",
+                                    frames / elapsed,
+                                    fps_labels,
+                                    10,
+                                )
+                                frames, window_start = 0, time.monotonic()
                         except Exception as e:
                             logger.error(f"Frame processing error: {str(e)}")
                             ffmpeg_process.terminate()
@@ -374,9 +407,7 @@ def end_streaming_session(request, session_id):
             stop_streaming_via_srs("live", session.configuration.stream_key)
 
             # Update session status
-            session.status = "ended"
-            session.session_end = timezone.now()
-            session.save()
+            session.end_session()
 
             return redirect("streaming:session_detail", session_id=session.id)
 
@@ -499,24 +530,39 @@ def go_live(request, config_id, session_id=None):
 @login_required
 @csrf_exempt
 @require_POST
-def send_chat_message(request, session_id):
-    """Handle sending chat messages with validation"""
+def send_chat_message(request, session_id=None):
+    """
+    Buffer a chat message in the session's Redis stream and acknowledge it
+    right away; streaming.tasks.flush_chat_buffers persists it in batches.
+    """
     try:
+        if request.content_type == "application/json":
+            payload = json.loads(request.body or b"{}")
+        else:
+            payload = request.POST
+
+        if session_id is None:
+            lookup = {"session_uuid": payload.get("session_uuid")}
+        elif isinstance(session_id, int):
+            lookup = {"id": session_id}
+        else:
+            lookup = {"session_uuid": session_id}
+
         session = get_object_or_404(
-            StreamingSession, id=session_id, configuration__user=request.user
+            StreamingSession, configuration__user=request.user, **lookup
         )
 
-        form = ChatMessageForm(request.POST)
+        form = ChatMessageForm(payload)
         if not form.is_valid():
             return JsonResponse({"status": "error", "errors": form.errors}, status=400)
 
-        with transaction.atomic():
-            chat_message = form.save(commit=False)
-            chat_message.user = request.user
-            chat_message.streaming_session = session
-            chat_message.save()
-
-            return JsonResponse({"status": "success", "message_id": chat_message.id})
+        message_id = append_message(session, request.user, form.cleaned_data["text"])
+        if message_id is None:
+            return JsonResponse(
+                {"status": "error", "message": "Message blocked by chat moderation"},
+                status=400,
+            )
+        return JsonResponse({"status": "success", "message_id": message_id})
 
     except Exception as e:
         logger.error(f"Failed to send chat message: {str(e)}")
@@ -526,10 +572,13 @@ def send_chat_message(request, session_id):
 
 
 @login_required
-def fetch_chat_messages(request):
-    """Fetch chat messages for a session"""
+def fetch_chat_messages(request, session_id=None):
+    """
+    Fetch chat messages for a session. Pass the returned `cursor` back as
+    `after` to receive only newer messages, read straight from Redis.
+    """
     try:
-        session_uuid = request.GET.get("session_uuid")
+        session_uuid = session_id or request.GET.get("session_uuid")
         if not session_uuid:
             return JsonResponse(
                 {"status": "error", "message": "Session UUID is required"}, status=400
@@ -541,13 +590,25 @@ def fetch_chat_messages(request):
             configuration__user=request.user,
         )
 
-        messages_qs = (
-            session.chat_messages.all()
-            .order_by("created_at")
-            .values("user__username", "text", "created_at")
+        chat_messages, cursor, reset = read_messages(
+            session, after=request.GET.get("after")
         )
 
-        return JsonResponse({"status": "success", "messages": list(messages_qs)})
+        return JsonResponse(
+            {
+                "status": "success",
+                "messages": [
+                    {
+                        "user__username": message["user__username"],
+                        "text": message["text"],
+                        "created_at": message["created_at"],
+                    }
+                    for message in chat_messages
+                ],
+                "cursor": cursor,
+                "reset": reset,
+            }
+        )
 
     except Exception as e:
         logger.error(f"Failed to fetch chat messages: {str(e)}")
@@ -578,8 +639,13 @@ def local_record_session(request):
         return redirect("streaming:studio_enter")
 
 
+def _recording_name(filename):
+    return f"recordings/{timezone.now().timestamp()}_{filename}"
+
+
 @login_required
 @csrf_exempt
+@stream_uploads_to(_recording_name)
 def upload_recorded(request):
     try:
         if request.method != "POST":
@@ -588,17 +654,25 @@ def upload_recorded(request):
                 status=405,
             )
 
+        rejected = upload_rejection(request)
+        if rejected:
+            return JsonResponse({"status": "error", "message": rejected}, status=413)
+
         video_file = request.FILES.get("video_file")
         if not video_file:
             return JsonResponse(
                 {"status": "error", "message": "No video file provided"}, status=400
             )
 
-        # Save the file with a timestamp
-        filename = f"recordings/{timezone.now().timestamp()}_{video_file.name}"
-        file_path = default_storage.save(filename, ContentFile(video_file.read()))
+        # Already written to storage while the request was read.
+        file_path = video_file.stored_name
+        media_processing.enqueue(
+            request.user, file_path, video_file.sha256, video_file.size
+        )
 
-        return JsonResponse({"status": "success", "file_path": file_path})
+        return JsonResponse(
+            {"status": "success", "file_path": file_path, "sha256": video_file.sha256}
+        )
 
     except Exception as e:
         logger.error(f"Failed to upload recording: {str(e)}")
@@ -711,21 +785,20 @@ def relay_status(request, session_id):
             StreamingSession, id=session_id, configuration__user=request.user
         )
 
-        accounts = StreamingPlatformAccount.objects.filter(user=request.user).values(
+        relays = session.relay_statuses.order_by("platform").values(
             "id",
             "platform",
             "rtmp_url",
-            "stream_key",
-            "relay_status",
-            "relay_last_updated",
-            "relay_log",
+            "status",
+            "last_attempted",
+            "log_summary",
         )
 
         return JsonResponse(
             {
                 "status": "success",
                 "session_status": session.status,
-                "relays": list(accounts),
+                "relays": list(relays),
             }
         )
 
@@ -759,15 +832,14 @@ def restart_relay(request, account_id):
                 status=400,
             )
 
-        # Start the relay
-        from streaming.tasks import relay_to_single_social
+        # Start the relay, subject to the plan's limits and host capacity
+        from streaming.tasks import queue_relay_restarts
 
-        relay_to_single_social.delay(
-            session.id,
-            f"{account.rtmp_url.rstrip('/')}/{account.stream_key}",
-            f"rtmp://{settings.SRS_SERVER_HOST}/live/{session.configuration.stream_key}",
-            account.id,
-        )
+        refused = queue_relay_restarts([(session, account)], "manual")
+        if refused:
+            return JsonResponse(
+                {"status": "error", "message": refused[0][1]}, status=409
+            )
 
         return JsonResponse({"status": "success", "message": "Relay restart initiated"})
 
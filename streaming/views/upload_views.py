@@ -0,0 +1,100 @@
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views.decorators.http import require_http_methods, require_POST
+
+from streaming.media_serving import media_url
+from streaming.models import RecordingUpload, StreamingSession
+from streaming.uploads import (
+    RECORDING_UPLOAD_MAX_CHUNK,
+    UploadError,
+    append_chunk,
+    finalize_upload,
+    start_upload,
+)
+
+
+def _state(upload):
+    state = {
+        "status": "success",
+        "upload_id": str(upload.upload_id),
+        "upload_status": upload.status,
+        "offset": upload.size,
+        "next_chunk": upload.chunks,
+        "max_chunk_size": RECORDING_UPLOAD_MAX_CHUNK,
+        "url": reverse("streaming:upload_status", args=[upload.upload_id]),
+    }
+    if upload.file_path:
+        state["file_path"] = upload.file_path
+        state["file_url"] = media_url(upload.file_path)
+    return state
+
+
+def _error(e):
+    return JsonResponse({"status": "error", "message": str(e)}, status=e.status)
+
+
+@login_required
+@require_POST
+def upload_start(request):
+    """
+    Open a resumable recording upload. Then PUT its chunks in order to
+    <url>chunks/<n>/, each with an X-Chunk-SHA256 header, and POST
+    <url>finalize/. After an interruption, GET <url> tells where to resume.
+    Pass live=1 when chunks are sent while still recording: an upload left
+    idle is then finalized with what arrived instead of being discarded.
+    """
+    session = None
+    if request.POST.get("session_uuid"):
+        session = get_object_or_404(
+            StreamingSession,
+            session_uuid=request.POST["session_uuid"],
+            configuration__user=request.user,
+        )
+    upload = start_upload(
+        request.user,
+        request.POST.get("filename"),
+        session,
+        live=request.POST.get("live") in ("1", "true"),
+    )
+    return JsonResponse(_state(upload), status=201)
+
+
+@login_required
+@require_http_methods(["GET"])
+def upload_status(request, upload_id):
+    upload = get_object_or_404(RecordingUpload, upload_id=upload_id, user=request.user)
+    return JsonResponse(_state(upload))
+
+
+@login_required
+@require_http_methods(["PUT"])
+def upload_chunk(request, upload_id, index):
+    try:
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        length = 0
+    try:
+        # The body is read from the request stream, never loaded whole.
+        upload = append_chunk(
+            upload_id,
+            request.user,
+            index,
+            request,
+            length,
+            request.headers.get("X-Chunk-SHA256"),
+        )
+    except UploadError as e:
+        return _error(e)
+    return JsonResponse(_state(upload))
+
+
+@login_required
+@require_POST
+def upload_finalize(request, upload_id):
+    try:
+        upload = finalize_upload(upload_id, request.user)
+    except UploadError as e:
+        return _error(e)
+    return JsonResponse(_state(upload))
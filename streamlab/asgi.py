@@ -13,4 +13,12 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "streamlab.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+from streaming.upload_handlers import RequestBodyLimit  # noqa: E402
+
+# Refuse oversized bodies before Django spools them (see RequestBodyLimit).
+application = RequestBodyLimit(
+    django_application, settings.REQUEST_BODY_MAX_MB * 1024 * 1024
+)
@@ -47,6 +47,8 @@ MIDDLEWARE = [
     "django.contrib.sessions.middleware.SessionMiddleware",
     "allauth.account.middleware.AccountMiddleware",  # <-- Required for allauth
     "django.middleware.common.CommonMiddleware",
+    # Before CsrfViewMiddleware, which parses upload bodies.
+    "streaming.upload_handlers.StreamingUploadMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
@@ -78,6 +80,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "dashboard.context_processors.fragment_cache",
             ],
         },
     },
@@ -160,6 +163,10 @@ STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
+# Internal nginx location aliasing MEDIA_ROOT (e.g. "/protected-media/"): the
+# media view then answers with X-Accel-Redirect and nginx sends the bytes
+# (see streaming/media_serving.py).
+MEDIA_ACCEL_REDIRECT = os.environ.get("MEDIA_ACCEL_REDIRECT")
 # DEFAULT_PROFILE_PICTURE = "default.png"
 
 # Default primary key field type
@@ -169,6 +176,10 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 SRS_SERVER_HOST = "localhost"  # or your SRS server domain/IP if different
 SRS_API_PORT = 1985
+# Where SRS writes DVR/HLS segments, as SRS sees it and as this app sees it
+# through a shared volume (see streaming/recordings.py).
+SRS_DVR_SRS_ROOT = os.environ.get("SRS_DVR_SRS_ROOT", "/usr/local/srs/objs/nginx/html")
+SRS_DVR_ROOT = os.environ.get("SRS_DVR_ROOT", SRS_DVR_SRS_ROOT)
 # settings.py
 CELERY_BROKER_URL = "redis://streamlab_redis:6379/0"
 CELERY_RESULT_BACKEND = "redis://streamlab_redis:6379/0"
@@ -179,6 +190,92 @@ CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 
+# Recording post-processing runs on its own worker (see docker-compose.yml),
+# so transcodes never hold up relays.
+CELERY_TASK_ROUTES = {
+    "streaming.tasks.process_video_task": {"queue": "media"},
+}
+
+CELERY_BEAT_SCHEDULE = {
+    # Persist buffered chat messages; the interval bounds how long an
+    # acknowledged message may live only in Redis.
+    "flush-chat-buffers": {
+        "task": "streaming.tasks.flush_chat_buffers",
+        "schedule": 1.0,
+    },
+    # One sweep over every live session: restart failed or stuck relays.
+    "monitor-stream-health": {
+        "task": "streaming.tasks.monitor_stream_health",
+        "schedule": 15.0,
+    },
+    # Restart only the relays whose bitrate or speed shows a stall.
+    "detect-relay-stalls": {
+        "task": "streaming.tasks.detect_relay_stalls",
+        "schedule": 5.0,
+    },
+    # Per-session metric history (see streaming/timeseries.py).
+    "sample-stream-metrics": {
+        "task": "streaming.tasks.sample_stream_metrics",
+        "schedule": 1.0,
+    },
+    # Abandoned resumable recording uploads (see streaming/uploads.py).
+    "expire-recording-uploads": {
+        "task": "streaming.tasks.expire_recording_uploads",
+        "schedule": 300.0,
+    },
+    # Recordings of sessions whose end was missed (see streaming/recordings.py).
+    "finalize-pending-recordings": {
+        "task": "streaming.tasks.finalize_pending_recordings",
+        "schedule": 600.0,
+    },
+    # Daily analytics rollups of ended sessions (see dashboard/analytics.py).
+    "rollup-stream-analytics": {
+        "task": "dashboard.tasks.rollup_stream_analytics",
+        "schedule": 300.0,
+    },
+}
+
+# Bearer token Prometheus must send to /metrics; unset, only staff can read it.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+# Limits per CustomUser.subscription_plan (see streaming/admission.py):
+# concurrent destinations, the highest bitrate relayed as is (kbps), how many
+# relays may transcode down to it, and the largest upload (MB).
+PLAN_LIMITS = {
+    "free": {
+        "destinations": 2,
+        "bitrate_kbps": 4500,
+        "transcodes": 0,
+        "upload_mb": 2048,
+    },
+    "basic": {
+        "destinations": 4,
+        "bitrate_kbps": 6000,
+        "transcodes": 1,
+        "upload_mb": 8192,
+    },
+    "pro": {
+        "destinations": 10,
+        "bitrate_kbps": 12000,
+        "transcodes": 4,
+        "upload_mb": 32768,
+    },
+}
+
+# Largest request body the ASGI server accepts (MB), before Django spools it:
+# the largest plan upload plus room for the rest of the form.
+REQUEST_BODY_MAX_MB = int(
+    os.environ.get(
+        "REQUEST_BODY_MAX_MB",
+        max(limits["upload_mb"] for limits in PLAN_LIMITS.values()) + 16,
+    )
+)
+
+# Write-behind chat buffer (see streaming/chat_buffer.py)
+CHAT_BUFFER_RETENTION = 300  # seconds flushed messages stay readable from Redis
+CHAT_BUFFER_BATCH_SIZE = 500
+CHAT_BUFFER_MAX_PENDING = 2000
+
 SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
 SECURE_SSL_REDIRECT = False
 SESSION_COOKIE_SECURE = True
@@ -5,6 +5,8 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic import TemplateView
 
+from streaming.views.health_views import prometheus_metrics
+
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -14,9 +16,10 @@ urlpatterns = [
     path("streaming/", include("streaming.urls", namespace="streaming")),
     path("logout/", LogoutView.as_view(next_page="login"), name="logout"),
     path("accounts/", include("allauth.urls")),
+    path("metrics", prometheus_metrics, name="metrics"),
 ]
 
-# Add static files support in development
+# Add static files support in development. Uploaded media is only served,
+# access-checked, by streaming:serve_media.
 if settings.DEBUG:
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)